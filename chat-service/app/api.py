@@ -1,25 +1,79 @@
 import uuid
-from typing import Annotated, List
-
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from datetime import datetime, timedelta, timezone
+from typing import Annotated, Optional
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Path,
+    Query,
+    Response,
+    UploadFile,
+    status,
+)
+from sqlalchemy import func
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import crud
 from app.database import get_db
-from app.dependencies import get_current_user_data
-from app.models import ChatMember, ChatType, MemberRole
+from app.dependencies import (
+    get_current_user_data,
+    get_public_read_db,
+    get_read_db,
+    get_write_db,
+    require_permission,
+)
+from app.etags import etag_matches, not_modified, set_etag, weak_etag
+from app.exceptions import AppException
+from app.metrics import metrics
+from app.models import ChatType, MemberRole
+from app.pagination import decode_cursor, encode_cursor
+from app.responses import RowJSONResponse
 from app.schemas import (
+    BatchMembershipCheck,
+    BatchMembershipCheckResponse,
+    BulkParticipantsResponse,
     ChannelCreate,
+    ChannelSearchPage,
+    ChatBatchRequest,
+    ChatBatchResponse,
+    ChatPage,
     ChatResponse,
-    ChatShortResponse,
     ChatUpdate,
     GroupCreate,
+    MemberPage,
     MembershipCheckResponse,
+    MessageCreate,
+    MessagePage,
+    MessageResponse,
+    MessageSearchPage,
+    MessageUpdate,
     ParticipantAdd,
+    ParticipantsBulk,
+    ReactionsResponse,
+    ReadStateResponse,
+    ReadUpTo,
     RoleUpdate,
+    ScheduledMessageCreate,
+    ScheduledMessageList,
+    ScheduledMessageResponse,
     TokenData,
 )
-from app.services.kafka_producer import KafkaProducerService, get_kafka_producer
+from app.services import bulk_membership
+from app.services.membership_cache import MembershipCache, get_membership_cache
+from app.services.message_cache import MessageTailCache, get_message_tail_cache
+from app.services.message_ingestor import MessageIngestor, get_message_ingestor
+from app.services.message_scheduler import MessageScheduler, get_message_scheduler
+from app.services.read_routing import (
+    PrimaryPins,
+    chat_pin,
+    get_primary_pins,
+    user_pin,
+)
+from app.services.read_state import ReadCursorStore, get_read_cursor_store
+from app.settings import Settings, get_settings
 
 router = APIRouter(prefix="/api/v1")
 
@@ -28,16 +82,11 @@ router = APIRouter(prefix="/api/v1")
 async def get_or_create_dm(
     target_user_id: uuid.UUID,
     current_user: Annotated[TokenData, Depends(get_current_user_data)],
-    db: Annotated[AsyncSession, Depends(get_db)],
-    kafka: Annotated[KafkaProducerService, Depends(get_kafka_producer)],
+    db: Annotated[AsyncSession, Depends(get_write_db)],
 ):
     if target_user_id == current_user.sub:
         raise HTTPException(status_code=400, detail="Cannot create DM with yourself")
     chat = await crud.get_or_create_dm(db, current_user.sub, target_user_id)
-
-    await kafka.publish_event(
-        "chat_created", {"chat_id": str(chat.id), "type": chat.type.value}
-    )
     return chat
 
 
@@ -45,17 +94,12 @@ async def get_or_create_dm(
 async def create_group(
     data: GroupCreate,
     current_user: Annotated[TokenData, Depends(get_current_user_data)],
-    db: Annotated[AsyncSession, Depends(get_db)],
-    kafka: Annotated[KafkaProducerService, Depends(get_kafka_producer)],
+    db: Annotated[AsyncSession, Depends(get_write_db)],
 ):
     settings = {"description": data.description, "is_public": False}
     chat = await crud.create_group_or_channel(
         db, current_user.sub, ChatType.GROUP, data.name, settings
     )
-
-    await kafka.publish_event(
-        "chat_created", {"chat_id": str(chat.id), "type": chat.type.value}
-    )
     return chat
 
 
@@ -63,67 +107,153 @@ async def create_group(
 async def create_channel(
     data: ChannelCreate,
     current_user: Annotated[TokenData, Depends(get_current_user_data)],
-    db: Annotated[AsyncSession, Depends(get_db)],
-    kafka: Annotated[KafkaProducerService, Depends(get_kafka_producer)],
+    db: Annotated[AsyncSession, Depends(get_write_db)],
 ):
     settings = {"description": data.description, "is_public": data.is_public}
     chat = await crud.create_group_or_channel(
         db, current_user.sub, ChatType.CHANNEL, data.name, settings
     )
-
-    await kafka.publish_event(
-        "chat_created", {"chat_id": str(chat.id), "type": chat.type.value}
-    )
     return chat
 
 
-@router.get("/chats", response_model=List[ChatShortResponse])
+@router.get("/chats", response_model=ChatPage)
 async def list_my_chats(
     current_user: Annotated[TokenData, Depends(get_current_user_data)],
-    db: Annotated[AsyncSession, Depends(get_db)],
+    db: Annotated[AsyncSession, Depends(get_read_db)],
+    read_cursors: Annotated[ReadCursorStore, Depends(get_read_cursor_store)],
+    limit: Annotated[int, Query(ge=1, le=200)] = 50,
+    cursor: Optional[str] = None,
+    if_none_match: Annotated[Optional[str], Header()] = None,
+):
+    after = decode_cursor(cursor, datetime.fromisoformat, uuid.UUID) if cursor else None
+    # Validated from versions alone, before the page is read: a 304 costs one
+    # index-only scan and one Redis call. The member keys follow the chats'
+    # activity within member_activity_interval; edits and deletions of
+    # messages show once their chat is active again or a cursor moves
+    version = await crud.get_inbox_version(db, current_user.sub)
+    read_version = await read_cursors.get_version(current_user.sub)
+    etag = None
+    if read_version is not None:
+        etag = weak_etag(
+            version.last_activity_at, version.chats, read_version, limit, cursor
+        )
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+
+    rows = await crud.get_user_chats(db, current_user.sub, limit + 1, after)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].last_activity_at, rows[-1].id)
+
+    read = await read_cursors.get_cursors(db, current_user.sub, [r.id for r in rows])
+    unread = {row.id: row.last_message_seq - read.get(row.id, 0) for row in rows}
+    deleted = await crud.count_deleted_after(
+        db, {chat_id: read.get(chat_id, 0) for chat_id, n in unread.items() if n > 0}
+    )
+    unread = {
+        chat_id: max(n - deleted.get(chat_id, 0), 0) for chat_id, n in unread.items()
+    }
+
+    items = [{**row._asdict(), "unread_count": unread[row.id]} for row in rows]
+    response = RowJSONResponse({"items": items, "next_cursor": next_cursor})
+    # Without the cursor version a match could hide moved cursors
+    if etag:
+        set_etag(response, etag)
+    return response
+
+
+@router.post("/chats/batch", response_model=ChatBatchResponse)
+async def get_chats_batch(
+    data: ChatBatchRequest,
+    current_user: Annotated[TokenData, Depends(get_current_user_data)],
+    db: Annotated[AsyncSession, Depends(get_read_db)],
 ):
-    return await crud.get_user_chats(db, current_user.sub)
+    chat_ids = list(dict.fromkeys(data.chat_ids))
+    rows = await crud.get_chats_metadata(
+        db, chat_ids, current_user.sub, data.member_only
+    )
+    # Request order; unknown and invisible chats are simply absent
+    by_id = {row.id: row for row in rows}
+    return RowJSONResponse({"items": [by_id[c] for c in chat_ids if c in by_id]})
 
 
 @router.get("/chats/{chat_id}", response_model=ChatResponse)
 async def get_chat_details(
     chat_id: uuid.UUID,
     current_user: Annotated[TokenData, Depends(get_current_user_data)],
-    db: Annotated[AsyncSession, Depends(get_db)],
+    db: Annotated[AsyncSession, Depends(get_read_db)],
+    response: Response,
+    if_none_match: Annotated[Optional[str], Header()] = None,
 ):
-    chat = await crud.get_chat_with_members(db, chat_id)
-    if not chat:
+    version = await crud.get_chat_version(db, chat_id, current_user.sub)
+    if not version:
         raise HTTPException(status_code=404)
-    if not any(m.user_id == current_user.sub for m in chat.members):
+    if not version.is_member:
         raise HTTPException(status_code=403, detail="Not a member")
+
+    etag = weak_etag(chat_id, version.updated_at, version.member_count)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    chat = await crud.get_chat(db, chat_id)
+    if not chat:
+        raise HTTPException(status_code=404)
+    set_etag(response, etag)
     return chat
 
 
+@router.get("/chats/{chat_id}/members", response_model=MemberPage)
+async def list_chat_members(
+    chat_id: uuid.UUID,
+    current_user: Annotated[TokenData, Depends(get_current_user_data)],
+    db: Annotated[AsyncSession, Depends(get_read_db)],
+    role: Optional[MemberRole] = None,
+    limit: Annotated[int, Query(ge=1, le=500)] = 100,
+    cursor: Optional[str] = None,
+):
+    if not await crud.get_member(db, chat_id, current_user.sub):
+        raise HTTPException(status_code=403, detail="Not a member")
+
+    after = decode_cursor(cursor, uuid.UUID)[0] if cursor else None
+    rows = await crud.get_chat_members(db, chat_id, limit + 1, after, role)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].user_id)
+    return RowJSONResponse({"items": rows, "next_cursor": next_cursor})
+
+
 @router.put("/chats/{chat_id}", response_model=ChatResponse)
 async def update_chat(
     chat_id: uuid.UUID,
     data: ChatUpdate,
     current_user: Annotated[TokenData, Depends(get_current_user_data)],
-    db: Annotated[AsyncSession, Depends(get_db)],
-    kafka: Annotated[KafkaProducerService, Depends(get_kafka_producer)],
+    db: Annotated[AsyncSession, Depends(get_write_db)],
 ):
     member = await crud.get_member(db, chat_id, current_user.sub)
     if not member or member.role not in [MemberRole.OWNER, MemberRole.ADMIN]:
         raise HTTPException(status_code=403, detail="Insufficient permissions")
 
-    chat = await crud.get_chat_with_members(db, chat_id)
+    chat = await crud.get_chat(db, chat_id)
     if not chat:
         raise HTTPException(status_code=404)
 
     if data.name:
         chat.name = data.name
+    # Reassign rather than mutate: in-place changes to a JSON column are not tracked
+    settings = dict(chat.settings)
     if data.description:
-        chat.settings["description"] = data.description
+        settings["description"] = chat.description = data.description
     if data.is_public is not None:
-        chat.settings["is_public"] = data.is_public
+        settings["is_public"] = data.is_public
+        chat.is_public = chat.type == ChatType.CHANNEL and data.is_public
+    chat.settings = settings
+    chat.last_activity_at = func.now()
+    await crud.queue_member_activity(db, chat_id)
 
+    crud.add_outbox_event(db, "chat_updated", {"chat_id": str(chat_id)})
     await db.commit()
-    await kafka.publish_event("chat_updated", {"chat_id": str(chat_id)})
     return chat
 
 
@@ -132,44 +262,105 @@ async def add_participant(
     chat_id: uuid.UUID,
     data: ParticipantAdd,
     current_user: Annotated[TokenData, Depends(get_current_user_data)],
-    db: Annotated[AsyncSession, Depends(get_db)],
-    kafka: Annotated[KafkaProducerService, Depends(get_kafka_producer)],
+    db: Annotated[AsyncSession, Depends(get_write_db)],
+    cache: Annotated[MembershipCache, Depends(get_membership_cache)],
 ):
     member = await crud.get_member(db, chat_id, current_user.sub)
     if not member or member.role not in [MemberRole.OWNER, MemberRole.ADMIN]:
         raise HTTPException(status_code=403)
 
-    new_member = ChatMember(
-        chat_id=chat_id, user_id=data.user_id, role=MemberRole.MEMBER
+    if not await crud.add_member(db, chat_id, data.user_id):
+        raise HTTPException(status_code=409, detail="Already a member")
+    crud.add_outbox_event(
+        db, "participant_added", {"chat_id": str(chat_id), "user_id": str(data.user_id)}
     )
-    db.add(new_member)
     await db.commit()
-
-    await kafka.publish_event(
-        "participant_added", {"chat_id": str(chat_id), "user_id": str(data.user_id)}
-    )
+    await cache.invalidate(chat_id, [data.user_id])
     return {"status": "added"}
 
 
+@router.post(
+    "/chats/{chat_id}/participants/bulk", response_model=BulkParticipantsResponse
+)
+async def bulk_update_participants(
+    chat_id: uuid.UUID,
+    data: ParticipantsBulk,
+    current_user: Annotated[TokenData, Depends(get_current_user_data)],
+    db: Annotated[AsyncSession, Depends(get_write_db)],
+    cache: Annotated[MembershipCache, Depends(get_membership_cache)],
+    settings: Annotated[Settings, Depends(get_settings)],
+):
+    member = await crud.get_member(db, chat_id, current_user.sub)
+    if not member or member.role not in [MemberRole.OWNER, MemberRole.ADMIN]:
+        raise HTTPException(status_code=403)
+
+    results = []
+    chunk = settings.bulk_participants_chunk
+    for user_ids, add in ((data.add, True), (data.remove, False)):
+        user_ids = list(dict.fromkeys(user_ids))
+        for i in range(0, len(user_ids), chunk):
+            results += await bulk_membership.apply_chunk(
+                db, cache, chat_id, user_ids[i : i + chunk], add
+            )
+    return {"results": results}
+
+
+@router.post(
+    "/chats/{chat_id}/participants/import", response_model=BulkParticipantsResponse
+)
+async def import_participants(
+    chat_id: uuid.UUID,
+    file: UploadFile,
+    current_user: Annotated[TokenData, Depends(get_current_user_data)],
+    db: Annotated[AsyncSession, Depends(get_write_db)],
+    cache: Annotated[MembershipCache, Depends(get_membership_cache)],
+    settings: Annotated[Settings, Depends(get_settings)],
+    remove: bool = False,
+):
+    member = await crud.get_member(db, chat_id, current_user.sub)
+    if not member or member.role not in [MemberRole.OWNER, MemberRole.ADMIN]:
+        raise HTTPException(status_code=403)
+
+    results, invalid, invalid_count = [], [], 0
+    async for user_ids, rejected, count in bulk_membership.iter_user_id_chunks(
+        file, settings.bulk_participants_chunk, settings.bulk_invalid_max
+    ):
+        invalid += rejected
+        invalid_count += count
+        if len(results) + len(user_ids) > settings.bulk_participants_max:
+            raise AppException(
+                f"Import is limited to {settings.bulk_participants_max} users",
+                code="IMPORT_TOO_LARGE",
+                status_code=413,
+                details={"processed": len(results)},
+            )
+        if user_ids:
+            results += await bulk_membership.apply_chunk(
+                db, cache, chat_id, user_ids, not remove
+            )
+    return {"results": results, "invalid": invalid, "invalid_count": invalid_count}
+
+
 @router.delete("/chats/{chat_id}/participants/{user_id}")
 async def remove_participant(
     chat_id: uuid.UUID,
     user_id: uuid.UUID,
     current_user: Annotated[TokenData, Depends(get_current_user_data)],
-    db: Annotated[AsyncSession, Depends(get_db)],
-    kafka: Annotated[KafkaProducerService, Depends(get_kafka_producer)],
+    db: Annotated[AsyncSession, Depends(get_write_db)],
+    cache: Annotated[MembershipCache, Depends(get_membership_cache)],
 ):
     member = await crud.get_member(db, chat_id, current_user.sub)
     if not member or member.role not in [MemberRole.OWNER, MemberRole.ADMIN]:
         raise HTTPException(status_code=403)
 
-    target = await crud.get_member(db, chat_id, user_id)
-    if target:
-        await db.delete(target)
-        await db.commit()
-        await kafka.publish_event(
-            "participant_removed", {"chat_id": str(chat_id), "user_id": str(user_id)}
+    if await crud.remove_member(db, chat_id, user_id):
+        crud.add_outbox_event(
+            db,
+            "participant_removed",
+            {"chat_id": str(chat_id), "user_id": str(user_id)},
         )
+        await db.commit()
+        await cache.invalidate(chat_id, [user_id])
 
     return status.HTTP_204_NO_CONTENT
 
@@ -180,8 +371,8 @@ async def update_role(
     user_id: uuid.UUID,
     data: RoleUpdate,
     current_user: Annotated[TokenData, Depends(get_current_user_data)],
-    db: Annotated[AsyncSession, Depends(get_db)],
-    kafka: Annotated[KafkaProducerService, Depends(get_kafka_producer)],
+    db: Annotated[AsyncSession, Depends(get_write_db)],
+    cache: Annotated[MembershipCache, Depends(get_membership_cache)],
 ):
     member = await crud.get_member(db, chat_id, current_user.sub)
     if not member or member.role != MemberRole.OWNER:
@@ -191,12 +382,13 @@ async def update_role(
     if not target:
         raise HTTPException(status_code=404)
     target.role = data.role
-    await db.commit()
-
-    await kafka.publish_event(
+    crud.add_outbox_event(
+        db,
         "role_updated",
         {"chat_id": str(chat_id), "user_id": str(user_id), "role": data.role.value},
     )
+    await db.commit()
+    await cache.invalidate(chat_id, [user_id])
     return {"status": "updated"}
 
 
@@ -204,8 +396,8 @@ async def update_role(
 async def leave_chat(
     chat_id: uuid.UUID,
     current_user: Annotated[TokenData, Depends(get_current_user_data)],
-    db: Annotated[AsyncSession, Depends(get_db)],
-    kafka: Annotated[KafkaProducerService, Depends(get_kafka_producer)],
+    db: Annotated[AsyncSession, Depends(get_write_db)],
+    cache: Annotated[MembershipCache, Depends(get_membership_cache)],
 ):
     target = await crud.get_member(db, chat_id, current_user.sub)
     if target:
@@ -214,45 +406,436 @@ async def leave_chat(
                 status_code=400,
                 detail="Owner cannot leave. Delete chat or transfer ownership.",
             )
-        await db.delete(target)
-        await db.commit()
-        await kafka.publish_event(
+        await crud.remove_member(db, chat_id, current_user.sub)
+        crud.add_outbox_event(
+            db,
             "participant_left",
             {"chat_id": str(chat_id), "user_id": str(current_user.sub)},
         )
+        await db.commit()
+        await cache.invalidate(chat_id, [current_user.sub])
     return {"status": "left"}
 
 
-@router.get("/channels/public/search", response_model=List[ChatShortResponse])
-async def search_channels(
-    query: Annotated[str, Query(..., min_length=3)],
+@router.post(
+    "/chats/{chat_id}/messages",
+    response_model=MessageResponse,
+    status_code=201,
+    dependencies=[Depends(require_permission(["chat.message.send"]))],
+)
+async def send_message(
+    chat_id: uuid.UUID,
+    data: MessageCreate,
+    current_user: Annotated[TokenData, Depends(get_current_user_data)],
+    db: Annotated[AsyncSession, Depends(get_read_db)],
+    cache: Annotated[MembershipCache, Depends(get_membership_cache)],
+    ingestor: Annotated[MessageIngestor, Depends(get_message_ingestor)],
+    pins: Annotated[PrimaryPins, Depends(get_primary_pins)],
+):
+    # Permission checks only: the ingestor writes through its own primary sessions
+    role = await cache.get_role(db, chat_id, current_user.sub)
+    if role is None:
+        raise HTTPException(status_code=403, detail="Not a member")
+    if role == MemberRole.MEMBER:
+        chat = await crud.get_chat(db, chat_id)
+        if chat and chat.type == ChatType.CHANNEL:
+            raise HTTPException(
+                status_code=403, detail="Only admins can post in channels"
+            )
+
+    # End the read transaction before waiting on the group commit
+    await db.commit()
+    # get_read_db does not pin: pin before the write, as get_write_db would
+    await pins.pin(user_pin(current_user.sub), chat_pin(chat_id))
+    message = await ingestor.submit(chat_id, current_user.sub, data.content)
+    if message is None:
+        raise HTTPException(status_code=404)
+    return message
+
+
+@router.post(
+    "/chats/{chat_id}/messages/scheduled",
+    response_model=ScheduledMessageResponse,
+    status_code=201,
+    dependencies=[Depends(require_permission(["chat.message.send"]))],
+)
+async def schedule_message(
+    chat_id: uuid.UUID,
+    data: ScheduledMessageCreate,
+    current_user: Annotated[TokenData, Depends(get_current_user_data)],
+    db: Annotated[AsyncSession, Depends(get_write_db)],
+    cache: Annotated[MembershipCache, Depends(get_membership_cache)],
+    scheduler: Annotated[MessageScheduler, Depends(get_message_scheduler)],
+    settings: Annotated[Settings, Depends(get_settings)],
+):
+    delay = (data.send_at - datetime.now(timezone.utc)).total_seconds()
+    if delay <= 0:
+        raise AppException("send_at must be in the future", code="INVALID_SEND_AT")
+    if delay > timedelta(days=settings.schedule_max_days).total_seconds():
+        raise AppException(
+            f"send_at must be within {settings.schedule_max_days} days",
+            code="INVALID_SEND_AT",
+        )
+
+    # Checked again when the message is posted: schedules of a sender who has
+    # left or been demoted by then are dropped
+    role = await cache.get_role(db, chat_id, current_user.sub)
+    if role is None:
+        raise HTTPException(status_code=403, detail="Not a member")
+    if role == MemberRole.MEMBER:
+        chat = await crud.get_chat(db, chat_id)
+        if chat and chat.type == ChatType.CHANNEL:
+            raise HTTPException(
+                status_code=403, detail="Only admins can post in channels"
+            )
+
+    scheduled = await crud.create_scheduled_message(
+        db, chat_id, current_user.sub, data.content, delay
+    )
+    await db.commit()
+    scheduler.notify(scheduled.id, delay)
+    return scheduled
+
+
+@router.get(
+    "/chats/{chat_id}/messages/scheduled",
+    response_model=ScheduledMessageList,
+    dependencies=[Depends(require_permission(["chat.message.send"]))],
+)
+async def list_scheduled_messages(
+    chat_id: uuid.UUID,
+    current_user: Annotated[TokenData, Depends(get_current_user_data)],
     db: Annotated[AsyncSession, Depends(get_db)],
 ):
-    return await crud.search_public_channels(db, query)
+    # Primary: a schedule is listed right after it is created or posted
+    items = await crud.get_scheduled_messages(db, chat_id, current_user.sub)
+    return {"items": items}
+
+
+@router.delete(
+    "/chats/{chat_id}/messages/scheduled/{schedule_id}",
+    status_code=204,
+    dependencies=[Depends(require_permission(["chat.message.send"]))],
+)
+async def cancel_scheduled_message(
+    chat_id: uuid.UUID,
+    schedule_id: uuid.UUID,
+    current_user: Annotated[TokenData, Depends(get_current_user_data)],
+    db: Annotated[AsyncSession, Depends(get_write_db)],
+):
+    # Fails once the message has been claimed: it is posted by then
+    if not await crud.cancel_scheduled_message(
+        db, chat_id, current_user.sub, schedule_id
+    ):
+        raise HTTPException(status_code=404)
+    await db.commit()
+
+
+@router.get(
+    "/chats/{chat_id}/messages",
+    response_model=MessagePage,
+    dependencies=[Depends(require_permission(["chat.message.view_history"]))],
+)
+async def get_message_history(
+    chat_id: uuid.UUID,
+    current_user: Annotated[TokenData, Depends(get_current_user_data)],
+    db: Annotated[AsyncSession, Depends(get_read_db)],
+    cache: Annotated[MembershipCache, Depends(get_membership_cache)],
+    tail_cache: Annotated[MessageTailCache, Depends(get_message_tail_cache)],
+    before: Annotated[Optional[int], Query(ge=1)] = None,
+    after: Annotated[Optional[int], Query(ge=0)] = None,
+    cursor: Optional[str] = None,
+    limit: Annotated[int, Query(ge=1, le=100)] = 50,
+):
+    if sum(p is not None for p in (before, after, cursor)) > 1:
+        raise HTTPException(
+            status_code=400, detail="Use one of before, after or cursor"
+        )
+    # A cursor also carries the created_at of its message: bounding the query
+    # by it skips the partitions on the far side
+    since = until = None
+    if cursor:
+        direction, seq, created_at = decode_cursor(
+            cursor, str, int, datetime.fromisoformat
+        )
+        if direction == "before":
+            before, until = seq, created_at + crud.MESSAGE_CLOCK_SKEW
+        elif direction == "after":
+            after, since = seq, created_at - crud.MESSAGE_CLOCK_SKEW
+        else:
+            raise AppException("Invalid cursor", code="INVALID_CURSOR")
+    if await cache.get_role(db, chat_id, current_user.sub) is None:
+        raise HTTPException(status_code=403, detail="Not a member")
+
+    rows = await tail_cache.page(db, chat_id, limit + 1, before, after, since, until)
+    has_more = len(rows) > limit
+    if has_more:
+        # The extra row is the one furthest from the cursor
+        rows = rows[:limit] if after is not None else rows[1:]
+
+    items = [row if isinstance(row, dict) else row._asdict() for row in rows]
+    next_cursor = None
+    if has_more:
+        edge = items[-1] if after is not None else items[0]
+        next_cursor = encode_cursor(
+            "after" if after is not None else "before", edge["seq"], edge["created_at"]
+        )
+    # Counts come with the rows; the caller's own reactions take one range
+    # scan, and only when the page has any reactions at all
+    if any(item.get("reactions") for item in items):
+        mine = await crud.get_my_reactions(
+            db, chat_id, current_user.sub, items[0]["seq"], items[-1]["seq"]
+        )
+        for item in items:
+            item["my_reactions"] = mine.get(item["seq"], [])
+    return {"items": items, "has_more": has_more, "next_cursor": next_cursor}
+
+
+@router.put(
+    "/chats/{chat_id}/messages/{seq}/reactions/{emoji}",
+    response_model=ReactionsResponse,
+    dependencies=[Depends(require_permission(["chat.message.send"]))],
+)
+async def add_reaction(
+    chat_id: uuid.UUID,
+    seq: int,
+    emoji: Annotated[str, Path(min_length=1, max_length=32)],
+    current_user: Annotated[TokenData, Depends(get_current_user_data)],
+    db: Annotated[AsyncSession, Depends(get_write_db)],
+    cache: Annotated[MembershipCache, Depends(get_membership_cache)],
+    tail_cache: Annotated[MessageTailCache, Depends(get_message_tail_cache)],
+    settings: Annotated[Settings, Depends(get_settings)],
+):
+    if await cache.get_role(db, chat_id, current_user.sub) is None:
+        raise HTTPException(status_code=403, detail="Not a member")
+    state = await crud.lock_reactions(db, chat_id, seq, current_user.sub)
+    if state is None:
+        raise HTTPException(status_code=404)
+    # Emojis are free text: bound how many a message and a user can pile up
+    counts, mine = state
+    if emoji not in mine and (
+        len(mine) >= settings.reactions_per_user_max
+        or (emoji not in counts and len(counts) >= settings.reactions_per_message_max)
+    ):
+        raise AppException(
+            "Too many different reactions on this message",
+            code="TOO_MANY_REACTIONS",
+            status_code=409,
+        )
+    reactions, version = await crud.add_reaction(
+        db, chat_id, seq, current_user.sub, emoji
+    )
+    await db.commit()
+    if version:
+        await tail_cache.set_reactions(chat_id, seq, reactions, version)
+    return {"chat_id": chat_id, "seq": seq, "reactions": reactions}
+
+
+@router.delete(
+    "/chats/{chat_id}/messages/{seq}/reactions/{emoji}",
+    response_model=ReactionsResponse,
+    dependencies=[Depends(require_permission(["chat.message.send"]))],
+)
+async def remove_reaction(
+    chat_id: uuid.UUID,
+    seq: int,
+    emoji: Annotated[str, Path(min_length=1, max_length=32)],
+    current_user: Annotated[TokenData, Depends(get_current_user_data)],
+    db: Annotated[AsyncSession, Depends(get_write_db)],
+    tail_cache: Annotated[MessageTailCache, Depends(get_message_tail_cache)],
+):
+    result = await crud.remove_reaction(db, chat_id, seq, current_user.sub, emoji)
+    if result is None:
+        raise HTTPException(status_code=404)
+    reactions, version = result
+    await db.commit()
+    if version:
+        await tail_cache.set_reactions(chat_id, seq, reactions, version)
+    return {"chat_id": chat_id, "seq": seq, "reactions": reactions}
+
+
+@router.post("/chats/{chat_id}/read", response_model=ReadStateResponse)
+async def mark_read(
+    chat_id: uuid.UUID,
+    data: ReadUpTo,
+    current_user: Annotated[TokenData, Depends(get_current_user_data)],
+    db: Annotated[AsyncSession, Depends(get_db)],
+    cache: Annotated[MembershipCache, Depends(get_membership_cache)],
+    read_cursors: Annotated[ReadCursorStore, Depends(get_read_cursor_store)],
+):
+    if await cache.get_role(db, chat_id, current_user.sub) is None:
+        raise HTTPException(status_code=403, detail="Not a member")
+    last_seq = await crud.get_last_message_seq(db, chat_id)
+    if last_seq is None:
+        raise HTTPException(status_code=404)
+
+    # Never past the end, or future messages would count as read
+    read_seq = await read_cursors.advance(
+        db, current_user.sub, chat_id, min(data.seq, last_seq)
+    )
+    unread = last_seq - read_seq
+    if unread > 0:
+        deleted = await crud.count_deleted_after(db, {chat_id: read_seq})
+        unread -= deleted.get(chat_id, 0)
+    return {
+        "chat_id": chat_id,
+        "last_read_seq": read_seq,
+        "unread_count": max(unread, 0),
+    }
+
+
+@router.patch(
+    "/chats/{chat_id}/messages/{seq}",
+    response_model=MessageResponse,
+    dependencies=[Depends(require_permission(["chat.message.send"]))],
+)
+async def edit_message(
+    chat_id: uuid.UUID,
+    seq: int,
+    data: MessageUpdate,
+    current_user: Annotated[TokenData, Depends(get_current_user_data)],
+    db: Annotated[AsyncSession, Depends(get_write_db)],
+    tail_cache: Annotated[MessageTailCache, Depends(get_message_tail_cache)],
+):
+    message = await crud.get_message(db, chat_id, seq)
+    if not message:
+        raise HTTPException(status_code=404)
+    if message.sender_id != current_user.sub:
+        raise HTTPException(status_code=403, detail="Only the sender can edit")
+
+    message = await crud.update_message(db, chat_id, seq, data.content)
+    await db.commit()
+    await tail_cache.invalidate(chat_id)
+    return message
+
+
+@router.delete(
+    "/chats/{chat_id}/messages/{seq}",
+    status_code=204,
+    dependencies=[Depends(require_permission(["chat.message.send"]))],
+)
+async def delete_message(
+    chat_id: uuid.UUID,
+    seq: int,
+    current_user: Annotated[TokenData, Depends(get_current_user_data)],
+    db: Annotated[AsyncSession, Depends(get_write_db)],
+    cache: Annotated[MembershipCache, Depends(get_membership_cache)],
+    tail_cache: Annotated[MessageTailCache, Depends(get_message_tail_cache)],
+):
+    message = await crud.get_message(db, chat_id, seq)
+    if not message:
+        raise HTTPException(status_code=404)
+    if message.sender_id != current_user.sub:
+        role = await cache.get_role(db, chat_id, current_user.sub)
+        if role not in [MemberRole.OWNER, MemberRole.ADMIN]:
+            raise HTTPException(status_code=403, detail="Insufficient permissions")
+
+    await crud.delete_message(db, chat_id, seq)
+    await db.commit()
+    await tail_cache.invalidate(chat_id)
+
+
+@router.get("/channels/public/search", response_model=ChannelSearchPage)
+async def search_channels(
+    query: Annotated[str, Query(..., min_length=3, max_length=200)],
+    db: Annotated[AsyncSession, Depends(get_public_read_db)],
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    cursor: Optional[str] = None,
+):
+    after = decode_cursor(cursor, float, uuid.UUID) if cursor else None
+    rows = await crud.search_public_channels(db, query, limit + 1, after)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].score, rows[-1].id)
+    return RowJSONResponse({"items": rows, "next_cursor": next_cursor})
+
+
+@router.get(
+    "/messages/search",
+    response_model=MessageSearchPage,
+    dependencies=[Depends(require_permission(["chat.message.view_history"]))],
+)
+async def search_messages(
+    query: Annotated[str, Query(..., min_length=3, max_length=200)],
+    current_user: Annotated[TokenData, Depends(get_current_user_data)],
+    db: Annotated[AsyncSession, Depends(get_read_db)],
+    chat_id: Optional[uuid.UUID] = None,
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    cursor: Optional[str] = None,
+):
+    after = (
+        decode_cursor(cursor, datetime.fromisoformat, uuid.UUID, int)
+        if cursor
+        else None
+    )
+    rows = await crud.search_messages(
+        db, current_user.sub, query, limit + 1, after, chat_id
+    )
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.created_at, last.chat_id, last.seq)
+    # Deleted messages the indexer has not caught up with still count for the
+    # cursor, so a page of them does not end the results early
+    items = [row for row in rows if row.highlight is not None]
+    return RowJSONResponse({"items": items, "next_cursor": next_cursor})
 
 
 @router.get(
     "/chats/{chat_id}/members/{user_id}/check", response_model=MembershipCheckResponse
 )
 async def internal_check(
-    chat_id: uuid.UUID, user_id: uuid.UUID, db: Annotated[AsyncSession, Depends(get_db)]
+    chat_id: uuid.UUID,
+    user_id: uuid.UUID,
+    db: Annotated[AsyncSession, Depends(get_public_read_db)],
+    cache: Annotated[MembershipCache, Depends(get_membership_cache)],
 ):
-    member = await crud.get_member(db, chat_id, user_id)
-    if not member:
+    role = await cache.get_role(db, chat_id, user_id)
+    if not role:
         return {"is_member": False}
-    return {"is_member": True, "role": member.role}
+    return {"is_member": True, "role": role}
+
+
+@router.post("/chats/members/check", response_model=BatchMembershipCheckResponse)
+async def internal_batch_check(
+    data: BatchMembershipCheck,
+    db: Annotated[AsyncSession, Depends(get_db)],
+    cache: Annotated[MembershipCache, Depends(get_membership_cache)],
+):
+    pairs = [(pair.chat_id, pair.user_id) for pair in data.pairs]
+    roles = await cache.lookup(db, pairs)
+    return {
+        "results": [
+            {
+                "chat_id": chat_id,
+                "user_id": user_id,
+                "is_member": roles[(chat_id, user_id)] is not None,
+                "role": roles[(chat_id, user_id)],
+            }
+            for chat_id, user_id in pairs
+        ]
+    }
 
 
 @router.delete("/chats/{chat_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_chat(
     chat_id: uuid.UUID,
     current_user: Annotated[TokenData, Depends(get_current_user_data)],
-    db: Annotated[AsyncSession, Depends(get_db)],
-    kafka: Annotated[KafkaProducerService, Depends(get_kafka_producer)],
+    db: Annotated[AsyncSession, Depends(get_write_db)],
+    cache: Annotated[MembershipCache, Depends(get_membership_cache)],
 ):
     member = await crud.get_member(db, chat_id, current_user.sub)
     if not member or member.role != MemberRole.OWNER:
         raise HTTPException(status_code=403, detail="Owner cannot leave")
     await crud.delete_chat(db, chat_id)
-    await kafka.publish_event("chat_deleted", {"chat_id": str(chat_id)})
+    await cache.invalidate_chat(chat_id)
     return
+
+
+@router.get(
+    "/metrics", dependencies=[Depends(require_permission(["system.metrics.monitor"]))]
+)
+async def get_metrics():
+    return metrics.snapshot()
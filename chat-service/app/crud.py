@@ -1,39 +1,103 @@
+import re
 import uuid
-from typing import List, Optional
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
 
-from sqlalchemy import and_, delete, func, or_, select
+from sqlalchemy import (
+    BigInteger,
+    Row,
+    String,
+    and_,
+    case,
+    cast,
+    delete,
+    exists,
+    func,
+    literal,
+    or_,
+    select,
+    true,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import JSONB, REGCONFIG, insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
-from app.models import Chat, ChatMember, ChatType, MemberRole
+from app.models import (
+    PREVIEW_LENGTH,
+    Chat,
+    ChatMember,
+    ChatPurge,
+    ChatType,
+    MemberActivityQueue,
+    MemberRole,
+    Message,
+    MessageReaction,
+    MessageSearchEntry,
+    MessageTombstone,
+    OutboxEvent,
+    ReadState,
+    ScheduledMessage,
+)
+
+# Must match the configuration of the Chat.search_vector expression
+SEARCH_CONFIG = "simple"
+SEARCH_MAX_TOKENS = 8
+# ts_headline copies the text it is given as is, so message search hits are
+# highlighted in HTML-escaped content, with the matches marked by private-use
+# characters stripped from it first, then swapped for <mark> tags
+HIGHLIGHT_START = "\ue000"
+HIGHLIGHT_STOP = "\ue001"
+SEARCH_HIGHLIGHT = (
+    f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, MinWords=10, MaxWords=30"
+)
+HTML_ESCAPES = (
+    ("&", "&amp;"),
+    ("<", "&lt;"),
+    (">", "&gt;"),
+    ('"', "&quot;"),
+    ("'", "&#x27;"),
+)
+# How far created_at can trail seq order within a chat: created_at is the start
+# of the inserting transaction, which may then wait for the chat row lock
+MESSAGE_CLOCK_SKEW = timedelta(minutes=5)
+
+
+def dm_pair_key(user_a: uuid.UUID, user_b: uuid.UUID) -> str:
+    low, high = sorted((user_a, user_b))
+    return f"{low.hex}:{high.hex}"
 
 
 async def get_or_create_dm(
     db: AsyncSession, user_a: uuid.UUID, user_b: uuid.UUID
 ) -> Chat:
-    stmt = (
-        select(Chat)
-        .join(ChatMember)
-        .where(Chat.type == ChatType.DM)
-        .where(ChatMember.user_id.in_([user_a, user_b]))
-        .group_by(Chat.id)
-        .having(func.count(ChatMember.user_id) == 2)
-    )
-    result = await db.execute(stmt)
-    existing = result.scalar_one_or_none()
+    dm_key = dm_pair_key(user_a, user_b)
 
-    if existing:
-        return await get_chat_with_members(db, existing.id)
+    existing_id = await db.scalar(select(Chat.id).where(Chat.dm_key == dm_key))
+    if existing_id:
+        return await get_chat_with_members(db, existing_id)
 
-    new_chat = Chat(type=ChatType.DM, settings={})
-    db.add(new_chat)
-    await db.flush()
+    stmt = (
+        insert(Chat)
+        .values(type=ChatType.DM, settings={}, dm_key=dm_key, member_count=2)
+        .on_conflict_do_nothing(index_elements=[Chat.dm_key])
+        .returning(Chat.id)
+    )
+    chat_id = await db.scalar(stmt)
+    if chat_id is None:
+        # A concurrent request created the same DM first
+        existing_id = await db.scalar(select(Chat.id).where(Chat.dm_key == dm_key))
+        return await get_chat_with_members(db, existing_id)
 
-    db.add(ChatMember(chat_id=new_chat.id, user_id=user_a, role=MemberRole.MEMBER))
-    db.add(ChatMember(chat_id=new_chat.id, user_id=user_b, role=MemberRole.MEMBER))
+    db.add(ChatMember(chat_id=chat_id, user_id=user_a, role=MemberRole.MEMBER))
+    db.add(ChatMember(chat_id=chat_id, user_id=user_b, role=MemberRole.MEMBER))
+    add_outbox_event(
+        db, "chat_created", {"chat_id": str(chat_id), "type": ChatType.DM.value}
+    )
 
     await db.commit()
-    return await get_chat_with_members(db, new_chat.id)
+    return await get_chat_with_members(db, chat_id)
 
 
 async def create_group_or_channel(
@@ -43,55 +107,1192 @@ async def create_group_or_channel(
     name: str,
     settings: dict,
 ) -> Chat:
-    new_chat = Chat(type=chat_type, name=name, settings=settings)
+    new_chat = Chat(
+        type=chat_type,
+        name=name,
+        settings=settings,
+        description=settings.get("description"),
+        # Only channels can be found through public search
+        is_public=chat_type == ChatType.CHANNEL and settings.get("is_public") is True,
+        member_count=1,
+    )
     db.add(new_chat)
     await db.flush()
 
     owner = ChatMember(chat_id=new_chat.id, user_id=creator_id, role=MemberRole.OWNER)
     db.add(owner)
+    add_outbox_event(
+        db, "chat_created", {"chat_id": str(new_chat.id), "type": new_chat.type.value}
+    )
 
+    chat_id = new_chat.id
     await db.commit()
-    return await get_chat_with_members(db, new_chat.id)
+    # new_chat is expired by the commit, reload by id
+    return await get_chat_with_members(db, chat_id)
+
+
+async def get_user_chats(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    limit: int = 50,
+    after: Optional[Tuple[datetime, uuid.UUID]] = None,
+) -> List[Row]:
+    """
+    One inbox page, most recently active first.
+
+    Walks ix_chat_members_user_activity backwards from `after`, the
+    (last_activity_at, id) of the last row of the previous page, and joins
+    each membership to its chat by primary key: a page reads `limit` index
+    entries however many chats the user is in. Selects only the columns the
+    inbox renders, so no ORM objects are built.
+    """
+    stmt = (
+        select(
+            Chat.id,
+            Chat.type,
+            Chat.name,
+            Chat.created_at,
+            ChatMember.last_activity_at,
+            Chat.last_message_seq,
+            Chat.last_message_preview,
+            Chat.last_message_sender_id,
+            Chat.last_message_at,
+        )
+        .select_from(ChatMember)
+        .join(Chat, Chat.id == ChatMember.chat_id)
+        .where(ChatMember.user_id == user_id, Chat.deleted_at.is_(None))
+    )
+    if after:
+        stmt = stmt.where(
+            tuple_(ChatMember.last_activity_at, ChatMember.chat_id) < tuple_(*after)
+        )
+    stmt = stmt.order_by(
+        ChatMember.last_activity_at.desc(), ChatMember.chat_id.desc()
+    ).limit(limit)
+
+    result = await db.execute(stmt)
+    return list(result.all())
+
+
+async def get_inbox_version(db: AsyncSession, user_id: uuid.UUID) -> Row:
+    """
+    The newest inbox key and the number of memberships of a user, in one
+    index-only scan of ix_chat_members_user_activity: any activity in one of
+    the user's chats, a chat joined, left or deleted changes one of the two,
+    once services.member_activity has caught up.
+    """
+    stmt = select(
+        func.max(ChatMember.last_activity_at).label("last_activity_at"),
+        func.count().label("chats"),
+    ).where(ChatMember.user_id == user_id)
+    result = await db.execute(stmt)
+    return result.one()
 
 
-async def get_user_chats(db: AsyncSession, user_id: uuid.UUID) -> List[Chat]:
+async def get_chats_metadata(
+    db: AsyncSession,
+    chat_ids: List[uuid.UUID],
+    user_id: uuid.UUID,
+    member_only: bool = False,
+) -> List[Row]:
+    """
+    Metadata and the caller's role for many chats in one query, in no
+    particular order. Chats the caller may not see are left out: non-members
+    only see public channels.
+    """
     stmt = (
-        select(Chat)
-        .join(ChatMember)
-        .where(ChatMember.user_id == user_id)
-        .order_by(Chat.created_at.desc())
+        select(
+            Chat.id,
+            Chat.type,
+            Chat.name,
+            Chat.description,
+            Chat.is_public,
+            Chat.member_count,
+            Chat.created_at,
+            Chat.last_activity_at,
+            Chat.last_message_seq,
+            ChatMember.role,
+        )
+        .outerjoin(
+            ChatMember,
+            and_(ChatMember.chat_id == Chat.id, ChatMember.user_id == user_id),
+        )
+        .where(Chat.id.in_(chat_ids), Chat.deleted_at.is_(None))
     )
+    if member_only:
+        stmt = stmt.where(ChatMember.role.is_not(None))
+    else:
+        stmt = stmt.where(or_(ChatMember.role.is_not(None), Chat.is_public))
     result = await db.execute(stmt)
-    return list(result.scalars().all())
+    return list(result.all())
+
+
+async def get_chat(db: AsyncSession, chat_id: uuid.UUID) -> Optional[Chat]:
+    return await db.scalar(
+        select(Chat).where(Chat.id == chat_id, Chat.deleted_at.is_(None))
+    )
+
+
+async def get_chat_version(
+    db: AsyncSession, chat_id: uuid.UUID, user_id: uuid.UUID
+) -> Optional[Row]:
+    """
+    (updated_at, member_count, is_member) of a chat: enough to answer a
+    conditional GET without loading it. updated_at moves on every write to
+    the chat row, member_count on every membership change.
+    """
+    is_member = (
+        exists()
+        .where(ChatMember.chat_id == Chat.id, ChatMember.user_id == user_id)
+        .label("is_member")
+    )
+    stmt = select(Chat.updated_at, Chat.member_count, is_member).where(
+        Chat.id == chat_id, Chat.deleted_at.is_(None)
+    )
+    result = await db.execute(stmt)
+    return result.one_or_none()
 
 
 async def get_chat_with_members(db: AsyncSession, chat_id: uuid.UUID) -> Optional[Chat]:
-    stmt = select(Chat).options(selectinload(Chat.members)).where(Chat.id == chat_id)
+    stmt = (
+        select(Chat)
+        .options(selectinload(Chat.members))
+        .where(Chat.id == chat_id, Chat.deleted_at.is_(None))
+    )
     result = await db.execute(stmt)
     return result.scalar_one_or_none()
 
 
-async def search_public_channels(db: AsyncSession, query: str) -> List[Chat]:
+def search_tsquery(query: str) -> Optional[str]:
+    """
+    Build a prefix-matching tsquery from free text, e.g. "world ne" becomes
+    "world:* & ne:*". Only word characters survive, so user input can never
+    inject tsquery operators. Returns None when nothing searchable is left.
+    """
+    tokens = re.findall(r"\w+", query.lower())[:SEARCH_MAX_TOKENS]
+    if not tokens:
+        return None
+    return " & ".join(f"{token}:*" for token in tokens)
+
+
+async def search_public_channels(
+    db: AsyncSession,
+    query: str,
+    limit: int = 20,
+    after: Optional[Tuple[float, uuid.UUID]] = None,
+) -> List[Row]:
+    """
+    One page of public channels matching `query`, best match first.
+
+    Matches go through the partial GIN index on search_vector. The score is the
+    text rank weighted by log(member count), so a large channel outranks a tiny
+    one with a similar name without drowning out better text matches. `after`
+    is the (score, id) of the last row of the previous page.
+    """
+    tsquery = search_tsquery(query)
+    if tsquery is None:
+        return []
+
+    ts_query = func.to_tsquery(cast(SEARCH_CONFIG, REGCONFIG), tsquery)
+    score = (
+        func.ts_rank(Chat.search_vector, ts_query)
+        * (1 + func.ln(1 + Chat.member_count))
+    ).label("score")
+    stmt = select(
+        Chat.id,
+        Chat.type,
+        Chat.name,
+        Chat.description,
+        Chat.member_count,
+        Chat.created_at,
+        score,
+    ).where(
+        Chat.is_public,
+        Chat.type == ChatType.CHANNEL,
+        Chat.search_vector.bool_op("@@")(ts_query),
+    )
+    if after:
+        stmt = stmt.where(tuple_(score, Chat.id) < tuple_(*after))
+    stmt = stmt.order_by(score.desc(), Chat.id.desc()).limit(limit)
+
+    result = await db.execute(stmt)
+    return list(result.all())
+
+
+async def index_messages(db: AsyncSession, entries: List[dict]):
+    """
+    Add messages to the search index, given dicts of chat_id, seq, sender_id,
+    created_at and content. Replaying an entry rewrites it. Does not commit.
+    """
+    config = cast(SEARCH_CONFIG, REGCONFIG)
+    stmt = insert(MessageSearchEntry).values(
+        [
+            {
+                "chat_id": entry["chat_id"],
+                "seq": entry["seq"],
+                "sender_id": entry["sender_id"],
+                "created_at": entry["created_at"],
+                "document": func.to_tsvector(config, entry["content"]),
+            }
+            for entry in entries
+        ]
+    )
+    await db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[MessageSearchEntry.chat_id, MessageSearchEntry.seq],
+            set_={"document": stmt.excluded.document},
+        )
+    )
+
+
+async def reindex_message(db: AsyncSession, chat_id: uuid.UUID, seq: int, content: str):
+    await db.execute(
+        update(MessageSearchEntry)
+        .where(MessageSearchEntry.chat_id == chat_id, MessageSearchEntry.seq == seq)
+        .values(document=func.to_tsvector(cast(SEARCH_CONFIG, REGCONFIG), content))
+    )
+
+
+async def unindex_messages(db: AsyncSession, keys: List[Tuple[uuid.UUID, int]]):
+    await db.execute(
+        delete(MessageSearchEntry)
+        .where(tuple_(MessageSearchEntry.chat_id, MessageSearchEntry.seq).in_(keys))
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def search_messages(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    query: str,
+    limit: int = 20,
+    after: Optional[Tuple[datetime, uuid.UUID, int]] = None,
+    chat_id: Optional[uuid.UUID] = None,
+) -> List[Row]:
+    """
+    One page of messages matching `query` in chats the user belongs to, newest
+    first, with the matches highlighted.
+
+    The GIN index on message_search is searched once per chat of the user: a
+    LATERAL subquery that combines it with the (chat_id, seq) primary key and
+    keeps that chat's newest `limit` hits, so other chats' matches are never
+    read. Only the merged page is joined back to messages for ts_headline,
+    through the key of the partition the message lives in. A hit whose message
+    was deleted since it was indexed keeps its place in the page with a null
+    highlight, so callers build their cursor from the page before dropping it.
+    `after` is the (created_at, chat_id, seq) of the last hit of the previous
+    page.
+    """
+    tsquery = search_tsquery(query)
+    if tsquery is None:
+        return []
+
+    config = cast(SEARCH_CONFIG, REGCONFIG)
+    ts_query = func.to_tsquery(config, tsquery)
+    chats = (
+        select(ChatMember.chat_id)
+        .join(Chat, Chat.id == ChatMember.chat_id)
+        .where(ChatMember.user_id == user_id, Chat.deleted_at.is_(None))
+    )
+    if chat_id is not None:
+        chats = chats.where(ChatMember.chat_id == chat_id)
+    chats = chats.subquery()
+    key = tuple_(
+        MessageSearchEntry.created_at,
+        MessageSearchEntry.chat_id,
+        MessageSearchEntry.seq,
+    )
+    chat_hits = select(
+        MessageSearchEntry.chat_id,
+        MessageSearchEntry.seq,
+        MessageSearchEntry.sender_id,
+        MessageSearchEntry.created_at,
+    ).where(
+        MessageSearchEntry.chat_id == chats.c.chat_id,
+        MessageSearchEntry.document.bool_op("@@")(ts_query),
+    )
+    if after:
+        chat_hits = chat_hits.where(key < tuple_(*after))
+    chat_hits = (
+        chat_hits.order_by(
+            MessageSearchEntry.created_at.desc(),
+            MessageSearchEntry.seq.desc(),
+        )
+        .limit(limit)
+        .lateral()
+    )
+    hits = (
+        select(chat_hits)
+        .select_from(chats)
+        .join(chat_hits, true())
+        .order_by(
+            chat_hits.c.created_at.desc(),
+            chat_hits.c.chat_id.desc(),
+            chat_hits.c.seq.desc(),
+        )
+        .limit(limit)
+        .subquery()
+    )
+
+    content = func.translate(Message.content, HIGHLIGHT_START + HIGHLIGHT_STOP, "")
+    for char, entity in HTML_ESCAPES:
+        content = func.replace(content, char, entity)
+    highlight = func.ts_headline(config, content, ts_query, SEARCH_HIGHLIGHT)
+    highlight = func.replace(
+        func.replace(highlight, HIGHLIGHT_START, "<mark>"), HIGHLIGHT_STOP, "</mark>"
+    )
     stmt = (
-        select(Chat)
-        .where(Chat.type == ChatType.CHANNEL)
-        .where(Chat.settings["is_public"].as_boolean() == True)
-        .where(Chat.name.ilike(f"%{query}%"))
+        select(hits, highlight.label("highlight"))
+        .outerjoin(
+            Message,
+            and_(
+                Message.chat_id == hits.c.chat_id,
+                Message.seq == hits.c.seq,
+                Message.created_at == hits.c.created_at,
+            ),
+        )
+        .order_by(hits.c.created_at.desc(), hits.c.chat_id.desc(), hits.c.seq.desc())
     )
     result = await db.execute(stmt)
-    return list(result.scalars().all())
+    return list(result.all())
 
 
 async def get_member(
     db: AsyncSession, chat_id: uuid.UUID, user_id: uuid.UUID
 ) -> Optional[ChatMember]:
-    stmt = select(ChatMember).where(
-        ChatMember.chat_id == chat_id, ChatMember.user_id == user_id
+    stmt = (
+        select(ChatMember)
+        .join(Chat, Chat.id == ChatMember.chat_id)
+        .where(
+            ChatMember.chat_id == chat_id,
+            ChatMember.user_id == user_id,
+            Chat.deleted_at.is_(None),
+        )
     )
     result = await db.execute(stmt)
     return result.scalar_one_or_none()
 
 
+async def get_member_ids_page(
+    db: AsyncSession, chat_id: uuid.UUID, after: Optional[uuid.UUID], limit: int
+) -> List[uuid.UUID]:
+    """
+    One keyset page of member ids, in user_id order. Deleted chats keep their
+    members until purged, so their deletion can still be delivered.
+    """
+    stmt = select(ChatMember.user_id).where(ChatMember.chat_id == chat_id)
+    if after is not None:
+        stmt = stmt.where(ChatMember.user_id > after)
+    stmt = stmt.order_by(ChatMember.user_id).limit(limit)
+    result = await db.execute(stmt)
+    return list(result.scalars().all())
+
+
+async def get_member_roles(
+    db: AsyncSession, pairs: List[Tuple[uuid.UUID, uuid.UUID]]
+) -> Dict[Tuple[uuid.UUID, uuid.UUID], MemberRole]:
+    """Roles of many (chat_id, user_id) pairs in one query; non-members are absent."""
+    stmt = (
+        select(ChatMember.chat_id, ChatMember.user_id, ChatMember.role)
+        .join(Chat, Chat.id == ChatMember.chat_id)
+        .where(
+            tuple_(ChatMember.chat_id, ChatMember.user_id).in_(pairs),
+            Chat.deleted_at.is_(None),
+        )
+    )
+    result = await db.execute(stmt)
+    return {(chat_id, user_id): role for chat_id, user_id, role in result.all()}
+
+
+async def get_chat_members(
+    db: AsyncSession,
+    chat_id: uuid.UUID,
+    limit: int = 100,
+    after: Optional[uuid.UUID] = None,
+    role: Optional[MemberRole] = None,
+) -> List[Row]:
+    """One page of members ordered by user id, served from the (chat_id, ...) indexes."""
+    stmt = select(ChatMember.user_id, ChatMember.role, ChatMember.joined_at).where(
+        ChatMember.chat_id == chat_id
+    )
+    if role:
+        stmt = stmt.where(ChatMember.role == role)
+    if after:
+        stmt = stmt.where(ChatMember.user_id > after)
+    stmt = stmt.order_by(ChatMember.user_id).limit(limit)
+
+    result = await db.execute(stmt)
+    return list(result.all())
+
+
+async def add_member(
+    db: AsyncSession,
+    chat_id: uuid.UUID,
+    user_id: uuid.UUID,
+    role: MemberRole = MemberRole.MEMBER,
+) -> bool:
+    """Add a member and bump the counter. Returns False if already a member."""
+    stmt = (
+        insert(ChatMember)
+        .values(chat_id=chat_id, user_id=user_id, role=role)
+        .on_conflict_do_nothing(index_elements=[ChatMember.chat_id, ChatMember.user_id])
+        .returning(ChatMember.id)
+    )
+    if await db.scalar(stmt) is None:
+        return False
+    await update_member_count(db, chat_id, 1)
+    return True
+
+
+async def add_members(
+    db: AsyncSession, chat_id: uuid.UUID, user_ids: List[uuid.UUID]
+) -> List[uuid.UUID]:
+    """Set-based add of one chunk. Returns the user ids that were not members yet."""
+    stmt = (
+        insert(ChatMember)
+        .values(
+            [
+                {"chat_id": chat_id, "user_id": user_id, "role": MemberRole.MEMBER}
+                for user_id in user_ids
+            ]
+        )
+        .on_conflict_do_nothing(index_elements=[ChatMember.chat_id, ChatMember.user_id])
+        .returning(ChatMember.user_id)
+    )
+    added = list((await db.scalars(stmt)).all())
+    if added:
+        await update_member_count(db, chat_id, len(added))
+    return added
+
+
+async def remove_members(
+    db: AsyncSession, chat_id: uuid.UUID, user_ids: List[uuid.UUID]
+) -> List[uuid.UUID]:
+    """Set-based removal of one chunk. The owner is never removed."""
+    stmt = (
+        delete(ChatMember)
+        .where(
+            ChatMember.chat_id == chat_id,
+            ChatMember.user_id.in_(user_ids),
+            ChatMember.role != MemberRole.OWNER,
+        )
+        .returning(ChatMember.user_id)
+        .execution_options(synchronize_session=False)
+    )
+    removed = list((await db.scalars(stmt)).all())
+    if removed:
+        await update_member_count(db, chat_id, -len(removed))
+    return removed
+
+
+async def remove_member(
+    db: AsyncSession, chat_id: uuid.UUID, user_id: uuid.UUID
+) -> bool:
+    stmt = (
+        delete(ChatMember)
+        .where(ChatMember.chat_id == chat_id, ChatMember.user_id == user_id)
+        .returning(ChatMember.id)
+    )
+    if await db.scalar(stmt) is None:
+        return False
+    await update_member_count(db, chat_id, -1)
+    return True
+
+
+async def queue_member_activity(db: AsyncSession, chat_id: uuid.UUID):
+    """
+    Queue the chat for services.member_activity after its last_activity_at
+    moved. A no-op while the chat is queued already. Does not commit.
+    """
+    await db.execute(
+        insert(MemberActivityQueue).values(chat_id=chat_id).on_conflict_do_nothing()
+    )
+
+
+async def claim_member_activity(db: AsyncSession, limit: int) -> List[uuid.UUID]:
+    """Take up to `limit` queued chats off the queue, oldest first. Does not commit."""
+    batch = (
+        select(MemberActivityQueue.chat_id)
+        .order_by(MemberActivityQueue.queued_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    result = await db.execute(
+        delete(MemberActivityQueue)
+        .where(MemberActivityQueue.chat_id.in_(batch.scalar_subquery()))
+        .returning(MemberActivityQueue.chat_id)
+    )
+    return list(result.scalars().all())
+
+
+async def sync_member_activity(
+    db: AsyncSession, chat_id: uuid.UUID, after: Optional[uuid.UUID], limit: int
+) -> Tuple[int, Optional[uuid.UUID]]:
+    """
+    Copy the chat's last_activity_at onto the inbox keys of its next `limit`
+    members after user id `after`. Returns the number of members read and the
+    user id to continue from. Rows locked by a concurrent membership change are
+    skipped rather than waited on. Does not commit.
+    """
+    batch = select(ChatMember.user_id).where(ChatMember.chat_id == chat_id)
+    if after is not None:
+        batch = batch.where(ChatMember.user_id > after)
+    batch = batch.order_by(ChatMember.user_id).limit(limit)
+    user_ids = list((await db.execute(batch)).scalars().all())
+    if not user_ids:
+        return 0, None
+
+    activity = select(Chat.last_activity_at).where(Chat.id == chat_id).scalar_subquery()
+    stale = (
+        select(ChatMember.id)
+        .where(
+            ChatMember.chat_id == chat_id,
+            ChatMember.user_id.in_(user_ids),
+            ChatMember.last_activity_at < activity,
+        )
+        .with_for_update(skip_locked=True)
+    )
+    await db.execute(
+        update(ChatMember)
+        .where(ChatMember.id.in_(stale.scalar_subquery()))
+        .values(last_activity_at=activity)
+        .execution_options(synchronize_session=False)
+    )
+    return len(user_ids), user_ids[-1]
+
+
+async def update_member_count(db: AsyncSession, chat_id: uuid.UUID, delta: int):
+    await db.execute(
+        update(Chat)
+        .where(Chat.id == chat_id)
+        .values(member_count=Chat.member_count + delta)
+    )
+
+
 async def delete_chat(db: AsyncSession, chat_id: uuid.UUID):
-    await db.execute(delete(Chat).where(Chat.id == chat_id))
+    """
+    Hide the chat right away and queue its rows for services.chat_purger.
+
+    Deleting members and messages inline would be one transaction the size
+    of the chat. Freeing dm_key lets the same pair open a new DM, clearing
+    is_public drops the chat from the search index.
+    """
+    await db.execute(
+        update(Chat)
+        .where(Chat.id == chat_id, Chat.deleted_at.is_(None))
+        .values(
+            deleted_at=func.now(),
+            dm_key=None,
+            is_public=False,
+            last_activity_at=func.now(),
+        )
+    )
+    # Moves the members' inbox keys, so their inbox ETags change
+    await queue_member_activity(db, chat_id)
+    await db.execute(insert(ChatPurge).values(chat_id=chat_id).on_conflict_do_nothing())
+    add_outbox_event(db, "chat_deleted", {"chat_id": str(chat_id)})
+    await db.commit()
+
+
+MESSAGE_COLUMNS = (
+    Message.id,
+    Message.chat_id,
+    Message.seq,
+    Message.sender_id,
+    Message.content,
+    Message.created_at,
+    Message.edited_at,
+    Message.reactions,
+)
+
+
+async def allocate_message_seqs(
+    db: AsyncSession, chat_id: uuid.UUID, count: int, last: Tuple[uuid.UUID, str]
+) -> Optional[int]:
+    """
+    Reserve `count` consecutive sequence numbers of a chat and return the last
+    one, or None if the chat does not exist. The same UPDATE moves the inbox
+    preview to `last`, the (sender_id, content) of the newest message. The row
+    lock taken here orders concurrent writers of the same chat until their
+    transactions end. The chat is queued for its members' inbox keys to
+    follow, which services.member_activity does outside this transaction.
+    """
+    sender_id, content = last
+    stmt = (
+        update(Chat)
+        .where(Chat.id == chat_id, Chat.deleted_at.is_(None))
+        .values(
+            last_message_seq=Chat.last_message_seq + count,
+            last_message_preview=content[:PREVIEW_LENGTH],
+            last_message_sender_id=sender_id,
+            last_message_at=func.now(),
+            last_activity_at=func.now(),
+            updated_at=func.now(),
+        )
+        .returning(Chat.last_message_seq)
+    )
+    last_seq = await db.scalar(stmt)
+    if last_seq is not None:
+        await queue_member_activity(db, chat_id)
+    return last_seq
+
+
+async def create_messages(
+    db: AsyncSession, chat_id: uuid.UUID, messages: List[Tuple[uuid.UUID, str]]
+) -> List[Row]:
+    """
+    Insert (sender_id, content) messages into a chat with a single multi-row
+    INSERT, in the given order, and stage their message_created events. Does not
+    commit; returns [] if the chat does not exist.
+    """
+    last_seq = await allocate_message_seqs(db, chat_id, len(messages), messages[-1])
+    if last_seq is None:
+        return []
+
+    first_seq = last_seq - len(messages) + 1
+    values = [
+        {
+            "id": uuid.uuid4(),
+            "chat_id": chat_id,
+            "seq": first_seq + i,
+            "sender_id": sender_id,
+            "content": content,
+        }
+        for i, (sender_id, content) in enumerate(messages)
+    ]
+    result = await db.execute(
+        insert(Message).values(values).returning(*MESSAGE_COLUMNS)
+    )
+    rows = sorted(result.all(), key=lambda row: row.seq)
+
+    for row in rows:
+        add_outbox_event(
+            db,
+            "message_created",
+            {
+                "id": str(row.id),
+                "chat_id": str(row.chat_id),
+                "seq": row.seq,
+                "sender_id": str(row.sender_id),
+                "content": row.content,
+                "created_at": row.created_at.isoformat(),
+            },
+        )
+    return rows
+
+
+async def get_messages(
+    db: AsyncSession,
+    chat_id: uuid.UUID,
+    limit: int = 50,
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> List[Row]:
+    """
+    One page of a chat's history in ascending seq order.
+
+    Without `after` this is the `limit` messages preceding `before` (or the
+    latest ones); with `after` the `limit` messages following it. Either way a
+    range scan on the (chat_id, seq) key per partition, so the cost does not
+    depend on how deep into the history the page is. `since` and `until`
+    bound created_at, which lets the planner skip the partitions outside them.
+    """
+    stmt = select(*MESSAGE_COLUMNS).where(Message.chat_id == chat_id)
+    if since is not None:
+        stmt = stmt.where(Message.created_at >= since)
+    if until is not None:
+        stmt = stmt.where(Message.created_at <= until)
+    if after is not None:
+        stmt = stmt.where(Message.seq > after).order_by(Message.seq).limit(limit)
+        result = await db.execute(stmt)
+        return list(result.all())
+
+    if before is not None:
+        stmt = stmt.where(Message.seq < before)
+    stmt = stmt.order_by(Message.seq.desc()).limit(limit)
+    result = await db.execute(stmt)
+    return list(reversed(result.all()))
+
+
+async def get_message(db: AsyncSession, chat_id: uuid.UUID, seq: int) -> Optional[Row]:
+    stmt = select(*MESSAGE_COLUMNS).where(
+        Message.chat_id == chat_id, Message.seq == seq
+    )
+    result = await db.execute(stmt)
+    return result.one_or_none()
+
+
+async def update_message(
+    db: AsyncSession, chat_id: uuid.UUID, seq: int, content: str
+) -> Optional[Row]:
+    stmt = (
+        update(Message)
+        .where(Message.chat_id == chat_id, Message.seq == seq)
+        .values(content=content, edited_at=func.now())
+        .returning(*MESSAGE_COLUMNS)
+    )
+    result = await db.execute(stmt)
+    row = result.one_or_none()
+    if row:
+        await refresh_message_preview(db, chat_id, seq)
+        add_outbox_event(
+            db,
+            "message_updated",
+            {"chat_id": str(chat_id), "seq": seq, "content": content},
+        )
+    return row
+
+
+async def delete_message(db: AsyncSession, chat_id: uuid.UUID, seq: int) -> bool:
+    result = await db.execute(
+        delete(Message).where(Message.chat_id == chat_id, Message.seq == seq)
+    )
+    if result.rowcount:
+        await db.execute(
+            delete(MessageReaction).where(
+                MessageReaction.chat_id == chat_id, MessageReaction.seq == seq
+            )
+        )
+        await db.execute(
+            insert(MessageTombstone)
+            .values(chat_id=chat_id, seq=seq)
+            .on_conflict_do_nothing()
+        )
+        await refresh_message_preview(db, chat_id, seq)
+        add_outbox_event(db, "message_deleted", {"chat_id": str(chat_id), "seq": seq})
+    return bool(result.rowcount)
+
+
+async def count_deleted_after(
+    db: AsyncSession, cursors: Dict[uuid.UUID, int]
+) -> Dict[uuid.UUID, int]:
+    """Deleted messages above each chat's read cursor, in one query; zeros are absent."""
+    if not cursors:
+        return {}
+    stmt = (
+        select(MessageTombstone.chat_id, func.count())
+        .where(
+            or_(
+                *(
+                    and_(
+                        MessageTombstone.chat_id == chat_id, MessageTombstone.seq > seq
+                    )
+                    for chat_id, seq in cursors.items()
+                )
+            )
+        )
+        .group_by(MessageTombstone.chat_id)
+    )
+    result = await db.execute(stmt)
+    return dict(result.all())
+
+
+async def lock_reactions(
+    db: AsyncSession, chat_id: uuid.UUID, seq: int, user_id: uuid.UUID
+) -> Optional[Tuple[dict, List[str]]]:
+    """
+    Lock a message for a reaction change and return its reaction counts and
+    the emojis `user_id` reacted with, or None when it does not exist. Limits
+    checked against them hold until the transaction ends.
+    """
+    reactions = await db.scalar(
+        select(Message.reactions)
+        .where(Message.chat_id == chat_id, Message.seq == seq)
+        .with_for_update()
+    )
+    if reactions is None:
+        return None
+    mine = await db.scalars(
+        select(MessageReaction.emoji).where(
+            MessageReaction.chat_id == chat_id,
+            MessageReaction.seq == seq,
+            MessageReaction.user_id == user_id,
+        )
+    )
+    return reactions, list(mine.all())
+
+
+async def add_reaction(
+    db: AsyncSession, chat_id: uuid.UUID, seq: int, user_id: uuid.UUID, emoji: str
+) -> Optional[Tuple[dict, Optional[int]]]:
+    """
+    React to a message and bump its counter. Idempotent; returns the message's
+    reaction counts and, if they changed, their version (see _count_reaction),
+    or None when the message does not exist. Does not commit.
+    """
+    message = exists().where(Message.chat_id == chat_id, Message.seq == seq)
+    stmt = (
+        insert(MessageReaction)
+        .from_select(
+            ["chat_id", "seq", "emoji", "user_id"],
+            select(
+                literal(chat_id), literal(seq), literal(emoji), literal(user_id)
+            ).where(message),
+        )
+        .on_conflict_do_nothing()
+        .returning(MessageReaction.seq)
+    )
+    if await db.scalar(stmt) is None:
+        return _unchanged(await get_reactions(db, chat_id, seq))
+    return await _count_reaction(db, chat_id, seq, emoji, 1)
+
+
+async def remove_reaction(
+    db: AsyncSession, chat_id: uuid.UUID, seq: int, user_id: uuid.UUID, emoji: str
+) -> Optional[Tuple[dict, Optional[int]]]:
+    """Counterpart of add_reaction."""
+    stmt = (
+        delete(MessageReaction)
+        .where(
+            MessageReaction.chat_id == chat_id,
+            MessageReaction.seq == seq,
+            MessageReaction.emoji == emoji,
+            MessageReaction.user_id == user_id,
+        )
+        .returning(MessageReaction.seq)
+    )
+    if await db.scalar(stmt) is None:
+        return _unchanged(await get_reactions(db, chat_id, seq))
+    return await _count_reaction(db, chat_id, seq, emoji, -1)
+
+
+def _unchanged(reactions: Optional[dict]) -> Optional[Tuple[dict, Optional[int]]]:
+    return None if reactions is None else (reactions, None)
+
+
+async def _count_reaction(
+    db: AsyncSession, chat_id: uuid.UUID, seq: int, emoji: str, delta: int
+) -> Optional[Tuple[dict, int]]:
+    """
+    Apply `delta` to one counter. Also returns the microseconds of the
+    database clock at the update: the row lock orders the changes of one
+    message, so later changes have higher versions.
+    """
+    key = literal(emoji, String)
+    count = func.coalesce(Message.reactions[key].as_integer(), 0) + delta
+    bumped = Message.reactions.op("||", return_type=JSONB)(
+        func.jsonb_build_object(key, count, type_=JSONB)
+    )
+    # Emojis nobody uses any more leave the summary
+    removed = Message.reactions.op("-", return_type=JSONB)(key)
+    version = cast(
+        func.extract("epoch", func.clock_timestamp()) * 1_000_000, BigInteger
+    )
+    stmt = (
+        update(Message)
+        .where(Message.chat_id == chat_id, Message.seq == seq)
+        .values(reactions=case((count <= 0, removed), else_=bumped))
+        .returning(Message.reactions, version)
+    )
+    row = (await db.execute(stmt)).one_or_none()
+    if row is None:
+        return None
+    reactions, version = row
+    add_outbox_event(
+        db,
+        "reactions_updated",
+        {"chat_id": str(chat_id), "seq": seq, "reactions": reactions},
+    )
+    return reactions, version
+
+
+async def get_reactions(
+    db: AsyncSession, chat_id: uuid.UUID, seq: int
+) -> Optional[dict]:
+    return await db.scalar(
+        select(Message.reactions).where(Message.chat_id == chat_id, Message.seq == seq)
+    )
+
+
+async def get_my_reactions(
+    db: AsyncSession, chat_id: uuid.UUID, user_id: uuid.UUID, low: int, high: int
+) -> Dict[int, List[str]]:
+    """The user's reactions to messages low..high of a chat, in one range scan."""
+    stmt = select(MessageReaction.seq, MessageReaction.emoji).where(
+        MessageReaction.chat_id == chat_id,
+        MessageReaction.user_id == user_id,
+        MessageReaction.seq.between(low, high),
+    )
+    result = await db.execute(stmt)
+    mine: Dict[int, List[str]] = {}
+    for seq, emoji in result.all():
+        mine.setdefault(seq, []).append(emoji)
+    return mine
+
+
+async def refresh_message_preview(db: AsyncSession, chat_id: uuid.UUID, seq: int):
+    """
+    Re-derive the preview from the newest message after message `seq` was
+    edited or deleted. A no-op unless `seq` was the newest message; otherwise
+    three top-1 probes of the (chat_id, seq) key.
+    """
+
+    def newest(column):
+        return (
+            select(column)
+            .where(Message.chat_id == chat_id)
+            .order_by(Message.seq.desc())
+            .limit(1)
+            .scalar_subquery()
+        )
+
+    newer = exists().where(Message.chat_id == chat_id, Message.seq > seq)
+    await db.execute(
+        update(Chat)
+        .where(Chat.id == chat_id, ~newer)
+        .values(
+            last_message_preview=newest(func.left(Message.content, PREVIEW_LENGTH)),
+            last_message_sender_id=newest(Message.sender_id),
+            last_message_at=newest(Message.created_at),
+        )
+    )
+
+
+SCHEDULED_COLUMNS = (
+    ScheduledMessage.id,
+    ScheduledMessage.chat_id,
+    ScheduledMessage.sender_id,
+    ScheduledMessage.content,
+    ScheduledMessage.due_at,
+    ScheduledMessage.created_at,
+)
+
+
+async def create_scheduled_message(
+    db: AsyncSession,
+    chat_id: uuid.UUID,
+    sender_id: uuid.UUID,
+    content: str,
+    delay: float,
+) -> Row:
+    """Schedule a message `delay` seconds from now, by the database clock. Does not commit."""
+    stmt = (
+        insert(ScheduledMessage)
+        .values(
+            id=uuid.uuid4(),
+            chat_id=chat_id,
+            sender_id=sender_id,
+            content=content,
+            due_at=func.localtimestamp() + func.make_interval(0, 0, 0, 0, 0, 0, delay),
+        )
+        .returning(*SCHEDULED_COLUMNS)
+    )
+    result = await db.execute(stmt)
+    return result.one()
+
+
+async def get_scheduled_window(
+    db: AsyncSession, horizon: float, limit: int
+) -> List[Row]:
+    """(id, seconds until due) of messages due within `horizon` seconds, soonest first."""
+    delay = func.extract("epoch", ScheduledMessage.due_at - func.localtimestamp())
+    stmt = (
+        select(ScheduledMessage.id, delay.label("delay"))
+        .where(
+            ScheduledMessage.due_at
+            <= func.localtimestamp() + func.make_interval(0, 0, 0, 0, 0, 0, horizon)
+        )
+        .order_by(ScheduledMessage.due_at)
+        .limit(limit)
+    )
+    result = await db.execute(stmt)
+    return list(result.all())
+
+
+async def claim_due_messages(db: AsyncSession, limit: int) -> List[Row]:
+    """
+    Delete and return up to `limit` due scheduled messages, oldest first, with
+    how late they are and whether the sender may still post them. Rows locked
+    by another claimer are skipped, not waited for. Does not commit: the caller
+    posts them in the same transaction.
+    """
+    due = (
+        select(ScheduledMessage.id)
+        .where(ScheduledMessage.due_at <= func.localtimestamp())
+        .order_by(ScheduledMessage.due_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    lateness = func.extract("epoch", func.localtimestamp() - ScheduledMessage.due_at)
+    # Same rules as sending: still a member, and an admin if it is a channel
+    allowed = (
+        select(ChatMember.id)
+        .join(Chat, Chat.id == ChatMember.chat_id)
+        .where(
+            ChatMember.chat_id == ScheduledMessage.chat_id,
+            ChatMember.user_id == ScheduledMessage.sender_id,
+            Chat.deleted_at.is_(None),
+            or_(ChatMember.role != MemberRole.MEMBER, Chat.type != ChatType.CHANNEL),
+        )
+        .correlate(ScheduledMessage)
+        .exists()
+    )
+    stmt = (
+        delete(ScheduledMessage)
+        .where(ScheduledMessage.id.in_(due.scalar_subquery()))
+        .returning(
+            *SCHEDULED_COLUMNS, lateness.label("lateness"), allowed.label("allowed")
+        )
+        .execution_options(synchronize_session=False)
+    )
+    result = await db.execute(stmt)
+    return sorted(result.all(), key=lambda row: row.due_at)
+
+
+async def get_scheduled_messages(
+    db: AsyncSession, chat_id: uuid.UUID, sender_id: uuid.UUID
+) -> List[Row]:
+    stmt = (
+        select(*SCHEDULED_COLUMNS)
+        .where(
+            ScheduledMessage.chat_id == chat_id,
+            ScheduledMessage.sender_id == sender_id,
+        )
+        .order_by(ScheduledMessage.due_at)
+    )
+    result = await db.execute(stmt)
+    return list(result.all())
+
+
+async def cancel_scheduled_message(
+    db: AsyncSession, chat_id: uuid.UUID, sender_id: uuid.UUID, schedule_id: uuid.UUID
+) -> bool:
+    result = await db.execute(
+        delete(ScheduledMessage).where(
+            ScheduledMessage.id == schedule_id,
+            ScheduledMessage.chat_id == chat_id,
+            ScheduledMessage.sender_id == sender_id,
+        )
+    )
+    return bool(result.rowcount)
+
+
+async def get_last_message_seq(db: AsyncSession, chat_id: uuid.UUID) -> Optional[int]:
+    return await db.scalar(
+        select(Chat.last_message_seq).where(
+            Chat.id == chat_id, Chat.deleted_at.is_(None)
+        )
+    )
+
+
+async def get_read_states(
+    db: AsyncSession, user_id: uuid.UUID, chat_ids: List[uuid.UUID]
+) -> Dict[uuid.UUID, int]:
+    """Stored read cursors of a user; chats never read are absent."""
+    stmt = select(ReadState.chat_id, ReadState.last_read_seq).where(
+        ReadState.user_id == user_id, ReadState.chat_id.in_(chat_ids)
+    )
+    result = await db.execute(stmt)
+    return {chat_id: seq for chat_id, seq in result.all()}
+
+
+async def upsert_read_states(
+    db: AsyncSession, states: List[Tuple[uuid.UUID, uuid.UUID, int]]
+):
+    """Write (user_id, chat_id, seq) cursors in one statement; cursors never move back."""
+    stmt = insert(ReadState).values(
+        [
+            {"user_id": user_id, "chat_id": chat_id, "last_read_seq": seq}
+            for user_id, chat_id, seq in states
+        ]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ReadState.user_id, ReadState.chat_id],
+        set_={
+            "last_read_seq": func.greatest(
+                ReadState.last_read_seq, stmt.excluded.last_read_seq
+            ),
+            "updated_at": func.now(),
+        },
+    )
+    await db.execute(stmt)
+
+
+# Tables emptied by the purger, in order, with the keyset column and the parser
+# of a stored cursor. Without a keyset column the first rows in primary key
+# order go each time: deleted rows are gone from the next batch anyway.
+PURGE_PHASES = {
+    "messages": (Message, Message.seq, int),
+    "reactions": (MessageReaction, None, None),
+    "search": (MessageSearchEntry, MessageSearchEntry.seq, int),
+    "tombstones": (MessageTombstone, MessageTombstone.seq, int),
+    "read_states": (ReadState, ReadState.user_id, uuid.UUID),
+    "members": (ChatMember, ChatMember.user_id, uuid.UUID),
+}
+
+
+async def purge_chat_rows(
+    db: AsyncSession, phase: str, chat_id: uuid.UUID, after: Optional[str], limit: int
+) -> Tuple[int, Optional[str]]:
+    """
+    Delete the next `limit` rows of a deleted chat from the table of `phase`,
+    after cursor `after`. Returns the number of rows deleted and the cursor to
+    continue from. Does not commit.
+    """
+    model, key, parse = PURGE_PHASES[phase]
+    if key is None:
+        columns = list(model.__table__.primary_key.columns)
+        batch = (
+            select(*columns)
+            .where(model.chat_id == chat_id)
+            .order_by(*columns)
+            .limit(limit)
+        )
+        result = await db.execute(
+            delete(model)
+            .where(model.chat_id == chat_id, tuple_(*columns).in_(batch))
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount, None
+
+    batch = select(key).where(model.chat_id == chat_id)
+    if after is not None:
+        batch = batch.where(key > parse(after))
+    batch = batch.order_by(key).limit(limit)
+
+    stmt = (
+        delete(model)
+        .where(model.chat_id == chat_id, key.in_(batch))
+        .returning(key)
+        .execution_options(synchronize_session=False)
+    )
+    result = await db.execute(stmt)
+    keys = result.scalars().all()
+    return len(keys), str(max(keys)) if keys else None
+
+
+async def mark_chat_fanned_out(db: AsyncSession, chat_id: uuid.UUID):
+    """Let the purger delete the members of a deleted chat. Does not commit."""
+    await db.execute(
+        update(ChatPurge)
+        .where(ChatPurge.chat_id == chat_id, ChatPurge.fanned_out_at.is_(None))
+        .values(fanned_out_at=func.now())
+    )
+
+
+def add_outbox_event(db: AsyncSession, event_type: str, data: dict):
+    """Stage an event to be relayed to Kafka once the current transaction commits."""
+    db.add(OutboxEvent(event_type=event_type, payload=data))
+
+
+async def get_outbox_batch(db: AsyncSession, after_id: int, limit: int) -> List[tuple]:
+    stmt = (
+        select(
+            OutboxEvent.id,
+            OutboxEvent.event_type,
+            OutboxEvent.payload,
+            func.extract("epoch", func.localtimestamp() - OutboxEvent.created_at),
+        )
+        .where(OutboxEvent.id > after_id)
+        .order_by(OutboxEvent.id)
+        .limit(limit)
+    )
+    result = await db.execute(stmt)
+    return list(result.all())
+
+
+async def delete_outbox_events(db: AsyncSession, ids: List[int]):
+    await db.execute(delete(OutboxEvent).where(OutboxEvent.id.in_(ids)))
     await db.commit()
@@ -1,9 +1,18 @@
+import time
 from functools import lru_cache
 
 from redis.asyncio import Redis
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
+from app.metrics import metrics
 from app.settings import get_settings
 
 
@@ -11,13 +20,96 @@ class Base(DeclarativeBase):
     pass
 
 
+def _timed_pool(name: str) -> type:
+    class TimedPool(AsyncAdaptedQueuePool):
+        def _do_get(self):
+            # Time spent waiting for a free connection once the pool is exhausted
+            with metrics.timer(f"db.{name}.pool_wait"):
+                return super()._do_get()
+
+    return TimedPool
+
+
+def create_engine(
+    url: str, name: str, pool_size: int, max_overflow: int, pool_timeout: float, **kw
+) -> AsyncEngine:
+    """An engine whose pool waits, query latency and checked out connections
+    show up in metrics as db.{name}.*"""
+    engine = create_async_engine(
+        url,
+        poolclass=_timed_pool(name),
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        pool_pre_ping=True,
+        **kw,
+    )
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_execute(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info["query_start"].pop()
+        metrics.observe(f"db.{name}.query", time.perf_counter() - start)
+
+    # The checkin event fires before the pool counts the connection as returned
+    checked_out = [0]
+
+    @event.listens_for(sync_engine.pool, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        checked_out[0] += 1
+        metrics.set_gauge(f"db.{name}.checked_out", checked_out[0])
+
+    @event.listens_for(sync_engine.pool, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        checked_out[0] -= 1
+        metrics.set_gauge(f"db.{name}.checked_out", checked_out[0])
+
+    return engine
+
+
 @lru_cache
-def get_session_local():
+def get_engine():
+    settings = get_settings()
+    return create_engine(
+        settings.database_url,
+        "primary",
+        settings.db_pool_size,
+        settings.db_max_overflow,
+        settings.db_pool_timeout,
+        echo=True,
+    )
+
+
+@lru_cache
+def get_read_engine():
+    """The replica engine, or the primary when no replica is configured."""
     settings = get_settings()
+    if not settings.database_read_url:
+        return get_engine()
+    return create_engine(
+        settings.database_read_url,
+        "replica",
+        settings.db_read_pool_size,
+        settings.db_read_max_overflow,
+        settings.db_pool_timeout,
+    )
+
 
-    engine = create_async_engine(settings.database_url, echo=True)
+@lru_cache
+def get_session_local():
     return async_sessionmaker(
-        autocommit=False, autoflush=False, bind=engine, class_=AsyncSession
+        autocommit=False, autoflush=False, bind=get_engine(), class_=AsyncSession
+    )
+
+
+@lru_cache
+def get_read_session_local():
+    return async_sessionmaker(
+        autocommit=False, autoflush=False, bind=get_read_engine(), class_=AsyncSession
     )
 
 
@@ -30,6 +122,17 @@ async def get_db():
             await db.close()
 
 
+async def get_replica_db():
+    """Session on the read engine. Endpoints go through dependencies.get_read_db,
+    which falls back to the primary for recent writers."""
+    SessionLocal = get_read_session_local()
+    async with SessionLocal() as db:
+        try:
+            yield db
+        finally:
+            await db.close()
+
+
 @lru_cache
 def get_redis_client():
     settings = get_settings()
@@ -1,13 +1,21 @@
 import uuid
-from typing import Annotated, Optional
+from typing import Annotated, List, Optional
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from redis.asyncio import Redis
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_redis_client
+from app.database import get_db, get_redis_client, get_replica_db
+from app.metrics import metrics
 from app.schemas import TokenData
 from app.security import decode_token
+from app.services.read_routing import (
+    PrimaryPins,
+    chat_pin,
+    get_primary_pins,
+    user_pin,
+)
 from app.settings import Settings, get_settings
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login", auto_error=False)
@@ -52,3 +60,79 @@ def get_current_user_id(
     current_user_data: Annotated[TokenData, Depends(get_current_user_data)],
 ) -> Optional[uuid.UUID]:
     return current_user_data.sub
+
+
+def require_permission(required_perms: list[str]):
+    async def permission_checker(
+        current_user_data: Annotated[TokenData, Depends(get_current_user_data)],
+    ):
+        if not all([perm in current_user_data.scopes for perm in required_perms]):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not enough permissions.",
+            )
+        return True
+
+    return permission_checker
+
+
+def _pin_keys(request: Request, user_id: Optional[uuid.UUID]) -> List[str]:
+    keys = [user_pin(user_id)] if user_id else []
+    if "chat_id" in request.path_params:
+        keys.append(chat_pin(request.path_params["chat_id"]))
+    return keys
+
+
+async def get_write_db(
+    request: Request,
+    current_user_data: Annotated[TokenData, Depends(get_current_user_data)],
+    pins: Annotated[PrimaryPins, Depends(get_primary_pins)],
+    db: Annotated[AsyncSession, Depends(get_db)],
+) -> AsyncSession:
+    """Primary session for endpoints that write; pins the writer and the chat."""
+    # Pinned before the write, so no read can slip in between commit and pin
+    await pins.pin(*_pin_keys(request, current_user_data.sub))
+    return db
+
+
+async def _route_read(
+    request: Request,
+    user_id: Optional[uuid.UUID],
+    settings: Settings,
+    pins: PrimaryPins,
+    primary: AsyncSession,
+    replica: AsyncSession,
+) -> AsyncSession:
+    # Sessions only connect on first use, so the unused one costs nothing
+    if settings.database_read_url and not await pins.is_pinned(
+        *_pin_keys(request, user_id)
+    ):
+        metrics.inc("db.reads.replica")
+        return replica
+    metrics.inc("db.reads.primary")
+    return primary
+
+
+async def get_read_db(
+    request: Request,
+    current_user_data: Annotated[TokenData, Depends(get_current_user_data)],
+    settings: Annotated[Settings, Depends(get_settings)],
+    pins: Annotated[PrimaryPins, Depends(get_primary_pins)],
+    primary: Annotated[AsyncSession, Depends(get_db)],
+    replica: Annotated[AsyncSession, Depends(get_replica_db)],
+) -> AsyncSession:
+    """Replica session, unless the user or the chat in the path wrote recently."""
+    return await _route_read(
+        request, current_user_data.sub, settings, pins, primary, replica
+    )
+
+
+async def get_public_read_db(
+    request: Request,
+    settings: Annotated[Settings, Depends(get_settings)],
+    pins: Annotated[PrimaryPins, Depends(get_primary_pins)],
+    primary: Annotated[AsyncSession, Depends(get_db)],
+    replica: Annotated[AsyncSession, Depends(get_replica_db)],
+) -> AsyncSession:
+    """get_read_db for unauthenticated and service endpoints: chat pins only."""
+    return await _route_read(request, None, settings, pins, primary, replica)
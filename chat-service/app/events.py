@@ -0,0 +1,76 @@
+import json
+import struct
+from typing import Any, Optional, Tuple
+
+import msgpack
+
+# Envelope layout: magic byte, envelope version, schema id (uint16), MessagePack
+# body. 0xC1 is never emitted by MessagePack and cannot start a JSON document,
+# so consumers can tell envelopes from legacy JSON records by the first byte.
+ENVELOPE_MAGIC = 0xC1
+ENVELOPE_VERSION = 1
+ENVELOPE_HEADER = struct.Struct(">BBH")
+
+# Schema id 0 is a generic envelope that carries the event type in its body
+GENERIC_SCHEMA_ID = 0
+
+SCHEMA_IDS = {
+    "chat_created": 1,
+    "chat_updated": 2,
+    "chat_deleted": 3,
+    "participant_added": 4,
+    "participant_removed": 5,
+    "participant_left": 6,
+    "role_updated": 7,
+    "participants_added": 8,
+    "participants_removed": 9,
+    "message_created": 10,
+    "message_updated": 11,
+    "message_deleted": 12,
+    "reactions_updated": 13,
+    # Websocket delivery record: {"type", "recipients", "payload"}
+    "delivery": 100,
+}
+
+EVENT_TYPES = {schema_id: event_type for event_type, schema_id in SCHEMA_IDS.items()}
+
+
+class EnvelopeError(ValueError):
+    pass
+
+
+def encode_event(event_type: str, data: Any, event_format: str = "msgpack") -> bytes:
+    if event_format == "json":
+        payload = {"event_type": event_type, "data": data}
+        return json.dumps(payload, default=str).encode("utf-8")
+
+    schema_id = SCHEMA_IDS.get(event_type, GENERIC_SCHEMA_ID)
+    body = data if schema_id else {"event_type": event_type, "data": data}
+    return ENVELOPE_HEADER.pack(
+        ENVELOPE_MAGIC, ENVELOPE_VERSION, schema_id
+    ) + msgpack.packb(body, default=str)
+
+
+def decode_event(raw: bytes) -> Tuple[str, Any]:
+    if raw[:1] != bytes((ENVELOPE_MAGIC,)):
+        payload = json.loads(raw)
+        return payload["event_type"], payload.get("data")
+
+    _, version, schema_id = ENVELOPE_HEADER.unpack_from(raw)
+    if version != ENVELOPE_VERSION:
+        raise EnvelopeError(f"Unsupported envelope version {version}")
+
+    body = msgpack.unpackb(raw[ENVELOPE_HEADER.size :])
+    if schema_id == GENERIC_SCHEMA_ID:
+        return body["event_type"], body.get("data")
+    try:
+        return EVENT_TYPES[schema_id], body
+    except KeyError:
+        raise EnvelopeError(f"Unknown schema id {schema_id}")
+
+
+def partition_key(data: Any) -> Optional[bytes]:
+    """Events of one chat share a partition, so consumers see them in order."""
+    if isinstance(data, dict) and data.get("chat_id"):
+        return str(data["chat_id"]).encode("utf-8")
+    return None
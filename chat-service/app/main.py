@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 
@@ -6,6 +7,7 @@ from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
 from app.api import router
+from app.database import get_engine, get_redis_client
 from app.exceptions import (
     AppException,
     app_exception_handler,
@@ -15,7 +17,17 @@ from app.exceptions import (
 )
 from app.logger import configure_logging
 from app.middlewares import TraceContextMiddleware
+from app.services.chat_purger import ChatPurger
+from app.services.fanout import ChatMemberSource, FanoutConsumer
 from app.services.kafka_producer import producer_service
+from app.services.member_activity import MemberActivitySync
+from app.services.message_cache import MessageTailCache
+from app.services.message_ingestor import message_ingestor
+from app.services.message_scheduler import message_scheduler
+from app.services.outbox_relay import OutboxRelay
+from app.services.partitions import PartitionMaintainer, ensure_message_partitions
+from app.services.read_state import ReadCursorStore
+from app.services.search_indexer import SearchIndexer
 from app.settings import get_settings
 
 logger = logging.getLogger(__name__)
@@ -24,8 +36,61 @@ logger = logging.getLogger(__name__)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Application startup...")
+    settings = get_settings()
     await producer_service.start()
+
+    try:
+        async with get_engine().begin() as conn:
+            await ensure_message_partitions(conn, settings.message_partitions_ahead)
+    except Exception as e:
+        logger.error(f"Could not create message partitions: {e}")
+
+    relay_task = None
+    if settings.outbox_relay_enabled:
+        relay = OutboxRelay(producer_service, settings)
+        message_ingestor.on_commit = relay.wake
+        message_scheduler.on_commit = relay.wake
+        relay_task = asyncio.create_task(relay.run())
+    tail_cache = MessageTailCache(
+        get_redis_client(), settings.message_tail_size, settings.message_tail_ttl
+    )
+    read_cursors = ReadCursorStore(get_redis_client(), settings)
+    message_ingestor.tail_cache = tail_cache
+    message_ingestor.read_cursors = read_cursors
+    message_ingestor.start()
+    message_scheduler.tail_cache = tail_cache
+    message_scheduler.read_cursors = read_cursors
+    background_tasks = [
+        asyncio.create_task(read_cursors.run()),
+        asyncio.create_task(ChatPurger(settings).run()),
+        asyncio.create_task(MemberActivitySync(settings).run()),
+        asyncio.create_task(PartitionMaintainer(settings).run()),
+        asyncio.create_task(message_scheduler.run()),
+    ]
+    if settings.fanout_enabled:
+        members = ChatMemberSource(
+            get_redis_client(),
+            settings.fanout_page_size,
+            settings.fanout_member_cache_ttl,
+        )
+        fanout = FanoutConsumer(producer_service, members, settings)
+        background_tasks.append(asyncio.create_task(fanout.run()))
+    if settings.search_indexer_enabled:
+        indexer = SearchIndexer(settings)
+        background_tasks.append(asyncio.create_task(indexer.run()))
+
     yield
+
+    await message_ingestor.stop()
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    if relay_task:
+        relay_task.cancel()
+        try:
+            await relay_task
+        except asyncio.CancelledError:
+            logger.info("Outbox relay task cancelled")
     await producer_service.stop()
     logger.info("Application shutdown...")
 
@@ -0,0 +1,52 @@
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+
+class Metrics:
+    """
+    In-process counters, gauges and timings exposed on /api/v1/metrics.
+    """
+
+    def __init__(self):
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.gauges: Dict[str, float] = {}
+        self.timings: Dict[str, list] = defaultdict(lambda: [0, 0.0, 0.0])
+
+    def inc(self, name: str, value: int = 1):
+        self.counters[name] += value
+
+    def set_gauge(self, name: str, value: float):
+        self.gauges[name] = value
+
+    def observe(self, name: str, seconds: float):
+        timing = self.timings[name]
+        timing[0] += 1
+        timing[1] += seconds
+        timing[2] = max(timing[2], seconds)
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start_time)
+
+    def snapshot(self) -> dict:
+        return {
+            "counters": dict(self.counters),
+            "gauges": dict(self.gauges),
+            "timings": {
+                name: {
+                    "count": count,
+                    "avg": total / count if count else 0.0,
+                    "max": maximum,
+                }
+                for name, (count, total, maximum) in self.timings.items()
+            },
+        }
+
+
+metrics = Metrics()
@@ -3,11 +3,29 @@ import uuid
 from datetime import datetime
 from typing import List, Optional
 
-from sqlalchemy import JSON, Enum, ForeignKey, String, func
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy import (
+    DDL,
+    JSON,
+    BigInteger,
+    Computed,
+    Enum,
+    ForeignKey,
+    Index,
+    String,
+    Text,
+    UniqueConstraint,
+    event,
+    func,
+    text,
+)
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
+from sqlalchemy.orm import Mapped, deferred, mapped_column, relationship
 
 from app.database import Base
 
+# Characters of the newest message kept on the chat row for the inbox
+PREVIEW_LENGTH = 120
+
 
 class ChatType(enum.Enum):
     DM = "DM"
@@ -23,21 +41,66 @@ class MemberRole(enum.Enum):
 
 class Chat(Base):
     __tablename__ = "chats"
+    __table_args__ = (
+        # Public channel search only ever looks at public rows
+        Index(
+            "ix_chats_public_search",
+            "search_vector",
+            postgresql_using="gin",
+            postgresql_where=text("is_public"),
+        ),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default=uuid.uuid4)
     type: Mapped[ChatType] = mapped_column(Enum(ChatType), nullable=False)
     name: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
     settings: Mapped[dict] = mapped_column(JSON, default={}, nullable=False)
+    description: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    is_public: Mapped[bool] = mapped_column(default=False, nullable=False)
+    search_vector: Mapped[str] = deferred(
+        mapped_column(
+            TSVECTOR,
+            Computed(
+                "to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(description, ''))",
+                persisted=True,
+            ),
+        )
+    )
+    # Canonical "<lower user id>:<higher user id>" pair, only set for DMs
+    dm_key: Mapped[Optional[str]] = mapped_column(
+        String(65), unique=True, nullable=True
+    )
     created_at: Mapped[datetime] = mapped_column(default=func.now(), nullable=False)
     updated_at: Mapped[datetime] = mapped_column(
         default=func.now(), onupdate=func.now(), nullable=False
     )
+    # Denormalized inbox ordering key, bumped whenever something happens in the chat
+    last_activity_at: Mapped[datetime] = mapped_column(
+        default=func.now(), nullable=False
+    )
+    # Maintained on every membership change, never computed with COUNT(*)
+    member_count: Mapped[int] = mapped_column(default=0, nullable=False)
+    # Per-chat message sequence, allocated with UPDATE ... RETURNING
+    last_message_seq: Mapped[int] = mapped_column(
+        BigInteger, default=0, server_default=text("0"), nullable=False
+    )
+    # Inbox preview of the newest message, written by the same UPDATE
+    last_message_preview: Mapped[Optional[str]] = mapped_column(
+        String(PREVIEW_LENGTH), nullable=True
+    )
+    last_message_sender_id: Mapped[Optional[uuid.UUID]] = mapped_column(nullable=True)
+    last_message_at: Mapped[Optional[datetime]] = mapped_column(nullable=True)
+    # Set by crud.delete_chat; the rows are removed later by the purger
+    deleted_at: Mapped[Optional[datetime]] = mapped_column(nullable=True)
 
+    # Channels can have 100k+ members: never load them implicitly, use
+    # selectinload for small chats or crud.get_chat_members to page through them
     members: Mapped[List["ChatMember"]] = relationship(
         "ChatMember",
         back_populates="chat",
         cascade="all, delete-orphan",
-        lazy="selectin",
+        passive_deletes=True,
+        lazy="raise",
     )
 
     def __repr__(self):
@@ -46,18 +109,242 @@ class Chat(Base):
 
 class ChatMember(Base):
     __tablename__ = "chat_members"
+    __table_args__ = (
+        # Point lookups for access checks and keyset paging of a chat's members
+        UniqueConstraint("chat_id", "user_id", name="uq_chat_members_chat_user"),
+        Index("ix_chat_members_chat_role_user", "chat_id", "role", "user_id"),
+        # Membership subqueries: a user's chat ids without touching the heap
+        Index("ix_chat_members_user_chat", "user_id", "chat_id"),
+        # The inbox: a user's memberships already in page order, read backwards
+        Index(
+            "ix_chat_members_user_activity", "user_id", "last_activity_at", "chat_id"
+        ),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default=uuid.uuid4)
     chat_id: Mapped[uuid.UUID] = mapped_column(
         ForeignKey("chats.id", ondelete="CASCADE"), nullable=False
     )
-    user_id: Mapped[uuid.UUID] = mapped_column(nullable=False, index=True)
+    user_id: Mapped[uuid.UUID] = mapped_column(nullable=False)
     role: Mapped[MemberRole] = mapped_column(
         Enum(MemberRole), default=MemberRole.MEMBER, nullable=False
     )
     joined_at: Mapped[datetime] = mapped_column(default=func.now(), nullable=False)
+    # Copy of Chat.last_activity_at, so the inbox is one range scan of the
+    # user's memberships. Kept in step by services.member_activity
+    last_activity_at: Mapped[datetime] = mapped_column(
+        default=func.now(), nullable=False
+    )
 
     chat: Mapped["Chat"] = relationship("Chat", back_populates="members")
 
     def __repr__(self):
         return f"<ChatMember(chat_id='{self.chat_id}', user_id='{self.user_id}', role='{self.role.name}')>"
+
+
+class Message(Base):
+    """
+    Chat message, range partitioned by month of created_at.
+
+    The primary key leads with (chat_id, seq), so history pages are index range
+    scans on a chat's most recent rows whatever the age of the chat. created_at
+    is part of the key only because Postgres requires the partition key in it;
+    seq alone is unique per chat.
+    """
+
+    __tablename__ = "messages"
+    __table_args__ = ({"postgresql_partition_by": "RANGE (created_at)"},)
+
+    chat_id: Mapped[uuid.UUID] = mapped_column(
+        ForeignKey("chats.id", ondelete="CASCADE"), primary_key=True
+    )
+    seq: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    created_at: Mapped[datetime] = mapped_column(
+        primary_key=True, default=func.now(), nullable=False
+    )
+    id: Mapped[uuid.UUID] = mapped_column(default=uuid.uuid4, nullable=False)
+    sender_id: Mapped[uuid.UUID] = mapped_column(nullable=False)
+    content: Mapped[str] = mapped_column(Text, nullable=False)
+    edited_at: Mapped[Optional[datetime]] = mapped_column(nullable=True)
+    # emoji -> count, maintained with every MessageReaction insert and delete so
+    # that history pages carry their reaction summaries
+    reactions: Mapped[dict] = mapped_column(
+        JSONB, server_default=text("'{}'::jsonb"), nullable=False
+    )
+
+    def __repr__(self):
+        return f"<Message(chat_id='{self.chat_id}', seq='{self.seq}')>"
+
+
+class MessageReaction(Base):
+    """
+    One user's reaction to a message. Counts live on Message.reactions; this
+    table answers "who reacted" and "did I react".
+    """
+
+    __tablename__ = "message_reactions"
+    __table_args__ = (
+        # A user's reactions over a page of seqs, in one range scan
+        Index("ix_message_reactions_chat_user_seq", "chat_id", "user_id", "seq"),
+    )
+
+    chat_id: Mapped[uuid.UUID] = mapped_column(primary_key=True)
+    seq: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    emoji: Mapped[str] = mapped_column(String(32), primary_key=True)
+    user_id: Mapped[uuid.UUID] = mapped_column(primary_key=True)
+    created_at: Mapped[datetime] = mapped_column(default=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<MessageReaction(chat_id='{self.chat_id}', seq='{self.seq}', emoji='{self.emoji}')>"
+
+
+class MessageSearchEntry(Base):
+    """
+    Inverted index over message content. Filled from the chat event stream by
+    services.search_indexer, so it trails the messages table slightly; hits
+    are joined back to messages for their text.
+    """
+
+    __tablename__ = "message_search"
+    __table_args__ = (
+        Index("ix_message_search_document", "document", postgresql_using="gin"),
+    )
+
+    chat_id: Mapped[uuid.UUID] = mapped_column(primary_key=True)
+    seq: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    sender_id: Mapped[uuid.UUID] = mapped_column(nullable=False)
+    # The message's partition key, so the join back to it is pruned
+    created_at: Mapped[datetime] = mapped_column(nullable=False)
+    document: Mapped[str] = mapped_column(TSVECTOR, nullable=False)
+
+    def __repr__(self):
+        return f"<MessageSearchEntry(chat_id='{self.chat_id}', seq='{self.seq}')>"
+
+
+class MessageTombstone(Base):
+    """
+    Seq of a deleted message. Unread counts are last_message_seq minus the read
+    cursor; the tombstones above the cursor are taken off that, so deleted
+    messages are not counted. Deletes are rare, so the table stays small.
+    """
+
+    __tablename__ = "message_tombstones"
+
+    chat_id: Mapped[uuid.UUID] = mapped_column(primary_key=True)
+    seq: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+
+    def __repr__(self):
+        return f"<MessageTombstone(chat_id='{self.chat_id}', seq='{self.seq}')>"
+
+
+# Catches rows outside the monthly partitions created by
+# services.partitions.ensure_message_partitions, so an insert never fails
+event.listen(
+    Message.__table__,
+    "after_create",
+    DDL("CREATE TABLE IF NOT EXISTS messages_default PARTITION OF messages DEFAULT"),
+)
+
+
+class ScheduledMessage(Base):
+    """
+    A message to post at `due_at`. Claiming it deletes the row in the same
+    transaction that inserts the message, so it is delivered exactly once.
+    """
+
+    __tablename__ = "scheduled_messages"
+    __table_args__ = (
+        Index("ix_scheduled_messages_due", "due_at"),
+        Index("ix_scheduled_messages_chat_sender", "chat_id", "sender_id"),
+    )
+
+    id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default=uuid.uuid4)
+    chat_id: Mapped[uuid.UUID] = mapped_column(
+        ForeignKey("chats.id", ondelete="CASCADE"), nullable=False
+    )
+    sender_id: Mapped[uuid.UUID] = mapped_column(nullable=False)
+    content: Mapped[str] = mapped_column(Text, nullable=False)
+    due_at: Mapped[datetime] = mapped_column(nullable=False)
+    created_at: Mapped[datetime] = mapped_column(default=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<ScheduledMessage(id='{self.id}', due_at='{self.due_at}')>"
+
+
+class ReadState(Base):
+    """
+    Durable copy of a user's read cursor in a chat.
+
+    The live cursors are in Redis (services.read_state); this table is written
+    in batches by the flusher and only read to refill Redis.
+    """
+
+    __tablename__ = "read_states"
+    # Keyset deletion of a chat's cursors by the purger
+    __table_args__ = (Index("ix_read_states_chat_user", "chat_id", "user_id"),)
+
+    user_id: Mapped[uuid.UUID] = mapped_column(primary_key=True)
+    chat_id: Mapped[uuid.UUID] = mapped_column(primary_key=True)
+    last_read_seq: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        default=func.now(), onupdate=func.now(), nullable=False
+    )
+
+    def __repr__(self):
+        return f"<ReadState(user_id='{self.user_id}', chat_id='{self.chat_id}', last_read_seq='{self.last_read_seq}')>"
+
+
+class MemberActivityQueue(Base):
+    """
+    Chats whose last_activity_at moved since their members' inbox keys were
+    last brought up to it. Drained by services.member_activity.
+    """
+
+    __tablename__ = "member_activity_queue"
+
+    chat_id: Mapped[uuid.UUID] = mapped_column(primary_key=True)
+    queued_at: Mapped[datetime] = mapped_column(default=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<MemberActivityQueue(chat_id='{self.chat_id}')>"
+
+
+class ChatPurge(Base):
+    """
+    Progress of the background deletion of one chat's rows.
+
+    `phase` names the table being emptied and `cursor` the keyset position
+    reached in it, both committed with every batch, so a restarted purger
+    resumes where the last one stopped. The members are the recipients of the
+    chat_deleted event: their phase waits for `fanned_out_at`.
+    """
+
+    __tablename__ = "chat_purges"
+
+    chat_id: Mapped[uuid.UUID] = mapped_column(primary_key=True)
+    phase: Mapped[str] = mapped_column(String(32), default="messages", nullable=False)
+    cursor: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    deleted_rows: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+    # Set by the fan-out consumer once chat_deleted went out to every member
+    fanned_out_at: Mapped[Optional[datetime]] = mapped_column(nullable=True)
+    created_at: Mapped[datetime] = mapped_column(default=func.now(), nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        default=func.now(), onupdate=func.now(), nullable=False
+    )
+
+    def __repr__(self):
+        return f"<ChatPurge(chat_id='{self.chat_id}', phase='{self.phase}')>"
+
+
+class OutboxEvent(Base):
+    """Domain event written in the same transaction as the change it describes."""
+
+    __tablename__ = "outbox_events"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    event_type: Mapped[str] = mapped_column(String(64), nullable=False)
+    payload: Mapped[dict] = mapped_column(JSON, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(default=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<OutboxEvent(id='{self.id}', event_type='{self.event_type}')>"
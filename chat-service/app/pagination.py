@@ -0,0 +1,23 @@
+import base64
+import json
+from typing import Any, Callable, Tuple
+
+from app.exceptions import AppException
+
+
+def encode_cursor(*values: Any) -> str:
+    """Pack the keyset position of the last returned row into an opaque token."""
+    raw = json.dumps(values, default=str, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor: str, *parsers: Callable[[Any], Any]) -> Tuple[Any, ...]:
+    """Unpack a token from encode_cursor, converting each value with its parser."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(values, list) or len(values) != len(parsers):
+            raise ValueError
+        return tuple(parse(value) for parse, value in zip(parsers, values))
+    except (TypeError, ValueError):
+        raise AppException("Invalid cursor", code="INVALID_CURSOR")
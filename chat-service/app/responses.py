@@ -0,0 +1,32 @@
+import uuid
+from typing import Any
+
+import orjson
+from fastapi.responses import Response
+from sqlalchemy import Row
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, Row):
+        return obj._asdict()
+    # asyncpg returns its own UUID subclass, which orjson does not handle natively
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class RowJSONResponse(Response):
+    """
+    Serializes plain column rows and dicts straight to JSON bytes.
+
+    For list endpoints whose crud functions already select only the rendered
+    columns: returning this response skips response_model validation and
+    jsonable_encoder, so the route's response_model only documents the shape
+    and must be kept in sync with the query by hand. orjson writes UUIDs,
+    datetimes and enums natively, in the same format pydantic would.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_UTC_Z)
@@ -1,8 +1,8 @@
 import uuid
 from datetime import datetime
-from typing import Any, List, Optional
+from typing import Any, Dict, List, Optional
 
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import AwareDatetime, BaseModel, ConfigDict, Field
 
 from app.models import ChatType, MemberRole
 
@@ -35,6 +35,46 @@ class ParticipantAdd(BaseModel):
     user_id: uuid.UUID
 
 
+class ParticipantsBulk(BaseModel):
+    add: List[uuid.UUID] = Field(default_factory=list, max_length=5000)
+    remove: List[uuid.UUID] = Field(default_factory=list, max_length=5000)
+
+
+class BulkParticipantResult(BaseModel):
+    user_id: uuid.UUID
+    status: str
+
+
+class BulkParticipantsResponse(BaseModel):
+    results: List[BulkParticipantResult]
+    # The first settings.bulk_invalid_max rejected tokens, and how many there were
+    invalid: List[str] = []
+    invalid_count: int = 0
+
+
+class MessageCreate(BaseModel):
+    content: str = Field(..., min_length=1, max_length=4096)
+
+
+class ScheduledMessageCreate(BaseModel):
+    content: str = Field(..., min_length=1, max_length=4096)
+    send_at: AwareDatetime
+
+
+class MessageUpdate(BaseModel):
+    content: str = Field(..., min_length=1, max_length=4096)
+
+
+class ReadUpTo(BaseModel):
+    seq: int = Field(..., ge=0)
+
+
+class ReadStateResponse(BaseModel):
+    chat_id: uuid.UUID
+    last_read_seq: int
+    unread_count: int
+
+
 class RoleUpdate(BaseModel):
     role: MemberRole
 
@@ -46,7 +86,7 @@ class ChatResponse(BaseModel):
     name: Optional[str]
     settings: dict
     created_at: datetime
-    members: List[ChatMemberSchema]
+    member_count: int
 
 
 class ChatShortResponse(BaseModel):
@@ -55,6 +95,121 @@ class ChatShortResponse(BaseModel):
     type: ChatType
     name: Optional[str]
     created_at: datetime
+    last_activity_at: datetime
+    last_message_seq: int = 0
+    last_message_preview: Optional[str] = None
+    last_message_sender_id: Optional[uuid.UUID] = None
+    last_message_at: Optional[datetime] = None
+    unread_count: int = 0
+
+
+class ChatBatchRequest(BaseModel):
+    chat_ids: List[uuid.UUID] = Field(..., min_length=1, max_length=500)
+    # Only chats the caller is a member of, instead of those plus public channels
+    member_only: bool = False
+
+
+class ChatMetadata(BaseModel):
+    """Lean projection for hydrating many chats: no members, no settings."""
+
+    model_config = ConfigDict(from_attributes=True)
+    id: uuid.UUID
+    type: ChatType
+    name: Optional[str]
+    description: Optional[str]
+    is_public: bool
+    member_count: int
+    created_at: datetime
+    last_activity_at: datetime
+    last_message_seq: int
+    # The caller's role, None when they are not a member
+    role: Optional[MemberRole] = None
+
+
+class ChatBatchResponse(BaseModel):
+    items: List[ChatMetadata]
+
+
+class ChannelSearchResult(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    id: uuid.UUID
+    type: ChatType
+    name: Optional[str]
+    description: Optional[str]
+    member_count: int
+    created_at: datetime
+    score: float
+
+
+class ChannelSearchPage(BaseModel):
+    items: List[ChannelSearchResult]
+    next_cursor: Optional[str] = None
+
+
+class MessageSearchHit(BaseModel):
+    chat_id: uuid.UUID
+    seq: int
+    sender_id: uuid.UUID
+    created_at: datetime
+    # Matching fragments of the HTML-escaped content, matches in <mark> tags
+    highlight: str
+
+
+class MessageSearchPage(BaseModel):
+    items: List[MessageSearchHit]
+    next_cursor: Optional[str] = None
+
+
+class ChatPage(BaseModel):
+    items: List[ChatShortResponse]
+    next_cursor: Optional[str] = None
+
+
+class MemberPage(BaseModel):
+    items: List[ChatMemberSchema]
+    next_cursor: Optional[str] = None
+
+
+class MessageResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    id: uuid.UUID
+    chat_id: uuid.UUID
+    seq: int
+    sender_id: uuid.UUID
+    content: str
+    created_at: datetime
+    edited_at: Optional[datetime] = None
+    # emoji -> count, and the emojis the caller reacted with
+    reactions: Dict[str, int] = {}
+    my_reactions: List[str] = []
+
+
+class ReactionsResponse(BaseModel):
+    chat_id: uuid.UUID
+    seq: int
+    reactions: Dict[str, int]
+
+
+class ScheduledMessageResponse(BaseModel):
+    id: uuid.UUID
+    chat_id: uuid.UUID
+    sender_id: uuid.UUID
+    content: str
+    due_at: datetime
+    created_at: datetime
+
+
+class ScheduledMessageList(BaseModel):
+    items: List[ScheduledMessageResponse]
+
+
+class MessagePage(BaseModel):
+    items: List[MessageResponse]
+    # Whether more messages exist past the page in the requested direction
+    has_more: bool
+    # Continues in the same direction; unlike a bare seq it lets the query skip
+    # partitions
+    next_cursor: Optional[str] = None
 
 
 class MembershipCheckResponse(BaseModel):
@@ -62,6 +217,24 @@ class MembershipCheckResponse(BaseModel):
     role: Optional[MemberRole] = None
 
 
+class MembershipPair(BaseModel):
+    chat_id: uuid.UUID
+    user_id: uuid.UUID
+
+
+class BatchMembershipCheck(BaseModel):
+    pairs: List[MembershipPair] = Field(..., min_length=1, max_length=1000)
+
+
+class MembershipCheckResult(MembershipCheckResponse):
+    chat_id: uuid.UUID
+    user_id: uuid.UUID
+
+
+class BatchMembershipCheckResponse(BaseModel):
+    results: List[MembershipCheckResult]
+
+
 class TokenData(BaseModel):
     sub: uuid.UUID
     scopes: List[str] = []
@@ -0,0 +1,101 @@
+import uuid
+from typing import AsyncIterator, List, Tuple
+
+from fastapi import UploadFile
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud
+from app.services.membership_cache import MembershipCache
+
+READ_SIZE = 64 * 1024
+# Bytes that end a user id token
+SEPARATORS = (b",", b"\n", b"\r", b" ", b"\t")
+# Longer than any spelling uuid.UUID accepts: flushed as invalid rather than
+# buffered while waiting for a separator
+MAX_TOKEN = 64
+
+
+async def apply_chunk(
+    db: AsyncSession,
+    cache: MembershipCache,
+    chat_id: uuid.UUID,
+    user_ids: List[uuid.UUID],
+    add: bool,
+) -> List[dict]:
+    """
+    Add or remove one chunk of users in its own transaction.
+
+    Emits a single aggregated membership event for the chunk and returns a
+    per-user status.
+    """
+    if add:
+        changed = await crud.add_members(db, chat_id, user_ids)
+        event_type, done, skipped = "participants_added", "added", "already_member"
+    else:
+        changed = await crud.remove_members(db, chat_id, user_ids)
+        event_type, done, skipped = "participants_removed", "removed", "not_removed"
+
+    if changed:
+        crud.add_outbox_event(
+            db,
+            event_type,
+            {"chat_id": str(chat_id), "user_ids": [str(u) for u in changed]},
+        )
+    await db.commit()
+    await cache.invalidate(chat_id, changed)
+
+    changed_set = set(changed)
+    return [
+        {"user_id": user_id, "status": done if user_id in changed_set else skipped}
+        for user_id in user_ids
+    ]
+
+
+async def iter_user_id_chunks(
+    upload: UploadFile, chunk_size: int, max_invalid: int
+) -> AsyncIterator[Tuple[List[uuid.UUID], List[str], int]]:
+    """
+    Stream user ids (one per line or comma separated) from an uploaded file.
+
+    Yields (valid unique ids, rejected tokens, number rejected) per chunk so the
+    whole file never sits in memory. Only the first `max_invalid` rejected
+    tokens of the file are returned, the rest are only counted.
+    """
+    seen = set()
+    user_ids: List[uuid.UUID] = []
+    invalid: List[str] = []
+    rejected = kept = 0
+    tail = b""
+
+    eof = False
+    while not eof:
+        data = await upload.read(READ_SIZE)
+        if data:
+            # Keep a trailing partial token for the next read
+            data = tail + data
+            cut = max(data.rfind(sep) for sep in SEPARATORS) + 1
+            data, tail = data[:cut], data[cut:]
+            if len(tail) > MAX_TOKEN:
+                data, tail = data + b"\n" + tail, b""
+        else:
+            data, tail, eof = tail, b"", True
+
+        for token in data.replace(b",", b"\n").split():
+            try:
+                user_id = uuid.UUID(token.decode("ascii"))
+            except (UnicodeDecodeError, ValueError):
+                rejected += 1
+                if kept < max_invalid:
+                    invalid.append(token.decode("utf-8", errors="replace")[:MAX_TOKEN])
+                    kept += 1
+                continue
+            if user_id in seen:
+                continue
+            seen.add(user_id)
+            user_ids.append(user_id)
+            if len(user_ids) >= chunk_size:
+                yield user_ids, invalid, rejected
+                user_ids, invalid, rejected = [], [], 0
+
+    if user_ids or rejected:
+        yield user_ids, invalid, rejected
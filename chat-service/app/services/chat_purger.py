@@ -0,0 +1,108 @@
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Callable, Optional
+
+from sqlalchemy import delete, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud
+from app.database import get_session_local
+from app.metrics import metrics
+from app.models import Chat, ChatPurge
+from app.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+PHASES = list(crud.PURGE_PHASES) + ["chat"]
+
+
+class ChatPurger:
+    """
+    Background deletion of chats marked deleted by crud.delete_chat.
+
+    Each batch is its own short transaction: lock a job with SKIP LOCKED, delete
+    up to `purge_batch_size` rows by keyset, record the new position, commit.
+    Replicas can run purgers side by side and a restart resumes from the last
+    committed position. The chat row itself goes last, once nothing references
+    it, so the final cascade has nothing left to do.
+
+    The members are who the chat_deleted event is fanned out to, so a job
+    reaching the members phase is skipped until the fan-out consumer has marked
+    it, or `purge_fanout_timeout` after the deletion if it never does.
+    """
+
+    def __init__(self, settings: Settings, session_factory: Optional[Callable] = None):
+        self.settings = settings
+        self.session_factory = session_factory
+
+    async def purge_batch(self, db: AsyncSession) -> Optional[int]:
+        """Run one batch of the oldest unlocked job; None when there is no job."""
+        stmt = (
+            select(ChatPurge)
+            .order_by(ChatPurge.created_at)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+        if self.settings.fanout_enabled:
+            timeout = timedelta(seconds=self.settings.purge_fanout_timeout)
+            stmt = stmt.where(
+                or_(
+                    ChatPurge.phase != "members",
+                    ChatPurge.fanned_out_at.is_not(None),
+                    ChatPurge.created_at < func.now() - timeout,
+                )
+            )
+        job = await db.scalar(stmt)
+        if job is None:
+            await db.commit()
+            return None
+
+        with metrics.timer("purge.batch"):
+            if job.phase == "chat":
+                await db.execute(delete(Chat).where(Chat.id == job.chat_id))
+                await db.delete(job)
+                deleted = 1
+                metrics.inc("purge.chats_purged")
+                logger.info(
+                    f"Chat {job.chat_id} purged, {job.deleted_rows + 1} rows deleted"
+                )
+            else:
+                deleted, cursor = await crud.purge_chat_rows(
+                    db,
+                    job.phase,
+                    job.chat_id,
+                    job.cursor,
+                    self.settings.purge_batch_size,
+                )
+                job.deleted_rows += deleted
+                if deleted < self.settings.purge_batch_size:
+                    job.phase = PHASES[PHASES.index(job.phase) + 1]
+                    job.cursor = None
+                else:
+                    job.cursor = cursor
+            await db.commit()
+
+        metrics.inc("purge.rows_deleted", deleted)
+        return deleted
+
+    async def run(self):
+        session_factory = self.session_factory or get_session_local()
+        while True:
+            try:
+                async with session_factory() as db:
+                    deleted = await self.purge_batch(db)
+                    if deleted is None:
+                        pending = await db.scalar(select(func.count(ChatPurge.chat_id)))
+                        metrics.set_gauge("purge.pending", pending)
+                if deleted is None:
+                    await asyncio.sleep(self.settings.purge_poll_interval)
+                else:
+                    # Throttle, so purging never saturates the database
+                    await asyncio.sleep(self.settings.purge_batch_pause)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Chat purge error: {e}", exc_info=True)
+                metrics.inc("purge.errors")
+                await asyncio.sleep(self.settings.purge_poll_interval)
@@ -0,0 +1,243 @@
+import asyncio
+import logging
+import struct
+import uuid
+from collections import defaultdict
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from aiokafka import AIOKafkaConsumer
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud
+from app.database import get_session_local
+from app.events import EnvelopeError, decode_event
+from app.metrics import metrics
+from app.services.kafka_producer import KafkaProducerService
+from app.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+# Events that change who is in a chat: cached member pages are dropped first
+MEMBERSHIP_EVENTS = {
+    "participant_added",
+    "participant_removed",
+    "participant_left",
+    "participants_added",
+    "participants_removed",
+    "role_updated",
+    "chat_deleted",
+}
+
+# Field of the first page in the member hash
+FIRST_PAGE = "-"
+
+
+class ChatMemberSource:
+    """
+    Member ids of a chat in keyset pages, cached in one Redis hash per chat.
+
+    `fanout:members:{chat_id}` maps the id a page starts after (FIRST_PAGE for
+    the first one) to the comma separated ids of the page. Membership events
+    drop the hash before they are fanned out; the TTL bounds staleness caused
+    by anything else. Redis failures degrade to Postgres pages.
+    """
+
+    def __init__(self, redis_client: Redis, page_size: int, ttl: int):
+        self.redis = redis_client
+        self.page_size = page_size
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(chat_id: uuid.UUID) -> str:
+        return f"fanout:members:{chat_id}"
+
+    async def pages(
+        self, db: AsyncSession, chat_id: uuid.UUID
+    ) -> AsyncIterator[List[uuid.UUID]]:
+        after = None
+        while True:
+            page = await self._page(db, chat_id, after)
+            if page:
+                yield page
+            if len(page) < self.page_size:
+                return
+            after = page[-1]
+
+    async def invalidate(self, chat_id: uuid.UUID):
+        try:
+            await self.redis.delete(self._key(chat_id))
+        except RedisError as e:
+            logger.error(f"Member page invalidation failed for {chat_id}: {e}")
+            metrics.inc("fanout.cache_errors")
+
+    async def _page(
+        self, db: AsyncSession, chat_id: uuid.UUID, after: Optional[uuid.UUID]
+    ) -> List[uuid.UUID]:
+        key, field = self._key(chat_id), str(after) if after else FIRST_PAGE
+        try:
+            cached = await self.redis.hget(key, field)
+        except RedisError as e:
+            logger.error(f"Member page read failed for {chat_id}: {e}")
+            metrics.inc("fanout.cache_errors")
+            cached = None
+        if cached is not None:
+            metrics.inc("fanout.cache_hits")
+            return [uuid.UUID(user_id) for user_id in cached.split(",") if user_id]
+
+        metrics.inc("fanout.cache_misses")
+        page = await crud.get_member_ids_page(db, chat_id, after, self.page_size)
+        # Do not hold a snapshot while the page is being published
+        await db.commit()
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.hset(key, field, ",".join(str(user_id) for user_id in page))
+                pipe.expire(key, self.ttl)
+                await pipe.execute()
+        except RedisError as e:
+            logger.error(f"Member page write failed for {chat_id}: {e}")
+            metrics.inc("fanout.cache_errors")
+        return page
+
+
+def departed_recipients(event_type: str, data: dict) -> List[str]:
+    """Users the event concerns who are no longer members by the time it is fanned out."""
+    if event_type in ("participant_removed", "participant_left"):
+        return [data["user_id"]]
+    if event_type == "participants_removed":
+        return list(data["user_ids"])
+    return []
+
+
+class FanoutConsumer:
+    """
+    Turns chat events into websocket delivery records.
+
+    Chat events only name the chat; the websocket workers need recipients. For
+    each event the members are read page by page and sent to
+    `kafka_topic_messages` as records of at most `fanout_chunk_size`
+    recipients, keyed by chat like the events themselves so one chat's
+    deliveries stay in order.
+
+    Backpressure: each page's records are acked by the broker before the next
+    page is read, at most `fanout_concurrency` chats are fanned out at once, and
+    the next poll waits until the whole batch is published. Offsets are
+    committed after that, so delivery is at-least-once; a failed batch is
+    replayed from the last commit.
+    """
+
+    def __init__(
+        self,
+        producer: KafkaProducerService,
+        members: ChatMemberSource,
+        settings: Settings,
+        session_factory: Optional[Callable] = None,
+    ):
+        self.producer = producer
+        self.members = members
+        self.settings = settings
+        self.session_factory = session_factory
+        self._slots = asyncio.Semaphore(settings.fanout_concurrency)
+
+    async def handle(self, records: list) -> int:
+        """Fan out one polled batch and return the number of delivery records sent."""
+        by_chat: Dict[str, List[tuple]] = defaultdict(list)
+        for record in records:
+            try:
+                event_type, data = decode_event(record.value)
+            except (EnvelopeError, ValueError, KeyError, struct.error) as e:
+                logger.error(f"Skipping undecodable chat event: {e}")
+                metrics.inc("fanout.undecodable")
+                continue
+            if isinstance(data, dict) and data.get("chat_id"):
+                by_chat[data["chat_id"]].append((event_type, data))
+
+        sent = await asyncio.gather(
+            *(self._fan_out_chat(events) for events in by_chat.values())
+        )
+        return sum(sent)
+
+    async def _fan_out_chat(self, events: List[tuple]) -> int:
+        session_factory = self.session_factory or get_session_local()
+        sent = 0
+        async with self._slots:
+            async with session_factory() as db:
+                for event_type, data in events:
+                    sent += await self.fan_out(db, event_type, data)
+        return sent
+
+    async def fan_out(self, db: AsyncSession, event_type: str, data: dict) -> int:
+        chat_id = uuid.UUID(data["chat_id"])
+        if event_type in MEMBERSHIP_EVENTS:
+            await self.members.invalidate(chat_id)
+
+        sent = 0
+        departed = departed_recipients(event_type, data)
+        if departed:
+            sent += await self._publish(event_type, data, departed)
+        async for page in self.members.pages(db, chat_id):
+            sent += await self._publish(
+                event_type, data, [str(user_id) for user_id in page]
+            )
+        if event_type == "chat_deleted":
+            # Every member was told: the purger may delete them now
+            await crud.mark_chat_fanned_out(db, chat_id)
+            await db.commit()
+
+        metrics.inc("fanout.events")
+        return sent
+
+    async def _publish(self, event_type: str, data: dict, recipients: List[str]) -> int:
+        size = self.settings.fanout_chunk_size
+        deliveries = [
+            (
+                "delivery",
+                {
+                    "type": event_type,
+                    "chat_id": data["chat_id"],
+                    "recipients": recipients[i : i + size],
+                    "payload": data,
+                },
+            )
+            for i in range(0, len(recipients), size)
+        ]
+        await self.producer.publish_batch(
+            deliveries, topic=self.settings.kafka_topic_messages
+        )
+        metrics.inc("fanout.records", len(deliveries))
+        metrics.inc("fanout.recipients", len(recipients))
+        return len(deliveries)
+
+    async def run(self):
+        consumer = AIOKafkaConsumer(
+            self.settings.kafka_topic_chats,
+            bootstrap_servers=self.settings.kafka_bootstrap_servers,
+            group_id=self.settings.fanout_group_id,
+            enable_auto_commit=False,
+            auto_offset_reset="earliest",
+        )
+        await consumer.start()
+        logger.info("Fan-out consumer started")
+        try:
+            while True:
+                batches = await consumer.getmany(
+                    timeout_ms=1000, max_records=self.settings.fanout_max_records
+                )
+                records = [record for batch in batches.values() for record in batch]
+                if not records:
+                    continue
+                try:
+                    with metrics.timer("fanout.batch"):
+                        await self.handle(records)
+                    await consumer.commit()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Fan-out error: {e}", exc_info=True)
+                    metrics.inc("fanout.errors")
+                    await consumer.seek_to_committed()
+                    await asyncio.sleep(1)
+        finally:
+            await consumer.stop()
+            logger.info("Fan-out consumer stopped")
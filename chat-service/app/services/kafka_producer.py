@@ -1,9 +1,11 @@
-import json
+import asyncio
 import logging
-from typing import Optional
+from typing import List, Optional, Tuple
 
 from aiokafka import AIOKafkaProducer
 
+from app.events import encode_event, partition_key
+from app.metrics import metrics
 from app.settings import Settings, get_settings
 
 logger = logging.getLogger(__name__)
@@ -17,25 +19,43 @@ class KafkaProducerService:
     async def start(self):
         if not self.producer:
             self.producer = AIOKafkaProducer(
-                bootstrap_servers=self.settings.kafka_bootstrap_servers
+                bootstrap_servers=self.settings.kafka_bootstrap_servers,
+                linger_ms=self.settings.kafka_linger_ms,
+                max_batch_size=self.settings.kafka_max_batch_size,
+                compression_type=self.settings.kafka_compression_type,
             )
             await self.producer.start()
             logger.info("Kafka Producer started")
 
     async def stop(self):
         if self.producer:
+            await self.flush()
             await self.producer.stop()
+            self.producer = None
             logger.info("Kafka Producer stopped")
 
-    async def publish_event(self, event_type: str, data: dict):
+    async def flush(self):
+        if self.producer:
+            await self.producer.flush()
+
+    async def publish_batch(
+        self, events: List[Tuple[str, dict]], topic: Optional[str] = None
+    ):
+        """Send events in order and wait until the broker acked all of them."""
         if not self.producer:
             await self.start()
 
-        payload = {"event_type": event_type, "data": data}
-        await self.producer.send_and_wait(
-            self.settings.kafka_topic_chats,
-            json.dumps(payload, default=str).encode("utf-8"),
-        )
+        futures = []
+        for event_type, data in events:
+            futures.append(
+                await self.producer.send(
+                    topic or self.settings.kafka_topic_chats,
+                    encode_event(event_type, data, self.settings.kafka_event_format),
+                    key=partition_key(data),
+                )
+            )
+        await asyncio.gather(*futures)
+        metrics.inc("kafka.delivered", len(futures))
 
 
 producer_service = KafkaProducerService(get_settings())
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+from typing import Callable, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud
+from app.database import get_session_local
+from app.metrics import metrics
+from app.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+
+class MemberActivitySync:
+    """
+    Moves the members' inbox keys up to their chat's last_activity_at.
+
+    Rewriting every member row of a chat on each send would put up to a
+    channel's worth of index writes in the send transaction, under the chat
+    row lock. Senders only queue the chat instead, a no-op while it is queued.
+    Every `member_activity_interval` the queue is drained: each claimed chat
+    has its member rows brought up to date in keyset batches of
+    `member_activity_batch`, one short transaction each. A busy chat is
+    rewritten at most once per interval however many messages it gets, and
+    its members always end up at its latest activity.
+
+    Replicas claim chats with SKIP LOCKED. A chat claimed by a replica that
+    dies before syncing it catches up with its next activity.
+    """
+
+    def __init__(self, settings: Settings, session_factory: Optional[Callable] = None):
+        self.settings = settings
+        self.session_factory = session_factory
+
+    async def sync_once(self, db: AsyncSession) -> int:
+        """Sync one claimed batch of chats and return how many were claimed."""
+        chat_ids = await crud.claim_member_activity(
+            db, self.settings.member_activity_claim_batch
+        )
+        await db.commit()
+        batch_size = self.settings.member_activity_batch
+        with metrics.timer("member_activity.sync"):
+            for chat_id in chat_ids:
+                after = None
+                while True:
+                    read, after = await crud.sync_member_activity(
+                        db, chat_id, after, batch_size
+                    )
+                    await db.commit()
+                    metrics.inc("member_activity.members", read)
+                    if read < batch_size:
+                        break
+        metrics.inc("member_activity.chats", len(chat_ids))
+        return len(chat_ids)
+
+    async def run(self):
+        session_factory = self.session_factory or get_session_local()
+        claim_batch = self.settings.member_activity_claim_batch
+        while True:
+            try:
+                async with session_factory() as db:
+                    while await self.sync_once(db) == claim_batch:
+                        pass
+                await asyncio.sleep(self.settings.member_activity_interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Member activity sync error: {e}", exc_info=True)
+                metrics.inc("member_activity.errors")
+                await asyncio.sleep(self.settings.member_activity_interval)
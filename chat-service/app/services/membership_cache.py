@@ -0,0 +1,202 @@
+import logging
+import uuid
+from collections import defaultdict
+from typing import Annotated, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import Depends
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud
+from app.database import get_redis_client
+from app.metrics import metrics
+from app.models import MemberRole
+from app.settings import Settings, get_settings
+
+logger = logging.getLogger(__name__)
+
+Pair = Tuple[uuid.UUID, uuid.UUID]
+
+# Cached negative answer, so probing non-members does not hit Postgres either
+NOT_MEMBER = "-"
+# Hash field holding a random token replaced by every invalidation
+GENERATION = "#gen"
+
+# Writes answers read from Postgres, unless the chat was invalidated since.
+# KEYS: membership hash. ARGV: generation seen before the read ("" if none),
+# ttl, then user id / value pairs.
+FILL_SCRIPT = """
+if (redis.call("HGET", KEYS[1], "#gen") or "") ~= ARGV[1] then
+    return 0
+end
+local fields = {}
+for i = 3, #ARGV, 2 do
+    redis.call("HSET", KEYS[1], ARGV[i], ARGV[i + 1])
+    fields[#fields + 1] = ARGV[i]
+end
+redis.call("HEXPIRE", KEYS[1], ARGV[2], "FIELDS", #fields, unpack(fields))
+redis.call("EXPIRE", KEYS[1], ARGV[2])
+return 1
+"""
+
+# Drops answers and starts a new generation.
+# KEYS: membership hash. ARGV: new generation, ttl, then the user ids to drop;
+# none drops the whole hash.
+INVALIDATE_SCRIPT = """
+if #ARGV > 2 then
+    redis.call("HDEL", KEYS[1], unpack(ARGV, 3))
+else
+    redis.call("DEL", KEYS[1])
+end
+redis.call("HSET", KEYS[1], "#gen", ARGV[1])
+redis.call("EXPIRE", KEYS[1], ARGV[2])
+"""
+
+
+class MembershipCache:
+    """
+    (chat, user) -> role lookups backed by one Redis hash per chat.
+
+    `membership:{chat_id}` maps user ids to a role name or NOT_MEMBER. Mutations
+    drop the affected fields after commit and deleting a chat drops the whole
+    hash. Both also replace the hash's GENERATION token, which a lookup reads
+    along with the answers: a miss is only written back if the token is still
+    the one seen before Postgres was read, so a lookup racing with a mutation
+    cannot cache the answer from before it. Redis failures degrade to Postgres
+    lookups.
+    """
+
+    def __init__(self, redis_client: Redis, ttl: int):
+        self.redis = redis_client
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(chat_id: uuid.UUID) -> str:
+        return f"membership:{chat_id}"
+
+    async def lookup(
+        self, db: AsyncSession, pairs: Iterable[Pair]
+    ) -> Dict[Pair, Optional[MemberRole]]:
+        pairs = list(dict.fromkeys(pairs))
+        with metrics.timer("membership.lookup"):
+            cached, generations = await self._get_many(pairs)
+            misses = [pair for pair in pairs if pair not in cached]
+
+            metrics.inc("membership_cache.hits", len(cached))
+            metrics.inc("membership_cache.misses", len(misses))
+            lookups = (
+                metrics.counters["membership_cache.hits"]
+                + metrics.counters["membership_cache.misses"]
+            )
+            metrics.set_gauge(
+                "membership_cache.hit_ratio",
+                metrics.counters["membership_cache.hits"] / lookups if lookups else 0.0,
+            )
+
+            result: Dict[Pair, Optional[MemberRole]] = {
+                pair: None if value == NOT_MEMBER else MemberRole(value)
+                for pair, value in cached.items()
+            }
+            if misses:
+                roles = await crud.get_member_roles(db, misses)
+                loaded = {pair: roles.get(pair) for pair in misses}
+                await self._set_many(loaded, generations)
+                result.update(loaded)
+
+        return result
+
+    async def get_role(
+        self, db: AsyncSession, chat_id: uuid.UUID, user_id: uuid.UUID
+    ) -> Optional[MemberRole]:
+        return (await self.lookup(db, [(chat_id, user_id)]))[(chat_id, user_id)]
+
+    async def invalidate(self, chat_id: uuid.UUID, user_ids: Iterable[uuid.UUID]):
+        fields = [str(user_id) for user_id in user_ids]
+        if fields:
+            await self._invalidate(chat_id, fields)
+
+    async def invalidate_chat(self, chat_id: uuid.UUID):
+        await self._invalidate(chat_id, [])
+
+    async def _invalidate(self, chat_id: uuid.UUID, fields: List[str]):
+        try:
+            await self.redis.eval(
+                INVALIDATE_SCRIPT,
+                1,
+                self._key(chat_id),
+                uuid.uuid4().hex,
+                self.ttl,
+                *fields,
+            )
+        except RedisError as e:
+            logger.error(f"Membership cache invalidation failed for {chat_id}: {e}")
+            metrics.inc("membership_cache.errors")
+
+    async def _get_many(
+        self, pairs: List[Pair]
+    ) -> Tuple[Dict[Pair, str], Dict[uuid.UUID, str]]:
+        """Cached answers, and the generation of each chat ("" if it has none)."""
+        by_chat: Dict[uuid.UUID, List[uuid.UUID]] = defaultdict(list)
+        for chat_id, user_id in pairs:
+            by_chat[chat_id].append(user_id)
+
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for chat_id, user_ids in by_chat.items():
+                    pipe.hmget(
+                        self._key(chat_id), [str(u) for u in user_ids] + [GENERATION]
+                    )
+                replies = await pipe.execute()
+        except RedisError as e:
+            logger.error(f"Membership cache read failed: {e}")
+            metrics.inc("membership_cache.errors")
+            return {}, {}
+
+        found: Dict[Pair, str] = {}
+        generations: Dict[uuid.UUID, str] = {}
+        for (chat_id, user_ids), values in zip(by_chat.items(), replies):
+            for user_id, value in zip(user_ids, values):
+                if value is not None:
+                    found[(chat_id, user_id)] = value
+            generations[chat_id] = values[len(user_ids)] or ""
+        return found, generations
+
+    async def _set_many(
+        self,
+        entries: Dict[Pair, Optional[MemberRole]],
+        generations: Dict[uuid.UUID, str],
+    ):
+        by_chat: Dict[uuid.UUID, List[str]] = defaultdict(list)
+        for (chat_id, user_id), role in entries.items():
+            by_chat[chat_id] += [str(user_id), role.value if role else NOT_MEMBER]
+
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for chat_id, fields in by_chat.items():
+                    # A chat whose generation could not be read is not cached
+                    if chat_id not in generations:
+                        continue
+                    # Per-field TTL: a busy chat's hash is rewritten constantly,
+                    # but every individual answer still ages out
+                    pipe.eval(
+                        FILL_SCRIPT,
+                        1,
+                        self._key(chat_id),
+                        generations[chat_id],
+                        self.ttl,
+                        *fields,
+                    )
+                replies = await pipe.execute()
+        except RedisError as e:
+            logger.error(f"Membership cache write failed: {e}")
+            metrics.inc("membership_cache.errors")
+            return
+        metrics.inc("membership_cache.stale_fills", replies.count(0))
+
+
+def get_membership_cache(
+    redis_client: Annotated[Redis, Depends(get_redis_client)],
+    settings: Annotated[Settings, Depends(get_settings)],
+) -> MembershipCache:
+    return MembershipCache(redis_client, settings.membership_cache_ttl)
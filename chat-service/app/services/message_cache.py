@@ -0,0 +1,264 @@
+import json
+import logging
+import uuid
+from datetime import datetime
+from typing import Annotated, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import Depends
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from sqlalchemy import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud
+from app.database import get_redis_client
+from app.metrics import metrics
+from app.settings import Settings, get_settings
+
+logger = logging.getLogger(__name__)
+
+LAST = "last"
+FLOOR = "floor"
+# Random token replaced by every invalidation
+GENERATION = "gen"
+
+# Merges a populate into the hash, unless it was invalidated since the read
+# that missed. KEYS: tail hash. ARGV: generation seen by that read ("" if
+# none), ttl, then field / value pairs.
+POPULATE_SCRIPT = """
+if (redis.call("HGET", KEYS[1], "gen") or "") ~= ARGV[1] then
+    return 0
+end
+for i = 3, #ARGV, 2 do
+    redis.call("HSET", KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call("EXPIRE", KEYS[1], ARGV[2])
+return 1
+"""
+
+# Swaps the reaction counts of a cached message, unless a later version was
+# written already; "r:{seq}" holds the version. Also starts a new generation, so
+# a populate that read the old counts is dropped. KEYS: tail hash. ARGV: seq,
+# version, counts JSON, new generation.
+REACTIONS_SCRIPT = """
+local entry = redis.call("HGET", KEYS[1], ARGV[1])
+if not entry then
+    return 0
+end
+local version_field = "r:" .. ARGV[1]
+if tonumber(ARGV[2]) <= tonumber(redis.call("HGET", KEYS[1], version_field) or "0") then
+    return 0
+end
+local message = cjson.decode(entry)
+local reactions = cjson.decode(ARGV[3])
+-- An empty table could encode as an array: leave the field out instead, it
+-- defaults to no reactions
+if next(reactions) == nil then
+    reactions = nil
+end
+message["reactions"] = reactions
+redis.call("HSET", KEYS[1], ARGV[1], cjson.encode(message), version_field, ARGV[2])
+redis.call("HSET", KEYS[1], "gen", ARGV[4])
+return 1
+"""
+
+# Drops the tail and starts a new generation. KEYS: tail hash.
+# ARGV: new generation, ttl.
+INVALIDATE_SCRIPT = """
+redis.call("DEL", KEYS[1])
+redis.call("HSET", KEYS[1], "gen", ARGV[1])
+redis.call("EXPIRE", KEYS[1], ARGV[2])
+"""
+
+
+class MessageTailCache:
+    """
+    The last `size` messages of each active chat, one Redis hash per chat.
+
+    `messages:tail:{chat_id}` maps seq -> message JSON, plus two markers: LAST,
+    the newest seq written, and FLOOR, the seq below which a miss populated
+    nothing (0 when the whole history fit). The tail covers the seqs above
+    max(FLOOR, LAST - size); writers append and drop what falls out of that
+    window. A hash is only trusted when its newest message is LAST: writers
+    racing each other or a concurrent populate leave them disagreeing, which
+    reads as a miss and repopulates. Writers never set FLOOR, so a hash they
+    create after an eviction is ignored until the next miss fills it.
+
+    Every write renews the TTL, so chats without activity fall out of Redis on
+    their own; it bounds nothing else, a busy chat's hash never expires. Edits
+    and deletes therefore drop the whole hash after their commit and replace
+    its GENERATION token. Reactions only swap the counts of their message in
+    place, ordered by the version crud.add_reaction returns, and also replace
+    the token. A populate is only merged if the token is still the
+    one its missing read saw, so a populate that read the old text before the
+    edit committed cannot write it back.
+    """
+
+    def __init__(self, redis_client: Redis, size: int, ttl: int):
+        self.redis = redis_client
+        self.size = size
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(chat_id: uuid.UUID) -> str:
+        return f"messages:tail:{chat_id}"
+
+    async def page(
+        self,
+        db: AsyncSession,
+        chat_id: uuid.UUID,
+        limit: int,
+        before: Optional[int] = None,
+        after: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> List:
+        """Same contract as crud.get_messages, served from the tail when it covers the page."""
+        with metrics.timer("message_tail.page"):
+            tail, generation = await self._read(chat_id)
+            if tail is None:
+                self._record(hit=False)
+                tail = await self._populate(db, chat_id, generation)
+            else:
+                self._record(hit=True)
+
+            messages, low = tail
+            if after is not None:
+                if after >= low:
+                    return [m for m in messages if m["seq"] > after][:limit]
+            else:
+                older = [m for m in messages if before is None or m["seq"] < before]
+                if len(older) >= limit or low == 0:
+                    return older[-limit:]
+
+            metrics.inc("message_tail.beyond")
+            return await crud.get_messages(
+                db, chat_id, limit, before, after, since, until
+            )
+
+    async def append(self, chat_id: uuid.UUID, rows: Sequence[Row]):
+        """Add freshly committed messages of one chat, in seq order."""
+        if not rows:
+            return
+        key = self._key(chat_id)
+        mapping = {str(row.seq): self._dump(row) for row in rows}
+        mapping[LAST] = rows[-1].seq
+        expired = [
+            field
+            for row in rows
+            if row.seq > self.size
+            for field in (str(row.seq - self.size), f"r:{row.seq - self.size}")
+        ]
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.hset(key, mapping=mapping)
+                if expired:
+                    pipe.hdel(key, *expired)
+                pipe.expire(key, self.ttl)
+                await pipe.execute()
+        except RedisError as e:
+            logger.error(f"Message tail append failed for {chat_id}: {e}")
+            metrics.inc("message_tail.errors")
+            # A tail missing this write must not be served
+            await self.invalidate(chat_id)
+
+    async def set_reactions(
+        self, chat_id: uuid.UUID, seq: int, reactions: dict, version: int
+    ):
+        """Write committed reaction counts into the message's cached entry, if any."""
+        try:
+            await self.redis.eval(
+                REACTIONS_SCRIPT,
+                1,
+                self._key(chat_id),
+                seq,
+                version,
+                json.dumps(reactions, separators=(",", ":")),
+                uuid.uuid4().hex,
+            )
+        except RedisError as e:
+            logger.error(f"Message tail reaction update failed for {chat_id}: {e}")
+            metrics.inc("message_tail.errors")
+            # A tail missing this write must not be served
+            await self.invalidate(chat_id)
+
+    async def invalidate(self, chat_id: uuid.UUID):
+        try:
+            await self.redis.eval(
+                INVALIDATE_SCRIPT, 1, self._key(chat_id), uuid.uuid4().hex, self.ttl
+            )
+        except RedisError as e:
+            logger.error(f"Message tail invalidation failed for {chat_id}: {e}")
+            metrics.inc("message_tail.errors")
+
+    async def _read(self, chat_id: uuid.UUID) -> Tuple[Optional[tuple], Optional[str]]:
+        """(messages, low) or None on a miss, and the generation seen (None if unknown)."""
+        try:
+            fields = await self.redis.hgetall(self._key(chat_id))
+        except RedisError as e:
+            logger.error(f"Message tail read failed for {chat_id}: {e}")
+            metrics.inc("message_tail.errors")
+            return None, None
+
+        generation = fields.get(GENERATION, "")
+        if FLOOR not in fields or LAST not in fields:
+            return None, generation
+        floor, last = int(fields[FLOOR]), int(fields[LAST])
+        low = max(floor, last - self.size)
+        seqs = sorted(int(seq) for seq in fields if seq.isdigit() and int(seq) > low)
+        if (seqs[-1] if seqs else floor) != last:
+            return None, generation
+        return ([json.loads(fields[str(seq)]) for seq in seqs], low), generation
+
+    async def _populate(
+        self, db: AsyncSession, chat_id: uuid.UUID, generation: Optional[str]
+    ) -> tuple:
+        rows = await crud.get_messages(db, chat_id, self.size)
+        floor = rows[0].seq - 1 if len(rows) == self.size else 0
+        last = rows[-1].seq if rows else 0
+
+        mapping: Dict[str, object] = {str(row.seq): self._dump(row) for row in rows}
+        mapping.update({FLOOR: floor, LAST: last})
+        # Nothing is written when the read failed: the generation is unknown
+        if generation is not None:
+            try:
+                # Merge rather than replace: a message appended since the query
+                # above must survive, so that LAST disagrees and the next read
+                # repopulates
+                merged = await self.redis.eval(
+                    POPULATE_SCRIPT,
+                    1,
+                    self._key(chat_id),
+                    generation,
+                    self.ttl,
+                    *(item for pair in mapping.items() for item in pair),
+                )
+                if merged == 0:
+                    metrics.inc("message_tail.stale_populates")
+            except RedisError as e:
+                logger.error(f"Message tail populate failed for {chat_id}: {e}")
+                metrics.inc("message_tail.errors")
+
+        # Seq gaps left by deleted messages can put some rows below the window
+        low = max(floor, last - self.size)
+        return [json.loads(mapping[str(row.seq)]) for row in rows if row.seq > low], low
+
+    @staticmethod
+    def _dump(row: Row) -> str:
+        return json.dumps(row._asdict(), default=str, separators=(",", ":"))
+
+    @staticmethod
+    def _record(hit: bool):
+        metrics.inc("message_tail.hits" if hit else "message_tail.misses")
+        hits = metrics.counters["message_tail.hits"]
+        lookups = hits + metrics.counters["message_tail.misses"]
+        metrics.set_gauge("message_tail.hit_ratio", hits / lookups)
+
+
+def get_message_tail_cache(
+    redis_client: Annotated[Redis, Depends(get_redis_client)],
+    settings: Annotated[Settings, Depends(get_settings)],
+) -> MessageTailCache:
+    return MessageTailCache(
+        redis_client, settings.message_tail_size, settings.message_tail_ttl
+    )
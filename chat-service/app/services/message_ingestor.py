@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, field
+from itertools import repeat
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import Row
+
+from app import crud
+from app.database import get_session_local
+from app.exceptions import AppException
+from app.metrics import metrics
+from app.services.message_cache import MessageTailCache
+from app.services.read_state import ReadCursorStore, sender_cursors
+from app.settings import Settings, get_settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PendingMessage:
+    chat_id: uuid.UUID
+    sender_id: uuid.UUID
+    content: str
+    future: asyncio.Future = field(repr=False)
+
+
+class MessageIngestor:
+    """
+    Group commit for the message send path.
+
+    Senders enqueue messages and wait; a single writer task drains the queue
+    into batches of up to `ingest_batch_size` messages or whatever arrived
+    within `ingest_max_delay` of the first one, and writes each batch in one
+    transaction: one fsync per batch instead of one per message. Senders are
+    resolved only after the commit. The batch's message_created events are
+    committed to the outbox with it and go to Kafka in one publish_batch.
+    """
+
+    def __init__(self, settings: Settings, session_factory: Optional[Callable] = None):
+        self.settings = settings
+        self.session_factory = session_factory
+        # Called after every committed batch, e.g. to wake the outbox relay
+        self.on_commit: Optional[Callable[[], None]] = None
+        # Receives every committed message, so open chats read from Redis
+        self.tail_cache: Optional[MessageTailCache] = None
+        # Senders have read everything up to their own message
+        self.read_cursors: Optional[ReadCursorStore] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # The batch being collected, where stop() can still find it
+        self._batch: List[PendingMessage] = []
+        self._inflight: Optional[asyncio.Future] = None
+
+    def start(self):
+        if not self._task:
+            self._queue = asyncio.Queue(maxsize=self.settings.ingest_queue_size)
+            self._task = asyncio.create_task(self.run())
+            logger.info("Message ingestor started")
+
+    async def stop(self):
+        if not self._task:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._inflight:
+            await self._inflight
+
+        # Whatever was accepted before shutdown still gets written, starting
+        # with the batch the writer was collecting when it was cancelled
+        if self._batch:
+            batch, self._batch = self._batch, []
+            await self._flush(batch)
+        while not self._queue.empty():
+            await self._flush(self._take_nowait([], self.settings.ingest_batch_size))
+        logger.info("Message ingestor stopped")
+
+    async def submit(
+        self, chat_id: uuid.UUID, sender_id: uuid.UUID, content: str
+    ) -> Optional[Row]:
+        """
+        Queue a message and wait until it is committed. Returns the stored row,
+        or None if the chat does not exist.
+        """
+        if not self._task:
+            self.start()
+
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait(PendingMessage(chat_id, sender_id, content, future))
+        except asyncio.QueueFull:
+            metrics.inc("ingest.rejected")
+            raise AppException(
+                "Too many messages in flight, retry later",
+                code="INGEST_OVERLOADED",
+                status_code=503,
+            )
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        batch_size = self.settings.ingest_batch_size
+        while True:
+            self._batch = batch = [await self._queue.get()]
+            deadline = loop.time() + self.settings.ingest_max_delay
+            while len(batch) < batch_size:
+                self._take_nowait(batch, batch_size)
+                timeout = deadline - loop.time()
+                if len(batch) >= batch_size or timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # A batch being committed is not abandoned on shutdown
+            self._batch = []
+            self._inflight = asyncio.ensure_future(self._flush(batch))
+            await asyncio.shield(self._inflight)
+            self._inflight = None
+
+    def _take_nowait(self, batch: List[PendingMessage], limit: int):
+        while len(batch) < limit and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _flush(self, batch: List[PendingMessage]):
+        by_chat: Dict[uuid.UUID, List[PendingMessage]] = defaultdict(list)
+        for message in batch:
+            by_chat[message.chat_id].append(message)
+
+        stored: Dict[uuid.UUID, List[Row]] = {}
+        try:
+            with metrics.timer("ingest.flush"):
+                stored = await self._write(by_chat)
+        except Exception as e:
+            logger.error(f"Message batch of {len(batch)} failed: {e!r}")
+            if len(by_chat) == 1:
+                self._fail(batch, e)
+                return
+            # Retry chat by chat, so one bad message only fails its own chat
+            for chat_id, messages in by_chat.items():
+                try:
+                    stored.update(await self._write({chat_id: messages}))
+                except Exception as e:
+                    self._fail(messages, e)
+
+        # Outside the retries: a committed batch is never written twice
+        for chat_id, rows in stored.items():
+            metrics.inc("ingest.messages", len(rows))
+            await self._after_commit(chat_id, rows)
+            # No rows: the chat does not exist
+            for message, row in zip(by_chat[chat_id], rows or repeat(None)):
+                if not message.future.done():
+                    message.future.set_result(row)
+
+        metrics.inc("ingest.batches")
+        metrics.set_gauge("ingest.last_batch_size", len(batch))
+        if self.on_commit:
+            self.on_commit()
+
+    async def _write(
+        self, by_chat: Dict[uuid.UUID, List[PendingMessage]]
+    ) -> Dict[uuid.UUID, List[Row]]:
+        """Store the messages of each chat in one transaction and return the rows."""
+        stored: Dict[uuid.UUID, List[Row]] = {}
+        session_factory = self.session_factory or get_session_local()
+        async with session_factory() as db:
+            try:
+                # Fixed lock order on chat rows, so concurrent writers of
+                # overlapping chats cannot deadlock
+                for chat_id in sorted(by_chat):
+                    stored[chat_id] = await crud.create_messages(
+                        db,
+                        chat_id,
+                        [(m.sender_id, m.content) for m in by_chat[chat_id]],
+                    )
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+        return stored
+
+    async def _after_commit(self, chat_id: uuid.UUID, rows: List[Row]):
+        """Update the tail cache and read cursors; the messages are stored either way."""
+        if not rows:
+            return
+        try:
+            if self.tail_cache:
+                await self.tail_cache.append(chat_id, rows)
+        except Exception as e:
+            logger.error(f"Message tail update failed for {chat_id}: {e!r}")
+            metrics.inc("ingest.side_effect_errors")
+        try:
+            if self.read_cursors:
+                await self.read_cursors.advance_many(sender_cursors(rows))
+        except Exception as e:
+            logger.error(f"Read cursor update failed for {chat_id}: {e!r}")
+            metrics.inc("ingest.side_effect_errors")
+
+    @staticmethod
+    def _fail(messages: List[PendingMessage], error: Exception):
+        metrics.inc("ingest.failed", len(messages))
+        for message in messages:
+            if not message.future.done():
+                message.future.set_exception(error)
+
+
+message_ingestor = MessageIngestor(get_settings())
+
+
+def get_message_ingestor() -> MessageIngestor:
+    return message_ingestor
@@ -0,0 +1,167 @@
+import asyncio
+import heapq
+import logging
+import uuid
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud
+from app.database import get_session_local
+from app.metrics import metrics
+from app.services.message_cache import MessageTailCache
+from app.services.read_state import ReadCursorStore, sender_cursors
+from app.settings import Settings, get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class MessageScheduler:
+    """
+    Posts scheduled messages when they fall due.
+
+    Instead of polling the table, the scheduler keeps a min-heap of the due
+    times in the next `schedule_window` seconds, reloaded from the due_at index
+    every half window, and sleeps until the earliest one. Schedules created on
+    this replica are pushed into the heap directly.
+
+    When a due time comes up, the due rows are claimed in batches: one
+    DELETE ... FOR UPDATE SKIP LOCKED, with the messages inserted in the same
+    transaction. Replicas share the work without waiting on each other and a
+    schedule is posted exactly once. The claim re-checks the sending rules:
+    schedules of senders who may no longer post are claimed and dropped. A
+    claim takes every due row, not just the ones in this replica's heap, so
+    the schedules of a replica that died are posted at the next reload at the
+    latest.
+    """
+
+    def __init__(self, settings: Settings, session_factory: Optional[Callable] = None):
+        self.settings = settings
+        self.session_factory = session_factory
+        # Same hooks as MessageIngestor
+        self.on_commit: Optional[Callable[[], None]] = None
+        self.tail_cache: Optional[MessageTailCache] = None
+        self.read_cursors: Optional[ReadCursorStore] = None
+        # (loop time due, schedule id)
+        self._heap: List[Tuple[float, uuid.UUID]] = []
+        self._known: Set[uuid.UUID] = set()
+        self._wakeup = asyncio.Event()
+
+    def notify(self, schedule_id: uuid.UUID, delay: float):
+        """Track a schedule created on this replica, if it is due within the window."""
+        if delay <= self.settings.schedule_window:
+            self._push(schedule_id, delay)
+            self._wakeup.set()
+
+    def _push(self, schedule_id: uuid.UUID, delay: float):
+        if schedule_id in self._known:
+            return
+        self._known.add(schedule_id)
+        heapq.heappush(
+            self._heap, (asyncio.get_running_loop().time() + delay, schedule_id)
+        )
+        metrics.set_gauge("scheduler.heap_size", len(self._heap))
+
+    def _pop_due(self) -> int:
+        now = asyncio.get_running_loop().time()
+        popped = 0
+        while self._heap and self._heap[0][0] <= now:
+            _, schedule_id = heapq.heappop(self._heap)
+            self._known.discard(schedule_id)
+            popped += 1
+        metrics.set_gauge("scheduler.heap_size", len(self._heap))
+        return popped
+
+    async def load_window(self, db: AsyncSession) -> int:
+        rows = await crud.get_scheduled_window(
+            db, self.settings.schedule_window, self.settings.schedule_window_max
+        )
+        await db.commit()
+        for row in rows:
+            self._push(row.id, max(float(row.delay), 0.0))
+        return len(rows)
+
+    async def claim_due(self, db: AsyncSession) -> int:
+        """Post one batch of due messages and return how many were claimed."""
+        stored: Dict[uuid.UUID, List[Row]] = {}
+        with metrics.timer("scheduler.claim"):
+            try:
+                claimed = await crud.claim_due_messages(
+                    db, self.settings.schedule_claim_batch
+                )
+                by_chat: Dict[uuid.UUID, List[Row]] = defaultdict(list)
+                for row in claimed:
+                    # The sender left, was demoted or the chat is gone: dropped
+                    if row.allowed:
+                        by_chat[row.chat_id].append(row)
+                # Same lock order as the ingestor
+                for chat_id in sorted(by_chat):
+                    stored[chat_id] = await crud.create_messages(
+                        db,
+                        chat_id,
+                        [(row.sender_id, row.content) for row in by_chat[chat_id]],
+                    )
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+
+        for row in claimed:
+            self._known.discard(row.id)
+            metrics.observe("scheduler.lateness", max(float(row.lateness), 0.0))
+        for chat_id, rows in stored.items():
+            if self.tail_cache and rows:
+                await self.tail_cache.append(chat_id, rows)
+            if self.read_cursors:
+                await self.read_cursors.advance_many(sender_cursors(rows))
+        if claimed:
+            posted = sum(len(r) for r in stored.values())
+            metrics.inc("scheduler.posted", posted)
+            metrics.inc("scheduler.dropped", len(claimed) - posted)
+            if self.on_commit:
+                self.on_commit()
+        return len(claimed)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        session_factory = self.session_factory or get_session_local()
+        next_load = 0.0
+        while True:
+            try:
+                if loop.time() >= next_load:
+                    async with session_factory() as db:
+                        await self.load_window(db)
+                    next_load = loop.time() + self.settings.schedule_window / 2
+
+                if self._pop_due():
+                    async with session_factory() as db:
+                        while (
+                            await self.claim_due(db)
+                            == self.settings.schedule_claim_batch
+                        ):
+                            pass
+                    continue
+
+                wake_at = min(self._heap[0][0], next_load) if self._heap else next_load
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(
+                        self._wakeup.wait(), max(wake_at - loop.time(), 0.0)
+                    )
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Message scheduler error: {e}", exc_info=True)
+                metrics.inc("scheduler.errors")
+                await asyncio.sleep(1)
+
+
+message_scheduler = MessageScheduler(get_settings())
+
+
+def get_message_scheduler() -> MessageScheduler:
+    return message_scheduler
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud
+from app.database import get_engine, get_session_local
+from app.metrics import metrics
+from app.services.kafka_producer import KafkaProducerService
+from app.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary application-wide key: only one replica drains the outbox at a time,
+# which keeps events in commit order on the topic.
+OUTBOX_LOCK_ID = 0x0CA7_0B0C
+
+
+class OutboxRelay:
+    """
+    Moves events from the outbox table to Kafka.
+
+    Batches are read by keyset (id > last relayed id) instead of from the head of
+    the table, so the index entries of rows deleted by previous batches are not
+    rescanned. Whenever a batch comes back short the cursor is reset: that picks
+    up events whose transaction committed after a higher id had already been
+    relayed. Delivery is at-least-once, a crash between publish and delete
+    replays the batch.
+    """
+
+    def __init__(self, producer: KafkaProducerService, settings: Settings):
+        self.producer = producer
+        self.settings = settings
+        self._cursor = 0
+        self._wakeup = asyncio.Event()
+
+    def wake(self):
+        """Skip the rest of the current poll interval, e.g. after a message batch."""
+        self._wakeup.set()
+
+    async def _idle(self):
+        try:
+            await asyncio.wait_for(
+                self._wakeup.wait(), self.settings.outbox_poll_interval
+            )
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def relay_once(self, db: AsyncSession) -> int:
+        with metrics.timer("outbox.batch"):
+            rows = await crud.get_outbox_batch(
+                db, self._cursor, self.settings.outbox_batch_size
+            )
+            # Release the snapshot so the publish below does not hold a transaction
+            await db.commit()
+            if not rows:
+                self._cursor = 0
+                metrics.set_gauge("outbox.lag_seconds", 0.0)
+                return 0
+
+            metrics.set_gauge("outbox.lag_seconds", float(rows[0][3]))
+            await self.producer.publish_batch(
+                [(event_type, payload) for _, event_type, payload, _ in rows]
+            )
+
+            ids = [row[0] for row in rows]
+            chunk = self.settings.outbox_delete_chunk
+            for i in range(0, len(ids), chunk):
+                await crud.delete_outbox_events(db, ids[i : i + chunk])
+
+        metrics.inc("outbox.relayed", len(ids))
+        self._cursor = ids[-1] if len(ids) == self.settings.outbox_batch_size else 0
+        return len(ids)
+
+    async def run(self):
+        SessionLocal = get_session_local()
+        while True:
+            try:
+                async with get_engine().connect() as lock_connection:
+                    is_leader = await lock_connection.scalar(
+                        select(func.pg_try_advisory_lock(OUTBOX_LOCK_ID))
+                    )
+                    await lock_connection.commit()
+                    if not is_leader:
+                        await asyncio.sleep(self.settings.outbox_poll_interval * 10)
+                        continue
+
+                    logger.info("Outbox relay acquired leadership")
+                    try:
+                        while True:
+                            async with SessionLocal() as db:
+                                relayed = await self.relay_once(db)
+                            if relayed < self.settings.outbox_batch_size:
+                                await self._idle()
+                    finally:
+                        # Close instead of returning the connection to the pool with the lock held
+                        await lock_connection.invalidate()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Outbox relay error: {e}", exc_info=True)
+                metrics.inc("outbox.errors")
+                await asyncio.sleep(self.settings.outbox_poll_interval * 10)
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+from datetime import date, datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.database import get_engine
+from app.metrics import metrics
+from app.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+
+def month_start(day: date, offset: int = 0) -> date:
+    months = day.year * 12 + day.month - 1 + offset
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def partition_name(start: date) -> str:
+    return f"messages_{start.year:04d}_{start.month:02d}"
+
+
+async def ensure_message_partitions(
+    conn: AsyncConnection, ahead: int, now: Optional[datetime] = None
+) -> List[str]:
+    """
+    Create the monthly partitions of `messages` from the current month up to
+    `ahead` months in the future. Idempotent: runs at startup and then
+    periodically from PartitionMaintainer.
+
+    Partitions must exist before their month starts: once the default partition
+    holds rows of a month, that month's partition can no longer be attached.
+    """
+    today = (now or datetime.now(timezone.utc)).date()
+    created = []
+    for offset in range(ahead + 1):
+        start, end = month_start(today, offset), month_start(today, offset + 1)
+        name = partition_name(start)
+        await conn.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF messages "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            )
+        )
+        created.append(name)
+    logger.info(f"Message partitions ensured: {', '.join(created)}")
+    return created
+
+
+class PartitionMaintainer:
+    """
+    Keeps `message_partitions_ahead` months of partitions ahead of the clock.
+
+    Startup alone is not enough: a replica that stays up for longer than the
+    partitions it created runs into months that only the default partition
+    covers. Replicas race harmlessly, CREATE TABLE IF NOT EXISTS is idempotent.
+    """
+
+    def __init__(self, settings: Settings, engine: Optional[AsyncEngine] = None):
+        self.settings = settings
+        self.engine = engine
+
+    async def run(self):
+        engine = self.engine or get_engine()
+        while True:
+            # Startup ensured the partitions already
+            await asyncio.sleep(self.settings.message_partition_check_interval)
+            try:
+                async with engine.begin() as conn:
+                    await ensure_message_partitions(
+                        conn, self.settings.message_partitions_ahead
+                    )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Partition maintenance error: {e}", exc_info=True)
+                metrics.inc("partitions.errors")
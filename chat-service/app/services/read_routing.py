@@ -0,0 +1,61 @@
+import logging
+import uuid
+from typing import Annotated
+
+from fastapi import Depends
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from app.database import get_redis_client
+from app.metrics import metrics
+from app.settings import Settings, get_settings
+
+logger = logging.getLogger(__name__)
+
+
+def user_pin(user_id: uuid.UUID) -> str:
+    return f"rw:user:{user_id}"
+
+
+def chat_pin(chat_id: uuid.UUID) -> str:
+    return f"rw:chat:{chat_id}"
+
+
+class PrimaryPins:
+    """
+    Read-your-writes for replica routing.
+
+    A write sets short-lived `rw:*` keys for its user and chat; reads that
+    match any of them go to the primary until the keys expire. The window only
+    has to outlast replica lag. When Redis is down every read counts as pinned:
+    stale reads are worse than a busier primary.
+    """
+
+    def __init__(self, redis_client: Redis, window: float):
+        self.redis = redis_client
+        self.window_ms = int(window * 1000)
+
+    async def pin(self, *keys: str):
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.set(key, 1, px=self.window_ms)
+                await pipe.execute()
+        except RedisError as e:
+            logger.error(f"Primary pin failed: {e}")
+            metrics.inc("read_routing.errors")
+
+    async def is_pinned(self, *keys: str) -> bool:
+        try:
+            return bool(await self.redis.exists(*keys))
+        except RedisError as e:
+            logger.error(f"Primary pin lookup failed: {e}")
+            metrics.inc("read_routing.errors")
+            return True
+
+
+def get_primary_pins(
+    redis_client: Annotated[Redis, Depends(get_redis_client)],
+    settings: Annotated[Settings, Depends(get_settings)],
+) -> PrimaryPins:
+    return PrimaryPins(redis_client, settings.read_your_writes_window)
@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import uuid
+from collections import defaultdict
+from typing import Annotated, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import Depends
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud
+from app.database import get_redis_client, get_session_local
+from app.metrics import metrics
+from app.settings import Settings, get_settings
+
+logger = logging.getLogger(__name__)
+
+DIRTY_KEY = "read:dirty"
+
+# Moves a cursor forward only, marking it dirty and replacing the hash's
+# "version" field when it moved.
+# KEYS: cursor hash, dirty set. ARGV: chat id, seq, dirty member, ttl, version.
+ADVANCE_SCRIPT = """
+local current = tonumber(redis.call("HGET", KEYS[1], ARGV[1]) or "0")
+local seq = tonumber(ARGV[2])
+if seq > current then
+    redis.call("HSET", KEYS[1], ARGV[1], seq, "version", ARGV[5])
+    redis.call("SADD", KEYS[2], ARGV[3])
+    current = seq
+end
+redis.call("EXPIRE", KEYS[1], ARGV[4])
+return current
+"""
+
+# Returns the hash's version, setting a fresh one if it has none, e.g. after
+# it expired. KEYS: cursor hash. ARGV: new version, ttl.
+VERSION_SCRIPT = """
+local version = redis.call("HGET", KEYS[1], "version")
+if not version then
+    version = ARGV[1]
+    redis.call("HSET", KEYS[1], "version", version)
+    redis.call("EXPIRE", KEYS[1], ARGV[2])
+end
+return version
+"""
+
+
+class ReadCursorStore:
+    """
+    Per-(user, chat) read cursors, live in Redis and flushed to Postgres.
+
+    `read:{user_id}` maps chat ids to the last read seq. Unread counts are never
+    counted: a chat's unread count is its last_message_seq minus the cursor,
+    and last_message_seq comes with the inbox row anyway, less the message
+    tombstones above the cursor. Cursors only move
+    forward; every move adds "user:chat" to DIRTY_KEY, which `flush` drains
+    into read_states in batches, and replaces the hash's "version" field, which
+    inbox ETags are built from. Cursors missing from Redis are refilled from
+    read_states.
+    """
+
+    def __init__(self, redis_client: Redis, settings: Settings):
+        self.redis = redis_client
+        self.settings = settings
+
+    @staticmethod
+    def _key(user_id: uuid.UUID) -> str:
+        return f"read:{user_id}"
+
+    async def advance(
+        self, db: AsyncSession, user_id: uuid.UUID, chat_id: uuid.UUID, seq: int
+    ) -> int:
+        """Move the cursor up to `seq` and return where it ends up."""
+        try:
+            return int(
+                await self.redis.eval(
+                    ADVANCE_SCRIPT,
+                    2,
+                    self._key(user_id),
+                    DIRTY_KEY,
+                    str(chat_id),
+                    seq,
+                    f"{user_id}:{chat_id}",
+                    self.settings.read_state_ttl,
+                    uuid.uuid4().hex,
+                )
+            )
+        except RedisError as e:
+            logger.error(f"Read cursor update failed, writing through: {e}")
+            metrics.inc("read_state.errors")
+            await crud.upsert_read_states(db, [(user_id, chat_id, seq)])
+            await db.commit()
+            stored = await crud.get_read_states(db, user_id, [chat_id])
+            return stored.get(chat_id, seq)
+
+    async def advance_many(self, cursors: Iterable[Tuple[uuid.UUID, uuid.UUID, int]]):
+        """Best-effort batch of advance, e.g. senders reading their own messages."""
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for user_id, chat_id, seq in cursors:
+                    pipe.eval(
+                        ADVANCE_SCRIPT,
+                        2,
+                        self._key(user_id),
+                        DIRTY_KEY,
+                        str(chat_id),
+                        seq,
+                        f"{user_id}:{chat_id}",
+                        self.settings.read_state_ttl,
+                        uuid.uuid4().hex,
+                    )
+                await pipe.execute()
+        except RedisError as e:
+            logger.error(f"Read cursor batch update failed: {e}")
+            metrics.inc("read_state.errors")
+
+    async def get_version(self, user_id: uuid.UUID) -> Optional[str]:
+        """Token that changes whenever one of the user's cursors moves; None if Redis fails."""
+        try:
+            return await self.redis.eval(
+                VERSION_SCRIPT,
+                1,
+                self._key(user_id),
+                uuid.uuid4().hex,
+                self.settings.read_state_ttl,
+            )
+        except RedisError as e:
+            logger.error(f"Read cursor version lookup failed: {e}")
+            metrics.inc("read_state.errors")
+            return None
+
+    async def get_cursors(
+        self, db: AsyncSession, user_id: uuid.UUID, chat_ids: List[uuid.UUID]
+    ) -> Dict[uuid.UUID, int]:
+        """Read cursors of a page of chats: one HMGET, Postgres only for misses."""
+        if not chat_ids:
+            return {}
+        key = self._key(user_id)
+        try:
+            values = await self.redis.hmget(key, [str(c) for c in chat_ids])
+        except RedisError as e:
+            logger.error(f"Read cursor lookup failed: {e}")
+            metrics.inc("read_state.errors")
+            values = []
+
+        cursors = {
+            chat_id: int(value)
+            for chat_id, value in zip(chat_ids, values)
+            if value is not None
+        }
+        misses = [chat_id for chat_id in chat_ids if chat_id not in cursors]
+        metrics.inc("read_state.misses", len(misses))
+        if not misses:
+            return cursors
+
+        stored = await crud.get_read_states(db, user_id, misses)
+        loaded = {chat_id: stored.get(chat_id, 0) for chat_id in misses}
+        cursors.update(loaded)
+        try:
+            # HSETNX: a cursor advanced meanwhile wins over the stored one
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for chat_id, seq in loaded.items():
+                    pipe.hsetnx(key, str(chat_id), seq)
+                pipe.expire(key, self.settings.read_state_ttl)
+                await pipe.execute()
+        except RedisError as e:
+            logger.error(f"Read cursor refill failed: {e}")
+            metrics.inc("read_state.errors")
+        return cursors
+
+    async def flush(self, db: AsyncSession) -> int:
+        """Write one batch of dirty cursors to read_states."""
+        members = await self.redis.spop(DIRTY_KEY, self.settings.read_state_flush_batch)
+        if not members:
+            return 0
+
+        try:
+            pairs = []
+            for member in members:
+                user_id, chat_id = member.split(":")
+                pairs.append((uuid.UUID(user_id), uuid.UUID(chat_id)))
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for user_id, chat_id in pairs:
+                    pipe.hget(self._key(user_id), str(chat_id))
+                values = await pipe.execute()
+
+            states = [
+                (user_id, chat_id, int(value))
+                for (user_id, chat_id), value in zip(pairs, values)
+                if value is not None
+            ]
+            with metrics.timer("read_state.flush"):
+                if states:
+                    await crud.upsert_read_states(db, states)
+                    await db.commit()
+        except Exception:
+            await db.rollback()
+            # Put them back for the next round
+            await self.redis.sadd(DIRTY_KEY, *members)
+            raise
+
+        metrics.inc("read_state.flushed", len(states))
+        return len(members)
+
+    async def run(self):
+        SessionLocal = get_session_local()
+        while True:
+            try:
+                async with SessionLocal() as db:
+                    flushed = await self.flush(db)
+                if flushed < self.settings.read_state_flush_batch:
+                    await asyncio.sleep(self.settings.read_state_flush_interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Read cursor flush error: {e}", exc_info=True)
+                metrics.inc("read_state.errors")
+                await asyncio.sleep(self.settings.read_state_flush_interval * 10)
+
+
+def get_read_cursor_store(
+    redis_client: Annotated[Redis, Depends(get_redis_client)],
+    settings: Annotated[Settings, Depends(get_settings)],
+) -> ReadCursorStore:
+    return ReadCursorStore(redis_client, settings)
+
+
+def sender_cursors(rows: Iterable) -> List[Tuple[uuid.UUID, uuid.UUID, int]]:
+    """Highest seq each sender wrote per chat: sending implies having read."""
+    latest: Dict[Tuple[uuid.UUID, uuid.UUID], int] = defaultdict(int)
+    for row in rows:
+        key = (row.sender_id, row.chat_id)
+        latest[key] = max(latest[key], row.seq)
+    return [(user_id, chat_id, seq) for (user_id, chat_id), seq in latest.items()]
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import struct
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from aiokafka import AIOKafkaConsumer
+
+from app import crud
+from app.database import get_session_local
+from app.events import EnvelopeError, decode_event
+from app.metrics import metrics
+from app.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+MessageKey = Tuple[uuid.UUID, int]
+
+
+class SearchIndexer:
+    """
+    Keeps the message search index in step with the chat event stream.
+
+    Messages are indexed off the send path: the consumer reads the
+    message_created, message_updated and message_deleted events the outbox
+    publishes and applies each polled batch in one transaction, collapsed to
+    one multi-row upsert, the edits of messages indexed earlier and one
+    delete. Offsets are committed after that, and replaying a batch rewrites
+    the same entries. Deleted chats are dropped from the index by the purger.
+    """
+
+    def __init__(self, settings: Settings, session_factory: Optional[Callable] = None):
+        self.settings = settings
+        self.session_factory = session_factory
+
+    async def handle(self, records: list) -> int:
+        """Apply one polled batch to the index and return the number of changes."""
+        created: Dict[MessageKey, dict] = {}
+        edited: Dict[MessageKey, str] = {}
+        deleted: Set[MessageKey] = set()
+        for record in records:
+            try:
+                event_type, data = decode_event(record.value)
+                if event_type not in (
+                    "message_created",
+                    "message_updated",
+                    "message_deleted",
+                ):
+                    continue
+                key = (uuid.UUID(data["chat_id"]), int(data["seq"]))
+                # Events of a chat arrive in order: the last one for a message wins
+                if event_type == "message_created":
+                    created[key] = {
+                        "chat_id": key[0],
+                        "seq": key[1],
+                        "sender_id": uuid.UUID(data["sender_id"]),
+                        "created_at": datetime.fromisoformat(data["created_at"]),
+                        "content": data["content"],
+                    }
+                elif event_type == "message_updated":
+                    if key in created:
+                        created[key]["content"] = data["content"]
+                    elif key not in deleted:
+                        edited[key] = data["content"]
+                else:
+                    created.pop(key, None)
+                    edited.pop(key, None)
+                    deleted.add(key)
+            except (EnvelopeError, ValueError, KeyError, TypeError, struct.error) as e:
+                logger.error(f"Skipping undecodable chat event: {e}")
+                metrics.inc("search_index.undecodable")
+
+        if not (created or edited or deleted):
+            return 0
+        session_factory = self.session_factory or get_session_local()
+        async with session_factory() as db:
+            try:
+                if created:
+                    await crud.index_messages(db, list(created.values()))
+                for (chat_id, seq), content in edited.items():
+                    await crud.reindex_message(db, chat_id, seq, content)
+                if deleted:
+                    await crud.unindex_messages(db, list(deleted))
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+
+        metrics.inc("search_index.indexed", len(created))
+        metrics.inc("search_index.edited", len(edited))
+        metrics.inc("search_index.deleted", len(deleted))
+        return len(created) + len(edited) + len(deleted)
+
+    async def run(self):
+        consumer = AIOKafkaConsumer(
+            self.settings.kafka_topic_chats,
+            bootstrap_servers=self.settings.kafka_bootstrap_servers,
+            group_id=self.settings.search_indexer_group_id,
+            enable_auto_commit=False,
+            auto_offset_reset="earliest",
+        )
+        await consumer.start()
+        logger.info("Search indexer started")
+        try:
+            while True:
+                batches = await consumer.getmany(
+                    timeout_ms=1000,
+                    max_records=self.settings.search_indexer_max_records,
+                )
+                records = [record for batch in batches.values() for record in batch]
+                if not records:
+                    continue
+                try:
+                    with metrics.timer("search_index.batch"):
+                        await self.handle(records)
+                    await consumer.commit()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Search indexer error: {e}", exc_info=True)
+                    metrics.inc("search_index.errors")
+                    await consumer.seek_to_committed()
+                    await asyncio.sleep(1)
+        finally:
+            await consumer.stop()
+            logger.info("Search indexer stopped")
@@ -1,5 +1,6 @@
 import os
 from functools import lru_cache
+from typing import Optional
 
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -17,8 +18,96 @@ class Settings(BaseSettings):
     database_url: str
     redis_url: str
 
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: float = 30.0
+    # Read replica for read-only endpoints; reads use the primary when unset
+    database_read_url: Optional[str] = None
+    db_read_pool_size: int = 20
+    db_read_max_overflow: int = 20
+    # Seconds a writer (and the chat written to) keeps reading from the primary,
+    # so replica lag never hides their own writes
+    read_your_writes_window: float = 5.0
+
     kafka_bootstrap_servers: str = "localhost:9092"
     kafka_topic_chats: str = "chat_events"
+    kafka_linger_ms: int = 5
+    kafka_max_batch_size: int = 64 * 1024
+    kafka_compression_type: Optional[str] = "gzip"
+    # "msgpack" (versioned binary envelope) or "json" for legacy consumers
+    kafka_event_format: str = "msgpack"
+
+    # Websocket delivery records: {"type", "recipients", "payload"}
+    kafka_topic_messages: str = "message_events"
+
+    outbox_relay_enabled: bool = True
+    outbox_batch_size: int = 500
+    outbox_delete_chunk: int = 100
+    outbox_poll_interval: float = 0.2
+
+    membership_cache_ttl: int = 300
+    bulk_participants_chunk: int = 1000
+    bulk_participants_max: int = 100_000
+    bulk_invalid_max: int = 100
+
+    # Monthly message partitions created ahead of time, at startup and then
+    # every check interval
+    message_partitions_ahead: int = 2
+    message_partition_check_interval: int = 3600
+
+    # Group commit of sent messages: flush at this many or after this delay
+    ingest_batch_size: int = 256
+    ingest_max_delay: float = 0.005
+    ingest_queue_size: int = 10_000
+
+    # Hot tail of recent messages kept in Redis per active chat
+    # Covers a full history page (limit 100, plus one to detect more)
+    message_tail_size: int = 128
+    message_tail_ttl: int = 3600
+
+    # Distinct emojis per message, and per user on one message
+    reactions_per_message_max: int = 20
+    reactions_per_user_max: int = 5
+
+    # Read cursors live in Redis and are flushed to read_states in batches
+    read_state_ttl: int = 7 * 24 * 3600
+    read_state_flush_interval: float = 1.0
+    read_state_flush_batch: int = 1000
+
+    # Members' inbox keys follow their chat's activity in background batches:
+    # a chat's member rows are rewritten at most once per interval
+    member_activity_interval: float = 1.0
+    member_activity_claim_batch: int = 100
+    member_activity_batch: int = 5000
+
+    # Background deletion of deleted chats, in throttled keyset batches
+    purge_batch_size: int = 1000
+    purge_batch_pause: float = 0.05
+    purge_poll_interval: float = 5.0
+    # Members are kept until chat_deleted was fanned out to them, or this long
+    purge_fanout_timeout: float = 3600.0
+
+    # Scheduled messages: the next window of due times is kept in memory and
+    # reloaded every half window; due rows are claimed in batches
+    schedule_window: float = 60.0
+    schedule_window_max: int = 10_000
+    schedule_claim_batch: int = 500
+    schedule_max_days: int = 365
+
+    # Turns chat events into recipient batches for the websocket workers
+    fanout_enabled: bool = True
+    fanout_group_id: str = "chat_fanout"
+    fanout_max_records: int = 500
+    fanout_concurrency: int = 16
+    fanout_page_size: int = 5000
+    # Recipients per delivery record, so big channels never make big records
+    fanout_chunk_size: int = 500
+    fanout_member_cache_ttl: int = 60
+
+    # Message search index, updated from the chat event stream
+    search_indexer_enabled: bool = True
+    search_indexer_group_id: str = "chat_search_indexer"
+    search_indexer_max_records: int = 1000
 
     log_level: str = Field("info")
     log_format: str = Field("text")
@@ -0,0 +1,137 @@
+"""
+Public channel search over a synthetic dataset.
+
+Fills the chats table with generate_series (one statement, no per-row round
+trips), then times the first page and a deep page of a few queries and prints
+the plan of one of them. Needs the dev database:
+
+    ENV=dev python -m benchmarks.bench_channel_search --channels 1000000
+
+Rows are created with the "bench-" name prefix and removed with --cleanup.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import text
+
+from app import crud
+from app.database import get_engine, get_session_local
+from app.models import Base
+
+WORDS = [
+    "news",
+    "garden",
+    "python",
+    "music",
+    "football",
+    "travel",
+    "recipes",
+    "crypto",
+    "movies",
+    "photography",
+    "science",
+    "gaming",
+]
+
+FILL = text("""
+    INSERT INTO chats (id, type, name, description, settings, is_public,
+                       member_count, last_message_seq, created_at, updated_at,
+                       last_activity_at)
+    SELECT gen_random_uuid(), 'CHANNEL',
+           'bench-' || w[1 + i % 12] || ' ' || i,
+           w[1 + (i / 12) % 12] || ' and ' || w[1 + (i / 144) % 12],
+           '{}'::json, i % 10 <> 0,
+           floor(pow(random(), 4) * 100000)::int, 0, now(), now(), now()
+    FROM generate_series(1, :channels) AS i, CAST(:words AS text[]) AS w
+    """)
+
+QUERIES = ["news", "garden mus", "photo", "python science"]
+
+
+async def fill(channels: int):
+    async with get_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        existing = await conn.scalar(
+            text("SELECT count(*) FROM chats WHERE name LIKE 'bench-%'")
+        )
+        if existing >= channels:
+            return
+        start = time.perf_counter()
+        await conn.execute(FILL, {"words": WORDS, "channels": channels - existing})
+        print(
+            f"inserted {channels - existing} channels in {time.perf_counter() - start:.1f}s"
+        )
+    async with get_engine().connect() as conn:
+        await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("VACUUM ANALYZE chats"))
+
+
+async def timed_pages(query: str, pages: int, limit: int, rounds: int) -> dict:
+    SessionLocal = get_session_local()
+    first, last = [], []
+    for _ in range(rounds):
+        async with SessionLocal() as db:
+            after = None
+            for page in range(pages):
+                start = time.perf_counter()
+                rows = await crud.search_public_channels(db, query, limit, after)
+                elapsed = time.perf_counter() - start
+                if page == 0:
+                    first.append(elapsed)
+                if not rows:
+                    break
+                after = (rows[-1].score, rows[-1].id)
+            last.append(elapsed)
+    return {
+        "first_ms": statistics.median(first) * 1000,
+        "deep_ms": statistics.median(last) * 1000,
+    }
+
+
+async def explain(query: str):
+    tsquery = crud.search_tsquery(query)
+    async with get_engine().connect() as conn:
+        plan = await conn.execute(
+            text(
+                "EXPLAIN ANALYZE SELECT id FROM chats WHERE is_public AND "
+                "search_vector @@ to_tsquery('simple', :q)"
+            ),
+            {"q": tsquery},
+        )
+        print("\n".join(row[0] for row in plan))
+
+
+async def cleanup():
+    async with get_engine().begin() as conn:
+        await conn.execute(text("DELETE FROM chats WHERE name LIKE 'bench-%'"))
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--channels", type=int, default=1_000_000)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--cleanup", action="store_true")
+    args = parser.parse_args()
+
+    if args.cleanup:
+        await cleanup()
+        return
+
+    await fill(args.channels)
+    for query in QUERIES:
+        result = await timed_pages(query, args.pages, args.limit, args.rounds)
+        print(
+            f"{query!r:>18}: first page {result['first_ms']:.1f}ms, "
+            f"page {args.pages} {result['deep_ms']:.1f}ms"
+        )
+    await explain(QUERIES[0])
+    await get_engine().dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,47 @@
+"""
+Compare record size and decode time of the JSON and MessagePack envelope formats.
+
+    python -m benchmarks.bench_event_envelope --iterations 100000
+"""
+
+import argparse
+import timeit
+import uuid
+
+from app.events import decode_event, encode_event
+
+SAMPLES = {
+    "chat_created": {"chat_id": str(uuid.uuid4()), "type": "GROUP"},
+    "role_updated": {
+        "chat_id": str(uuid.uuid4()),
+        "user_id": str(uuid.uuid4()),
+        "role": "ADMIN",
+    },
+    "delivery": {
+        "type": "new_message",
+        "recipients": [str(uuid.uuid4()) for _ in range(500)],
+        "payload": {"chat_id": str(uuid.uuid4()), "seq": 1234, "text": "hello " * 20},
+    },
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=100_000)
+    args = parser.parse_args()
+
+    for event_type, data in SAMPLES.items():
+        iterations = (
+            args.iterations if event_type != "delivery" else args.iterations // 50
+        )
+        for event_format in ("json", "msgpack"):
+            raw = encode_event(event_type, data, event_format)
+            seconds = timeit.timeit(lambda: decode_event(raw), number=iterations)
+            print(
+                f"{event_type:>13} {event_format:>7}: {len(raw):>6} bytes, "
+                f"decode {seconds / iterations * 1e6:.2f}us"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Compare publishing events one acked record at a time with acked batches, the
+way the outbox relay publishes.
+
+Needs a reachable broker at KAFKA_BOOTSTRAP_SERVERS:
+
+    ENV=dev python -m benchmarks.bench_kafka_publish --events 5000 --batch 500
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+from app.services.kafka_producer import KafkaProducerService
+from app.settings import get_settings
+
+
+async def run(batch_size: int, events: int) -> dict:
+    service = KafkaProducerService(get_settings())
+    await service.start()
+
+    latencies = []
+    start_time = time.perf_counter()
+    for _ in range(0, events, batch_size):
+        batch = [
+            ("chat_updated", {"chat_id": str(uuid.uuid4()), "name": "benchmark"})
+            for _ in range(batch_size)
+        ]
+        call_start = time.perf_counter()
+        await service.publish_batch(batch)
+        latencies.append(time.perf_counter() - call_start)
+    total = time.perf_counter() - start_time
+    await service.stop()
+
+    latencies.sort()
+    return {
+        "batch": batch_size,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000,
+        "total_s": total,
+        "events_per_s": events / total,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=500)
+    args = parser.parse_args()
+
+    for batch_size in (1, args.batch):
+        result = await run(batch_size, args.events)
+        print(
+            f"batch={result['batch']:>5}: p50={result['p50_ms']:.3f}ms "
+            f"p99={result['p99_ms']:.3f}ms total={result['total_s']:.2f}s "
+            f"({result['events_per_s']:.0f} events/s)"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
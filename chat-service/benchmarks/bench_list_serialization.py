@@ -0,0 +1,120 @@
+"""
+Building a 1k-row chat list response: ORM objects through pydantic, plain rows
+through pydantic (the response_model path), and plain rows through orjson
+(RowJSONResponse). Each round runs the query and renders the body. Needs the
+dev database:
+
+    ENV=dev python -m benchmarks.bench_list_serialization --rows 1000
+
+Rows are created with the "bench-list" name prefix and removed afterwards.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy import select, text
+
+from app import crud
+from app.database import Base, get_engine, get_session_local
+from app.models import Chat, ChatMember
+from app.responses import RowJSONResponse
+from app.schemas import ChatPage
+
+FILL = text("""
+    WITH chats AS (
+        INSERT INTO chats (id, type, name, settings, is_public, member_count,
+                           created_at, updated_at, last_activity_at,
+                           last_message_seq, last_message_preview, last_message_at)
+        SELECT gen_random_uuid(), 'GROUP', 'bench-list ' || i, '{}'::json, false,
+               1, now(), now(), now() - i * interval '1 second', i,
+               'message number ' || i, now()
+        FROM generate_series(1, :rows) AS i
+        RETURNING id, last_activity_at
+    )
+    INSERT INTO chat_members (id, chat_id, user_id, role, joined_at, last_activity_at)
+    SELECT gen_random_uuid(), id, :user_id, 'OWNER', now(), last_activity_at
+    FROM chats
+    """)
+
+PAGE = TypeAdapter(ChatPage)
+
+
+def render_validated(items) -> bytes:
+    # What FastAPI does with a response_model: validate, dump, json.dumps
+    content = {"items": items, "next_cursor": None}
+    validated = PAGE.validate_python(content, from_attributes=True)
+    return JSONResponse(PAGE.dump_python(validated, mode="json")).body
+
+
+async def orm_pydantic(db, user_id: uuid.UUID, rows: int) -> bytes:
+    stmt = (
+        select(Chat)
+        .join(ChatMember, ChatMember.chat_id == Chat.id)
+        .where(ChatMember.user_id == user_id)
+        .order_by(ChatMember.last_activity_at.desc(), ChatMember.chat_id.desc())
+        .limit(rows)
+    )
+    chats = (await db.execute(stmt)).scalars().all()
+    return render_validated(chats)
+
+
+async def rows_pydantic(db, user_id: uuid.UUID, rows: int) -> bytes:
+    return render_validated(await crud.get_user_chats(db, user_id, rows))
+
+
+async def rows_orjson(db, user_id: uuid.UUID, rows: int) -> bytes:
+    # Same shape as list_my_chats builds, unread_count included
+    items = [
+        {**row._asdict(), "unread_count": 0}
+        for row in await crud.get_user_chats(db, user_id, rows)
+    ]
+    return RowJSONResponse({"items": items, "next_cursor": None}).body
+
+
+MODES = {
+    "orm + pydantic": orm_pydantic,
+    "rows + pydantic": rows_pydantic,
+    "rows + orjson": rows_orjson,
+}
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    user_id = uuid.uuid4()
+    async with get_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(FILL, {"rows": args.rows, "user_id": user_id})
+
+    SessionLocal = get_session_local()
+    try:
+        for mode, build in MODES.items():
+            timings = []
+            for _ in range(args.rounds):
+                # Fresh session each round, as per request
+                async with SessionLocal() as db:
+                    start = time.perf_counter()
+                    body = await build(db, user_id, args.rows)
+                    timings.append(time.perf_counter() - start)
+            timings.sort()
+            print(
+                f"{mode:>16}: p50 {statistics.median(timings) * 1000:.1f}ms, "
+                f"p90 {timings[int(len(timings) * 0.9) - 1] * 1000:.1f}ms, "
+                f"{len(body)} bytes"
+            )
+    finally:
+        async with get_engine().begin() as conn:
+            await conn.execute(text("DELETE FROM chats WHERE name LIKE 'bench-list %'"))
+        await get_engine().dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
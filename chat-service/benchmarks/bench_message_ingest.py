@@ -0,0 +1,102 @@
+"""
+Message send throughput: one transaction per message vs. group commit.
+
+Concurrent senders post to a set of chats either each in their own transaction
+(the naive send path) or through the MessageIngestor. Needs the dev database:
+
+    ENV=dev python -m benchmarks.bench_message_ingest --senders 200 --messages 20000
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+from sqlalchemy import delete
+
+from app import crud
+from app.database import Base, get_engine, get_session_local
+from app.models import Chat, ChatType
+from app.services.message_ingestor import MessageIngestor
+from app.settings import get_settings
+
+
+async def create_chats(count: int) -> list:
+    async with get_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    SessionLocal = get_session_local()
+    chat_ids = []
+    async with SessionLocal() as db:
+        for i in range(count):
+            chat = await crud.create_group_or_channel(
+                db, uuid.uuid4(), ChatType.GROUP, f"bench-ingest {i}", {}
+            )
+            chat_ids.append(chat.id)
+    return chat_ids
+
+
+async def send_per_transaction(chat_id: uuid.UUID, sender_id: uuid.UUID, content):
+    async with get_session_local()() as db:
+        rows = await crud.create_messages(db, chat_id, [(sender_id, content)])
+        await db.commit()
+        return rows[0]
+
+
+async def run(mode: str, chat_ids: list, senders: int, messages: int) -> dict:
+    ingestor = MessageIngestor(get_settings())
+    per_sender = messages // senders
+    latencies = []
+
+    async def sender(n: int):
+        sender_id = uuid.uuid4()
+        for i in range(per_sender):
+            chat_id = chat_ids[(n + i) % len(chat_ids)]
+            start = time.perf_counter()
+            if mode == "group":
+                await ingestor.submit(chat_id, sender_id, f"message {i}")
+            else:
+                await send_per_transaction(chat_id, sender_id, f"message {i}")
+            latencies.append(time.perf_counter() - start)
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(sender(n) for n in range(senders)))
+    total = time.perf_counter() - start_time
+    await ingestor.stop()
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "messages_per_s": len(latencies) / total,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+async def cleanup(chat_ids: list):
+    async with get_engine().begin() as conn:
+        await conn.execute(delete(Chat).where(Chat.id.in_(chat_ids)))
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--senders", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=20_000)
+    args = parser.parse_args()
+
+    chat_ids = await create_chats(args.chats)
+    try:
+        for mode in ("per-transaction", "group"):
+            result = await run(mode, chat_ids, args.senders, args.messages)
+            print(
+                f"{result['mode']:>16}: {result['messages_per_s']:.0f} msg/s, "
+                f"p50 {result['p50_ms']:.1f}ms, p99 {result['p99_ms']:.1f}ms"
+            )
+    finally:
+        await cleanup(chat_ids)
+        await get_engine().dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,8 +1,9 @@
 import os
 import uuid
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta, timezone
 from typing import AsyncGenerator, AsyncIterator
-from unittest.mock import AsyncMock, Mock
+from unittest.mock import AsyncMock, MagicMock, Mock
 
 import httpx
 import jwt
@@ -13,11 +14,13 @@ from fastapi import FastAPI
 from redis.asyncio import Redis
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 
-from app.database import Base, get_db, get_redis_client
+from app.database import Base, get_db, get_redis_client, get_replica_db
 from app.dependencies import get_current_user_data
 from app.main import get_app
 from app.schemas import TokenData
 from app.services.kafka_producer import KafkaProducerService, get_kafka_producer
+from app.services.message_ingestor import MessageIngestor, get_message_ingestor
+from app.services.read_state import ADVANCE_SCRIPT, VERSION_SCRIPT
 from app.settings import get_settings
 
 
@@ -100,7 +103,7 @@ async def client(app: FastAPI) -> AsyncGenerator[httpx.AsyncClient, None]:
 @pytest.fixture
 def mock_kafka_producer() -> KafkaProducerService:
     mock_service = Mock(spec=KafkaProducerService)
-    mock_service.publish_event = AsyncMock()
+    mock_service.publish_batch = AsyncMock()
     mock_service.start = AsyncMock()
     mock_service.stop = AsyncMock()
     return mock_service
@@ -110,9 +113,38 @@ def mock_kafka_producer() -> KafkaProducerService:
 def mock_redis_client() -> Redis:
     mock_redis = Mock(spec=Redis)
     mock_redis.exists = AsyncMock(return_value=False)
+    mock_redis.hdel = AsyncMock()
+    mock_redis.delete = AsyncMock()
+    mock_redis.hgetall = AsyncMock(return_value={})
+    mock_redis.hmget = AsyncMock(return_value=[])
+    # Read cursor advances answer with the requested seq, versions stay put
+    scripts = {ADVANCE_SCRIPT: lambda args: args[3], VERSION_SCRIPT: lambda args: "v"}
+    mock_redis.eval = AsyncMock(
+        side_effect=lambda script, numkeys, *args: scripts.get(
+            script, lambda args: None
+        )(args)
+    )
+
+    pipeline = MagicMock()
+    pipeline.__aenter__.return_value = pipeline
+    pipeline.execute = AsyncMock(return_value=[])
+    mock_redis.pipeline = Mock(return_value=pipeline)
     return mock_redis
 
 
+@pytest.fixture
+async def message_ingestor(
+    db_session: AsyncSession,
+) -> AsyncGenerator[MessageIngestor, None]:
+    @asynccontextmanager
+    async def session_factory():
+        yield db_session
+
+    ingestor = MessageIngestor(get_settings(), session_factory)
+    yield ingestor
+    await ingestor.stop()
+
+
 @pytest.fixture
 def current_user_id() -> uuid.UUID:
     return uuid.uuid4()
@@ -124,14 +156,22 @@ def override_dependencies(
     db_session: AsyncSession,
     mock_kafka_producer: KafkaProducerService,
     mock_redis_client: Redis,
+    message_ingestor: MessageIngestor,
     current_user_id: uuid.UUID,
 ):
     app.dependency_overrides[get_db] = lambda: db_session
+    app.dependency_overrides[get_replica_db] = lambda: db_session
     app.dependency_overrides[get_kafka_producer] = lambda: mock_kafka_producer
     app.dependency_overrides[get_redis_client] = lambda: mock_redis_client
+    app.dependency_overrides[get_message_ingestor] = lambda: message_ingestor
     app.dependency_overrides[get_current_user_data] = lambda: TokenData(
         sub=current_user_id,
-        scopes=["chat.message.send", "chat.group.create", "chat.channel.create"],
+        scopes=[
+            "chat.message.send",
+            "chat.message.view_history",
+            "chat.group.create",
+            "chat.channel.create",
+        ],
         sid=uuid.uuid4(),
         jti=uuid.uuid4(),
     )
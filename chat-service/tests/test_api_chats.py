@@ -1,28 +1,40 @@
+import io
 import uuid
+from datetime import timedelta
+from unittest.mock import AsyncMock
 
 import pytest
+from fastapi import UploadFile
+from sqlalchemy import func, select, update
 
-from app.models import ChatType, MemberRole
+from app import crud
+from app.dependencies import get_current_user_data
+from app.models import Chat, ChatMember, ChatType, MemberRole, OutboxEvent
+from app.schemas import TokenData
+from app.services.bulk_membership import READ_SIZE, iter_user_id_chunks
+from app.services.member_activity import MemberActivitySync
+from app.settings import get_settings
 
 
 @pytest.mark.asyncio
-async def test_create_dm_flow(client, current_user_id, mock_kafka_producer):
+async def test_create_dm_flow(client, current_user_id, db_session):
     target_user_id = uuid.uuid4()
 
     resp = await client.post(f"/api/v1/chats/dm/{target_user_id}")
     assert resp.status_code == 200
     data = resp.json()
     assert data["type"] == "DM"
-    assert len(data["members"]) == 2
-
-    mock_kafka_producer.publish_event.assert_called_with(
-        "chat_created", {"chat_id": data["id"], "type": "DM"}
-    )
+    assert data["member_count"] == 2
 
     resp2 = await client.post(f"/api/v1/chats/dm/{target_user_id}")
     assert resp2.status_code == 200
     assert resp2.json()["id"] == data["id"]
 
+    events = (await db_session.execute(select(OutboxEvent))).scalars().all()
+    assert [(e.event_type, e.payload) for e in events] == [
+        ("chat_created", {"chat_id": data["id"], "type": "DM"})
+    ]
+
 
 @pytest.mark.asyncio
 async def test_group_chat_management(client, current_user_id):
@@ -39,7 +51,11 @@ async def test_group_chat_management(client, current_user_id):
 
     details_resp = await client.get(f"/api/v1/chats/{chat_id}")
     assert details_resp.status_code == 200
-    members = details_resp.json()["members"]
+    assert details_resp.json()["member_count"] == 2
+
+    members_resp = await client.get(f"/api/v1/chats/{chat_id}/members")
+    assert members_resp.status_code == 200
+    members = members_resp.json()["items"]
     assert any(
         m["user_id"] == str(current_user_id) and m["role"] == "OWNER" for m in members
     )
@@ -66,11 +82,55 @@ async def test_channel_search(client):
         "/api/v1/channels/public/search", params={"query": "News"}
     )
     assert search_resp.status_code == 200
-    results = search_resp.json()
+    results = search_resp.json()["items"]
     assert len(results) >= 1
     assert any("News" in c["name"] for c in results)
 
 
+@pytest.mark.asyncio
+async def test_channel_search_ranking_and_pagination(client):
+    for i in range(5):
+        await client.post(
+            "/api/v1/chats/channel",
+            json={"name": f"Gardening {i}", "description": "plants and soil"},
+        )
+    # Matching on the description only, but more members
+    big = await client.post(
+        "/api/v1/chats/channel",
+        json={"name": "Allotment", "description": "gardening club"},
+    )
+    big_id = big.json()["id"]
+    await client.post(
+        f"/api/v1/chats/{big_id}/participants/bulk",
+        json={"add": [str(uuid.uuid4()) for _ in range(50)]},
+    )
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"query": "garden", "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        page = (
+            await client.get("/api/v1/channels/public/search", params=params)
+        ).json()
+        seen.extend(page["items"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+    assert len(seen) == 6
+    assert len({c["id"] for c in seen}) == 6
+    assert seen[0]["id"] == big_id
+    scores = [c["score"] for c in seen]
+    assert scores == sorted(scores, reverse=True)
+
+    bad = await client.get(
+        "/api/v1/channels/public/search", params={"query": "garden", "cursor": "x"}
+    )
+    assert bad.status_code == 400
+
+
 @pytest.mark.asyncio
 async def test_leave_and_delete_chat(client, current_user_id):
     resp = await client.post("/api/v1/chats/group", json={"name": "Temp Group"})
@@ -85,3 +145,250 @@ async def test_leave_and_delete_chat(client, current_user_id):
 
     get_resp = await client.get(f"/api/v1/chats/{chat_id}")
     assert get_resp.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_list_my_chats_pagination(client):
+    for i in range(3):
+        await client.post("/api/v1/chats/group", json={"name": f"Group {i}"})
+
+    resp = await client.get("/api/v1/chats", params={"limit": 2})
+    assert resp.status_code == 200
+    page = resp.json()
+    assert len(page["items"]) == 2
+    assert page["next_cursor"]
+
+    resp = await client.get(
+        "/api/v1/chats", params={"limit": 2, "cursor": page["next_cursor"]}
+    )
+    page2 = resp.json()
+    assert len(page2["items"]) == 1
+    assert page2["next_cursor"] is None
+    ids = {c["id"] for c in page["items"] + page2["items"]}
+    assert len(ids) == 3
+
+    bad = await client.get("/api/v1/chats", params={"cursor": "garbage"})
+    assert bad.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_chat_batch_returns_visible_chats_in_order(client, db_session):
+    resp = await client.post("/api/v1/chats/group", json={"name": "Mine"})
+    mine = resp.json()["id"]
+    other = uuid.uuid4()
+    private = await crud.create_group_or_channel(
+        db_session, other, ChatType.GROUP, "Private", {}
+    )
+    public = await crud.create_group_or_channel(
+        db_session, other, ChatType.CHANNEL, "Public", {"is_public": True}
+    )
+    requested = [str(public.id), str(uuid.uuid4()), str(private.id), mine, mine]
+
+    resp = await client.post("/api/v1/chats/batch", json={"chat_ids": requested})
+    assert resp.status_code == 200
+    items = resp.json()["items"]
+    assert [(c["id"], c["role"]) for c in items] == [
+        (str(public.id), None),
+        (mine, "OWNER"),
+    ]
+    assert "members" not in items[1] and "settings" not in items[1]
+
+    resp = await client.post(
+        "/api/v1/chats/batch", json={"chat_ids": requested, "member_only": True}
+    )
+    assert [c["id"] for c in resp.json()["items"]] == [mine]
+
+    too_many = [str(uuid.uuid4()) for _ in range(501)]
+    resp = await client.post("/api/v1/chats/batch", json={"chat_ids": too_many})
+    assert resp.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_chat_details_conditional_get(client):
+    resp = await client.post("/api/v1/chats/group", json={"name": "Tagged"})
+    chat_id = resp.json()["id"]
+
+    resp = await client.get(f"/api/v1/chats/{chat_id}")
+    etag = resp.headers["etag"]
+    assert etag.startswith('W/"')
+
+    resp = await client.get(
+        f"/api/v1/chats/{chat_id}", headers={"If-None-Match": f'"x", {etag}'}
+    )
+    assert resp.status_code == 304
+    assert resp.headers["etag"] == etag
+    assert resp.content == b""
+
+    await client.post(
+        f"/api/v1/chats/{chat_id}/participants", json={"user_id": str(uuid.uuid4())}
+    )
+    resp = await client.get(f"/api/v1/chats/{chat_id}", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.json()["member_count"] == 2
+    assert resp.headers["etag"] != etag
+
+    resp = await client.get(
+        f"/api/v1/chats/{uuid.uuid4()}", headers={"If-None-Match": "*"}
+    )
+    assert resp.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_inbox_conditional_get(client, db_session, monkeypatch):
+    resp = await client.post("/api/v1/chats/group", json={"name": "Inbox"})
+    chat_id = resp.json()["id"]
+    # The test transaction has one now(): date the chat back so activity shows
+    earlier = func.now() - timedelta(minutes=1)
+    await db_session.execute(
+        update(Chat).where(Chat.id == chat_id).values(last_activity_at=earlier)
+    )
+    await db_session.execute(
+        update(ChatMember)
+        .where(ChatMember.chat_id == chat_id)
+        .values(last_activity_at=earlier)
+    )
+
+    etag = (await client.get("/api/v1/chats")).headers["etag"]
+    # Answered from the versions alone, the page is never read
+    with monkeypatch.context() as patched:
+        patched.setattr(crud, "get_user_chats", AsyncMock(side_effect=AssertionError))
+        resp = await client.get("/api/v1/chats", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+
+    await client.post(f"/api/v1/chats/{chat_id}/messages", json={"content": "hi"})
+    await MemberActivitySync(get_settings()).sync_once(db_session)
+    resp = await client.get("/api/v1/chats", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.json()["items"][0]["last_message_preview"] == "hi"
+
+
+@pytest.mark.asyncio
+async def test_member_listing_pages_and_filters_by_role(client, current_user_id):
+    resp = await client.post("/api/v1/chats/channel", json={"name": "Big Channel"})
+    chat_id = resp.json()["id"]
+    for _ in range(4):
+        await client.post(
+            f"/api/v1/chats/{chat_id}/participants", json={"user_id": str(uuid.uuid4())}
+        )
+
+    dup = await client.post(
+        f"/api/v1/chats/{chat_id}/participants", json={"user_id": str(current_user_id)}
+    )
+    assert dup.status_code == 409
+
+    page = (await client.get(f"/api/v1/chats/{chat_id}/members?limit=3")).json()
+    assert len(page["items"]) == 3
+    page2 = (
+        await client.get(
+            f"/api/v1/chats/{chat_id}/members",
+            params={"limit": 3, "cursor": page["next_cursor"]},
+        )
+    ).json()
+    assert len(page2["items"]) == 2
+    assert page2["next_cursor"] is None
+
+    owners = (
+        await client.get(f"/api/v1/chats/{chat_id}/members", params={"role": "OWNER"})
+    ).json()["items"]
+    assert [m["user_id"] for m in owners] == [str(current_user_id)]
+
+    details = (await client.get(f"/api/v1/chats/{chat_id}")).json()
+    assert details["member_count"] == 5
+
+    target = page["items"][0]["user_id"]
+    if target == str(current_user_id):
+        target = page["items"][1]["user_id"]
+    await client.delete(f"/api/v1/chats/{chat_id}/participants/{target}")
+    details = (await client.get(f"/api/v1/chats/{chat_id}")).json()
+    assert details["member_count"] == 4
+
+
+@pytest.mark.asyncio
+async def test_bulk_participants_add_and_remove(client, current_user_id, db_session):
+    resp = await client.post("/api/v1/chats/channel", json={"name": "Onboarding"})
+    chat_id = resp.json()["id"]
+    user_ids = [str(uuid.uuid4()) for _ in range(5)]
+
+    resp = await client.post(
+        f"/api/v1/chats/{chat_id}/participants/bulk",
+        json={"add": user_ids + [str(current_user_id)]},
+    )
+    assert resp.status_code == 200
+    statuses = {r["user_id"]: r["status"] for r in resp.json()["results"]}
+    assert [statuses[u] for u in user_ids] == ["added"] * 5
+    assert statuses[str(current_user_id)] == "already_member"
+
+    resp = await client.post(
+        f"/api/v1/chats/{chat_id}/participants/bulk",
+        json={"remove": user_ids[:2] + [str(current_user_id)]},
+    )
+    statuses = {r["user_id"]: r["status"] for r in resp.json()["results"]}
+    assert statuses[user_ids[0]] == "removed"
+    assert statuses[str(current_user_id)] == "not_removed"
+
+    details = (await client.get(f"/api/v1/chats/{chat_id}")).json()
+    assert details["member_count"] == 4
+
+    events = (
+        (
+            await db_session.execute(
+                select(OutboxEvent).where(
+                    OutboxEvent.event_type.in_(
+                        ["participants_added", "participants_removed"]
+                    )
+                )
+            )
+        )
+        .scalars()
+        .all()
+    )
+    assert [len(e.payload["user_ids"]) for e in events] == [5, 2]
+
+
+@pytest.mark.asyncio
+async def test_import_participants_from_file(client):
+    resp = await client.post("/api/v1/chats/channel", json={"name": "Imported"})
+    chat_id = resp.json()["id"]
+    user_ids = [str(uuid.uuid4()) for _ in range(3)]
+    content = "\n".join(user_ids + ["not-a-uuid", user_ids[0]]) + "\n"
+
+    resp = await client.post(
+        f"/api/v1/chats/{chat_id}/participants/import",
+        files={"file": ("members.txt", content.encode(), "text/plain")},
+    )
+    assert resp.status_code == 200
+    body = resp.json()
+    assert [r["status"] for r in body["results"]] == ["added"] * 3
+    assert body["invalid"] == ["not-a-uuid"]
+    assert body["invalid_count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_import_splits_comma_separated_ids_across_reads():
+    user_ids = [uuid.uuid4() for _ in range(2 * READ_SIZE // 36)]
+    tokens = [str(u) for u in user_ids] + ["bad"] * 5
+    upload = UploadFile(io.BytesIO(",".join(tokens).encode()))
+
+    chunks, positions = [], []
+    async for chunk in iter_user_id_chunks(upload, 1000, 2):
+        chunks.append(chunk)
+        positions.append(upload.file.tell())
+
+    # One line, several reads long: chunks come out as it streams, no id is cut
+    # in two, and only the first rejected tokens are kept
+    assert positions[0] <= READ_SIZE
+    assert [u for ids, _, _ in chunks for u in ids] == user_ids
+    assert [t for _, invalid, _ in chunks for t in invalid] == ["bad", "bad"]
+    assert sum(count for _, _, count in chunks) == 5
+
+
+@pytest.mark.asyncio
+async def test_metrics_need_the_monitoring_scope(app, client):
+    assert (await client.get("/api/v1/metrics")).status_code == 403
+
+    app.dependency_overrides[get_current_user_data] = lambda: TokenData(
+        sub=uuid.uuid4(), scopes=["system.metrics.monitor"]
+    )
+    resp = await client.get("/api/v1/metrics")
+    assert resp.status_code == 200
+    assert "counters" in resp.json()
@@ -0,0 +1,74 @@
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud
+from app.models import Chat, ChatMember, ChatPurge, ChatType, Message
+from app.services.chat_purger import ChatPurger
+
+
+async def count(db: AsyncSession, column, chat_id) -> int:
+    return await db.scalar(
+        select(func.count()).select_from(column.class_).where(column == chat_id)
+    )
+
+
+@pytest.mark.asyncio
+async def test_delete_hides_chat_and_frees_dm(db_session: AsyncSession):
+    user_a, user_b = uuid.uuid4(), uuid.uuid4()
+    dm = await crud.get_or_create_dm(db_session, user_a, user_b)
+    dm_id = dm.id
+
+    await crud.delete_chat(db_session, dm_id)
+    assert await crud.get_chat(db_session, dm_id) is None
+    assert await crud.get_member(db_session, dm_id, user_a) is None
+    assert await crud.get_user_chats(db_session, user_a, 10) == []
+    assert await db_session.get(ChatPurge, dm_id) is not None
+
+    # The pair can talk again in a fresh chat while the old one is purged
+    fresh = await crud.get_or_create_dm(db_session, user_a, user_b)
+    assert fresh.id != dm_id
+
+
+@pytest.mark.asyncio
+async def test_purge_runs_in_batches_and_resumes(db_session: AsyncSession):
+    owner = uuid.uuid4()
+    chat = await crud.create_group_or_channel(
+        db_session, owner, ChatType.GROUP, "Purged", {}
+    )
+    chat_id = chat.id
+    await crud.create_messages(db_session, chat_id, [(owner, str(i)) for i in range(5)])
+    await crud.upsert_read_states(db_session, [(owner, chat_id, 5)])
+    await db_session.commit()
+    await crud.delete_chat(db_session, chat_id)
+
+    settings = SimpleNamespace(
+        purge_batch_size=2, fanout_enabled=True, purge_fanout_timeout=3600
+    )
+    assert await ChatPurger(settings).purge_batch(db_session) == 2
+    job = await db_session.get(ChatPurge, chat_id)
+    assert (job.phase, job.cursor, job.deleted_rows) == ("messages", "2", 2)
+
+    # A new purger, e.g. after a restart, carries on from the stored cursor
+    purger = ChatPurger(settings)
+    assert await purger.purge_batch(db_session) == 2
+    assert await count(db_session, Message.chat_id, chat_id) == 1
+    assert await purger.purge_batch(db_session) == 1
+    assert (job.phase, job.cursor) == ("reactions", None)
+
+    while await purger.purge_batch(db_session) is not None:
+        pass
+    # The members wait until chat_deleted has been fanned out to them
+    assert job.phase == "members"
+    assert await count(db_session, ChatMember.chat_id, chat_id) == 1
+    await crud.mark_chat_fanned_out(db_session, chat_id)
+    await db_session.commit()
+
+    while await purger.purge_batch(db_session) is not None:
+        pass
+    assert await db_session.get(Chat, chat_id) is None
+    assert await count(db_session, ChatMember.chat_id, chat_id) == 0
+    assert await count(db_session, ChatPurge.chat_id, chat_id) == 0
@@ -1,10 +1,14 @@
 import uuid
+from contextlib import asynccontextmanager
 
 import pytest
+from sqlalchemy import func, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import crud
-from app.models import ChatType, MemberRole
+from app.models import ChatMember, ChatType, MemberRole
+from app.services.member_activity import MemberActivitySync
+from app.settings import get_settings
 
 
 @pytest.mark.asyncio
@@ -19,6 +23,10 @@ async def test_get_or_create_dm(db_session: AsyncSession):
     chat2 = await crud.get_or_create_dm(db_session, user_a, user_b)
     assert chat.id == chat2.id
 
+    chat3 = await crud.get_or_create_dm(db_session, user_b, user_a)
+    assert chat.id == chat3.id
+    assert chat3.dm_key == crud.dm_pair_key(user_a, user_b)
+
 
 @pytest.mark.asyncio
 async def test_create_group_and_get_user_chats(db_session: AsyncSession):
@@ -43,20 +51,28 @@ async def test_search_public_channels(db_session: AsyncSession):
     creator_id = uuid.uuid4()
 
     await crud.create_group_or_channel(
-        db_session, creator_id, ChatType.CHANNEL, "Public News", {"is_public": "true"}
+        db_session, creator_id, ChatType.CHANNEL, "Public News", {"is_public": True}
     )
     await crud.create_group_or_channel(
         db_session,
         creator_id,
         ChatType.CHANNEL,
         "Private Secrets",
-        {"is_public": "false"},
+        {"is_public": False},
+    )
+    await crud.create_group_or_channel(
+        db_session, creator_id, ChatType.GROUP, "News Group", {"is_public": True}
     )
 
     results = await crud.search_public_channels(db_session, "News")
     assert len(results) == 1
     assert results[0].name == "Public News"
 
+    # Prefix match, and operator characters are not passed to to_tsquery
+    results = await crud.search_public_channels(db_session, "publ & !(")
+    assert [r.name for r in results] == ["Public News"]
+    assert await crud.search_public_channels(db_session, "&|!") == []
+
 
 @pytest.mark.asyncio
 async def test_member_and_delete_operations(db_session: AsyncSession):
@@ -72,3 +88,70 @@ async def test_member_and_delete_operations(db_session: AsyncSession):
     await crud.delete_chat(db_session, chat.id)
     deleted_chat = await crud.get_chat_with_members(db_session, chat.id)
     assert deleted_chat is None
+
+
+@pytest.mark.asyncio
+async def test_get_user_chats_keyset_pages(db_session: AsyncSession):
+    user_id = uuid.uuid4()
+    for i in range(5):
+        await crud.create_group_or_channel(
+            db_session, user_id, ChatType.GROUP, f"Group {i}", {}
+        )
+
+    first_page = await crud.get_user_chats(db_session, user_id, limit=3)
+    last = first_page[-1]
+    second_page = await crud.get_user_chats(
+        db_session, user_id, limit=3, after=(last.last_activity_at, last.id)
+    )
+
+    assert len(first_page) == 3
+    assert len(second_page) == 2
+    ids = [row.id for row in first_page + second_page]
+    assert len(set(ids)) == 5
+    keys = [(row.last_activity_at, row.id) for row in first_page + second_page]
+    assert keys == sorted(keys, reverse=True)
+
+
+@pytest.mark.asyncio
+async def test_new_message_moves_chat_to_top_of_members_inbox(
+    db_session: AsyncSession,
+):
+    owner, member = uuid.uuid4(), uuid.uuid4()
+    chat_ids = []
+    for name in ("quiet", "busy"):
+        chat = await crud.create_group_or_channel(
+            db_session, owner, ChatType.GROUP, name, {}
+        )
+        await crud.add_member(db_session, chat.id, member)
+        chat_ids.append(chat.id)
+    # Both chats were last active an hour ago, "busy" more recently
+    for i, chat_id in enumerate(chat_ids):
+        await db_session.execute(
+            update(ChatMember)
+            .where(ChatMember.chat_id == chat_id)
+            .values(
+                last_activity_at=func.now() - func.make_interval(0, 0, 0, 0, 0, 60 - i)
+            )
+        )
+
+    rows = await crud.get_user_chats(db_session, member)
+    assert [row.id for row in rows] == chat_ids[::-1]
+
+    await crud.create_messages(db_session, chat_ids[0], [(owner, "wake up")])
+    await db_session.commit()
+    # The send only queues the chat: the members' keys move in the background
+    rows = await crud.get_user_chats(db_session, member)
+    assert [row.id for row in rows] == chat_ids[::-1]
+
+    @asynccontextmanager
+    async def session_factory():
+        yield db_session
+
+    settings = get_settings().model_copy(update={"member_activity_batch": 1})
+    sync = MemberActivitySync(settings, session_factory)
+    assert await sync.sync_once(db_session) == 1
+    assert await sync.sync_once(db_session) == 0
+    for user_id in (owner, member):
+        rows = await crud.get_user_chats(db_session, user_id)
+        assert [row.id for row in rows] == chat_ids
+        assert rows[0].last_message_preview == "wake up"
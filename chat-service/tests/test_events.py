@@ -0,0 +1,37 @@
+import uuid
+
+import pytest
+
+from app.events import EnvelopeError, decode_event, encode_event, partition_key
+
+
+def test_envelope_round_trip():
+    data = {"chat_id": str(uuid.uuid4()), "type": "GROUP"}
+    raw = encode_event("chat_created", data)
+
+    assert raw[0] == 0xC1
+    assert decode_event(raw) == ("chat_created", data)
+
+
+def test_unregistered_event_uses_generic_schema():
+    raw = encode_event("something_new", {"x": 1})
+    assert raw[2:4] == b"\x00\x00"
+    assert decode_event(raw) == ("something_new", {"x": 1})
+
+
+def test_decode_legacy_json():
+    raw = encode_event("chat_updated", {"chat_id": "1"}, event_format="json")
+    assert decode_event(raw) == ("chat_updated", {"chat_id": "1"})
+
+
+def test_unknown_envelope_version_is_rejected():
+    raw = bytearray(encode_event("chat_updated", {"chat_id": "1"}))
+    raw[1] = 99
+    with pytest.raises(EnvelopeError):
+        decode_event(bytes(raw))
+
+
+def test_partition_key_is_chat_id():
+    chat_id = uuid.uuid4()
+    assert partition_key({"chat_id": str(chat_id)}) == str(chat_id).encode()
+    assert partition_key({"user_id": "1"}) is None
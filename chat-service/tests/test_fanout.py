@@ -0,0 +1,114 @@
+import uuid
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud
+from app.events import encode_event
+from app.models import ChatPurge, ChatType
+from app.services.fanout import ChatMemberSource, FanoutConsumer
+from app.settings import get_settings
+
+
+def fanout_settings(**overrides):
+    return get_settings().model_copy(update=overrides)
+
+
+@pytest.fixture
+def session_factory(db_session: AsyncSession):
+    @asynccontextmanager
+    async def factory():
+        yield db_session
+
+    return factory
+
+
+@pytest.mark.asyncio
+async def test_members_are_chunked_into_delivery_records(
+    db_session: AsyncSession, mock_redis_client, mock_kafka_producer, session_factory
+):
+    owner = uuid.uuid4()
+    chat = await crud.create_group_or_channel(
+        db_session, owner, ChatType.CHANNEL, "Big", {}
+    )
+    chat_id = chat.id
+    await crud.add_members(db_session, chat_id, [uuid.uuid4() for _ in range(6)])
+    await db_session.commit()
+    mock_redis_client.hget = AsyncMock(return_value=None)
+
+    settings = fanout_settings(fanout_page_size=4, fanout_chunk_size=3)
+    members = ChatMemberSource(mock_redis_client, 4, 60)
+    consumer = FanoutConsumer(mock_kafka_producer, members, settings, session_factory)
+    event = {"chat_id": str(chat_id)}
+    record = SimpleNamespace(value=encode_event("chat_updated", event))
+
+    # 7 members in pages of 4: records of 3 + 1, then 3
+    assert await consumer.handle([record]) == 3
+    batches = [
+        call.args[0] for call in mock_kafka_producer.publish_batch.await_args_list
+    ]
+    assert [len(batch) for batch in batches] == [2, 1]
+    deliveries = [data for batch in batches for _, data in batch]
+    assert [len(d["recipients"]) for d in deliveries] == [3, 1, 3]
+    assert {r for d in deliveries for r in d["recipients"]} == {
+        str(user_id)
+        for user_id in await crud.get_member_ids_page(db_session, chat_id, None, 10)
+    }
+    assert deliveries[0]["type"] == "chat_updated"
+    assert deliveries[0]["payload"] == event
+    topic = mock_kafka_producer.publish_batch.await_args.kwargs["topic"]
+    assert topic == "message_events"
+    mock_redis_client.pipeline.return_value.hset.assert_called()
+
+
+@pytest.mark.asyncio
+async def test_removed_member_is_notified_and_cache_dropped(
+    mock_redis_client, mock_kafka_producer, session_factory
+):
+    chat_id, member, removed = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    mock_redis_client.hget = AsyncMock(return_value=str(member))
+
+    members = ChatMemberSource(mock_redis_client, 10, 60)
+    consumer = FanoutConsumer(
+        mock_kafka_producer, members, get_settings(), session_factory
+    )
+    event = {"chat_id": str(chat_id), "user_id": str(removed)}
+    record = SimpleNamespace(value=encode_event("participant_removed", event))
+
+    assert await consumer.handle([record, SimpleNamespace(value=b"\xc1\x09")]) == 2
+    mock_redis_client.delete.assert_awaited_with(f"fanout:members:{chat_id}")
+    recipients = [
+        call.args[0][0][1]["recipients"]
+        for call in mock_kafka_producer.publish_batch.await_args_list
+    ]
+    assert recipients == [[str(removed)], [str(member)]]
+
+
+@pytest.mark.asyncio
+async def test_chat_deleted_releases_members_to_the_purger(
+    db_session: AsyncSession, mock_redis_client, mock_kafka_producer, session_factory
+):
+    owner = uuid.uuid4()
+    chat = await crud.create_group_or_channel(
+        db_session, owner, ChatType.GROUP, "Gone", {}
+    )
+    chat_id = chat.id
+    await crud.delete_chat(db_session, chat_id)
+    mock_redis_client.hget = AsyncMock(return_value=None)
+
+    members = ChatMemberSource(mock_redis_client, 10, 60)
+    consumer = FanoutConsumer(
+        mock_kafka_producer, members, get_settings(), session_factory
+    )
+    record = SimpleNamespace(
+        value=encode_event("chat_deleted", {"chat_id": str(chat_id)})
+    )
+    assert await consumer.handle([record]) == 1
+    deliveries = mock_kafka_producer.publish_batch.await_args.args[0]
+    assert deliveries[0][1]["recipients"] == [str(owner)]
+    job = await db_session.get(ChatPurge, chat_id)
+    await db_session.refresh(job)
+    assert job.fanned_out_at is not None
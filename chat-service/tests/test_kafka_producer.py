@@ -0,0 +1,53 @@
+import asyncio
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+from aiokafka import AIOKafkaProducer
+
+from app.events import decode_event
+from app.metrics import metrics
+from app.services.kafka_producer import KafkaProducerService
+from app.settings import get_settings
+
+
+def make_service() -> KafkaProducerService:
+    service = KafkaProducerService(get_settings())
+    service.producer = Mock(spec=AIOKafkaProducer)
+    return service
+
+
+@pytest.mark.asyncio
+async def test_batch_waits_for_every_ack():
+    service = make_service()
+    loop = asyncio.get_running_loop()
+    acks = [loop.create_future(), loop.create_future()]
+    service.producer.send = AsyncMock(side_effect=acks)
+    delivered = metrics.counters["kafka.delivered"]
+
+    publish = asyncio.create_task(
+        service.publish_batch(
+            [("chat_updated", {"chat_id": "1"}), ("chat_deleted", {"chat_id": "2"})]
+        )
+    )
+    acks[0].set_result(None)
+    await asyncio.sleep(0)
+    assert not publish.done()
+
+    acks[1].set_result(None)
+    await publish
+    assert metrics.counters["kafka.delivered"] == delivered + 2
+    calls = service.producer.send.await_args_list
+    assert [call.kwargs["key"] for call in calls] == [b"1", b"2"]
+    assert decode_event(calls[1].args[1]) == ("chat_deleted", {"chat_id": "2"})
+
+
+@pytest.mark.asyncio
+async def test_batch_fails_when_a_record_is_not_acked():
+    service = make_service()
+    ack = asyncio.get_running_loop().create_future()
+    ack.set_exception(RuntimeError("broker down"))
+    service.producer.send = AsyncMock(return_value=ack)
+
+    with pytest.raises(RuntimeError):
+        await service.publish_batch([("chat_updated", {"chat_id": "1"})], topic="t")
+    assert service.producer.send.await_args.args[0] == "t"
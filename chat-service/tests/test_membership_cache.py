@@ -0,0 +1,108 @@
+import uuid
+from unittest.mock import ANY, AsyncMock
+
+import pytest
+
+from app.metrics import metrics
+from app.models import MemberRole
+from app.services.membership_cache import (
+    FILL_SCRIPT,
+    INVALIDATE_SCRIPT,
+    NOT_MEMBER,
+    MembershipCache,
+)
+
+
+@pytest.mark.asyncio
+async def test_batch_check_falls_back_to_db_and_fills_cache(
+    client, current_user_id, mock_redis_client
+):
+    resp = await client.post("/api/v1/chats/group", json={"name": "Cached"})
+    chat_id = resp.json()["id"]
+    stranger = str(uuid.uuid4())
+    pipeline = mock_redis_client.pipeline.return_value
+    # Both fields missing, the chat was never invalidated
+    pipeline.execute.return_value = [[None, None, None]]
+
+    resp = await client.post(
+        "/api/v1/chats/members/check",
+        json={
+            "pairs": [
+                {"chat_id": chat_id, "user_id": str(current_user_id)},
+                {"chat_id": chat_id, "user_id": stranger},
+            ]
+        },
+    )
+    assert resp.status_code == 200
+    results = resp.json()["results"]
+    assert results[0]["is_member"] is True
+    assert results[0]["role"] == "OWNER"
+    assert results[1]["is_member"] is False
+
+    pipeline.eval.assert_called_with(
+        FILL_SCRIPT,
+        1,
+        f"membership:{chat_id}",
+        "",
+        ANY,
+        str(current_user_id),
+        "OWNER",
+        stranger,
+        NOT_MEMBER,
+    )
+
+
+@pytest.mark.asyncio
+async def test_fill_is_tied_to_the_generation_read(mock_redis_client):
+    chat_id, user_id = uuid.uuid4(), uuid.uuid4()
+    pipeline = mock_redis_client.pipeline.return_value
+    # Miss under generation "g1"; the fill then loses to an invalidation
+    pipeline.execute.side_effect = [[[None, "g1"]], [0]]
+    db = AsyncMock()
+    stale = metrics.counters["membership_cache.stale_fills"]
+
+    cache = MembershipCache(mock_redis_client, ttl=60)
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(
+            "app.crud.get_member_roles",
+            AsyncMock(return_value={(chat_id, user_id): MemberRole.MEMBER}),
+        )
+        assert await cache.get_role(db, chat_id, user_id) == MemberRole.MEMBER
+
+    pipeline.eval.assert_called_with(
+        FILL_SCRIPT, 1, f"membership:{chat_id}", "g1", 60, str(user_id), "MEMBER"
+    )
+    assert metrics.counters["membership_cache.stale_fills"] == stale + 1
+
+
+@pytest.mark.asyncio
+async def test_cache_hit_skips_db(mock_redis_client):
+    chat_id, member, stranger = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    pipeline = mock_redis_client.pipeline.return_value
+    pipeline.execute.return_value = [["ADMIN", NOT_MEMBER, None]]
+    hits = metrics.counters["membership_cache.hits"]
+
+    cache = MembershipCache(mock_redis_client, ttl=60)
+    roles = await cache.lookup(None, [(chat_id, member), (chat_id, stranger)])
+
+    assert roles == {(chat_id, member): MemberRole.ADMIN, (chat_id, stranger): None}
+    assert metrics.counters["membership_cache.hits"] == hits + 2
+
+
+@pytest.mark.asyncio
+async def test_participant_mutation_invalidates_cache(client, mock_redis_client):
+    resp = await client.post("/api/v1/chats/group", json={"name": "Invalidate"})
+    chat_id = resp.json()["id"]
+    new_user_id = str(uuid.uuid4())
+
+    await client.post(
+        f"/api/v1/chats/{chat_id}/participants", json={"user_id": new_user_id}
+    )
+    mock_redis_client.eval.assert_awaited_with(
+        INVALIDATE_SCRIPT, 1, f"membership:{chat_id}", ANY, ANY, new_user_id
+    )
+
+    await client.delete(f"/api/v1/chats/{chat_id}")
+    mock_redis_client.eval.assert_awaited_with(
+        INVALIDATE_SCRIPT, 1, f"membership:{chat_id}", ANY, ANY
+    )
@@ -0,0 +1,170 @@
+import json
+import uuid
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud
+from app.metrics import metrics
+from app.models import ChatType
+from app.services.message_cache import (
+    FLOOR,
+    GENERATION,
+    INVALIDATE_SCRIPT,
+    LAST,
+    POPULATE_SCRIPT,
+    MessageTailCache,
+)
+
+
+def populated(mock_redis_client) -> tuple:
+    """The generation and mapping of the last populate."""
+    script, _, _, generation, _, *pairs = mock_redis_client.eval.call_args.args
+    assert script == POPULATE_SCRIPT
+    return generation, dict(zip(pairs[::2], pairs[1::2]))
+
+
+def tail_fields(chat_id, seqs, floor, last):
+    fields = {
+        str(seq): json.dumps({"chat_id": str(chat_id), "seq": seq, "content": str(seq)})
+        for seq in seqs
+    }
+    fields.update({FLOOR: str(floor), LAST: str(last)})
+    return fields
+
+
+@pytest.mark.asyncio
+async def test_miss_loads_from_db_and_populates(
+    db_session: AsyncSession, mock_redis_client
+):
+    user_id = uuid.uuid4()
+    chat = await crud.create_group_or_channel(
+        db_session, user_id, ChatType.GROUP, "Tail", {}
+    )
+    await crud.create_messages(db_session, chat.id, [(user_id, "a"), (user_id, "b")])
+    misses = metrics.counters["message_tail.misses"]
+
+    cache = MessageTailCache(mock_redis_client, size=5, ttl=60)
+    page = await cache.page(db_session, chat.id, 10)
+
+    assert [m["content"] for m in page] == ["a", "b"]
+    assert metrics.counters["message_tail.misses"] == misses + 1
+    generation, mapping = populated(mock_redis_client)
+    assert generation == ""
+    assert mapping[FLOOR] == 0 and mapping[LAST] == 2
+    assert json.loads(mapping["1"])["content"] == "a"
+
+
+@pytest.mark.asyncio
+async def test_hit_serves_pages_without_db(mock_redis_client):
+    chat_id = uuid.uuid4()
+    mock_redis_client.hgetall.return_value = tail_fields(
+        chat_id, range(1, 11), floor=0, last=10
+    )
+    hits = metrics.counters["message_tail.hits"]
+
+    cache = MessageTailCache(mock_redis_client, size=20, ttl=60)
+    assert [m["seq"] for m in await cache.page(None, chat_id, 3)] == [8, 9, 10]
+    assert [m["seq"] for m in await cache.page(None, chat_id, 3, before=3)] == [1, 2]
+    assert [m["seq"] for m in await cache.page(None, chat_id, 3, after=4)] == [5, 6, 7]
+    assert metrics.counters["message_tail.hits"] == hits + 3
+    assert metrics.gauges["message_tail.hit_ratio"] > 0
+
+
+@pytest.mark.asyncio
+async def test_page_beyond_tail_and_incoherent_tail_go_to_db(
+    db_session: AsyncSession, mock_redis_client
+):
+    user_id = uuid.uuid4()
+    chat = await crud.create_group_or_channel(
+        db_session, user_id, ChatType.GROUP, "Deep", {}
+    )
+    await crud.create_messages(
+        db_session, chat.id, [(user_id, f"m{i}") for i in range(1, 11)]
+    )
+    cache = MessageTailCache(mock_redis_client, size=4, ttl=60)
+
+    # Tail holds 7..10: a page before 8 needs rows the tail does not have
+    mock_redis_client.hgetall.return_value = tail_fields(
+        chat.id, range(7, 11), floor=6, last=10
+    )
+    page = await cache.page(db_session, chat.id, 3, before=8)
+    assert [m.content for m in page] == ["m5", "m6", "m7"]
+
+    # A writer lost the race with another: newest field is not LAST
+    misses = metrics.counters["message_tail.misses"]
+    mock_redis_client.hgetall.return_value = tail_fields(
+        chat.id, range(7, 11), floor=6, last=9
+    )
+    page = await cache.page(db_session, chat.id, 2)
+    assert [m["content"] for m in page] == ["m9", "m10"]
+    assert metrics.counters["message_tail.misses"] == misses + 1
+
+
+@pytest.mark.asyncio
+async def test_append_trims_window(mock_redis_client, message_ingestor, db_session):
+    user_id = uuid.uuid4()
+    chat = await crud.create_group_or_channel(
+        db_session, user_id, ChatType.GROUP, "Append", {}
+    )
+    message_ingestor.tail_cache = MessageTailCache(mock_redis_client, size=1, ttl=60)
+
+    await message_ingestor.submit(chat.id, user_id, "first")
+    await message_ingestor.submit(chat.id, user_id, "second")
+
+    pipeline = mock_redis_client.pipeline.return_value
+    mapping = pipeline.hset.call_args.kwargs["mapping"]
+    assert mapping[LAST] == 2
+    assert json.loads(mapping["2"])["content"] == "second"
+    pipeline.hdel.assert_called_with(f"messages:tail:{chat.id}", "1", "r:1")
+
+
+@pytest.mark.asyncio
+async def test_edit_and_delete_invalidate_tail(client, mock_redis_client):
+    resp = await client.post("/api/v1/chats/group", json={"name": "Edits"})
+    chat_id = resp.json()["id"]
+    await client.post(f"/api/v1/chats/{chat_id}/messages", json={"content": "tpyo"})
+
+    resp = await client.patch(
+        f"/api/v1/chats/{chat_id}/messages/1", json={"content": "typo"}
+    )
+    assert resp.status_code == 200
+    assert resp.json()["content"] == "typo"
+    assert resp.json()["edited_at"] is not None
+    script, _, key, *_ = mock_redis_client.eval.call_args.args
+    assert (script, key) == (INVALIDATE_SCRIPT, f"messages:tail:{chat_id}")
+
+    mock_redis_client.eval.reset_mock()
+    resp = await client.delete(f"/api/v1/chats/{chat_id}/messages/1")
+    assert resp.status_code == 204
+    script, _, key, *_ = mock_redis_client.eval.call_args.args
+    assert (script, key) == (INVALIDATE_SCRIPT, f"messages:tail:{chat_id}")
+
+    history = await client.get(f"/api/v1/chats/{chat_id}/messages")
+    assert history.json()["items"] == []
+    resp = await client.delete(f"/api/v1/chats/{chat_id}/messages/1")
+    assert resp.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_populate_is_tied_to_the_generation_read(
+    db_session: AsyncSession, mock_redis_client
+):
+    user_id = uuid.uuid4()
+    chat = await crud.create_group_or_channel(
+        db_session, user_id, ChatType.GROUP, "Racy", {}
+    )
+    await crud.create_messages(db_session, chat.id, [(user_id, "old")])
+    # Invalidated by an edit: only the generation is left
+    mock_redis_client.hgetall.return_value = {GENERATION: "g1"}
+    mock_redis_client.eval.side_effect = None
+    mock_redis_client.eval.return_value = 0
+    stale = metrics.counters["message_tail.stale_populates"]
+
+    cache = MessageTailCache(mock_redis_client, size=5, ttl=60)
+    page = await cache.page(db_session, chat.id, 10)
+
+    # The reader is answered from Postgres; the write is conditional on "g1"
+    assert [m["content"] for m in page] == ["old"]
+    assert populated(mock_redis_client)[0] == "g1"
+    assert metrics.counters["message_tail.stale_populates"] == stale + 1
@@ -0,0 +1,140 @@
+import asyncio
+import uuid
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud
+from app.models import ChatType, Message
+from app.services.message_ingestor import MessageIngestor
+from app.settings import get_settings
+
+
+@pytest.mark.asyncio
+async def test_concurrent_sends_share_one_commit(
+    db_session: AsyncSession, message_ingestor: MessageIngestor
+):
+    user_id = uuid.uuid4()
+    chats = [
+        await crud.create_group_or_channel(
+            db_session, user_id, ChatType.GROUP, f"Chat {i}", {}
+        )
+        for i in range(2)
+    ]
+    commits = []
+    message_ingestor.on_commit = lambda: commits.append(1)
+
+    rows = await asyncio.gather(
+        *(message_ingestor.submit(chats[i % 2].id, user_id, f"m{i}") for i in range(10))
+    )
+
+    assert len(commits) == 1
+    assert [r.seq for r in rows if r.chat_id == chats[0].id] == [1, 2, 3, 4, 5]
+    assert [r.content for r in rows] == [f"m{i}" for i in range(10)]
+    assert await db_session.scalar(select(func.count()).select_from(Message)) == 10
+
+
+@pytest.mark.asyncio
+async def test_batch_flushes_at_size_limit(db_session: AsyncSession):
+    user_id = uuid.uuid4()
+    chat = await crud.create_group_or_channel(
+        db_session, user_id, ChatType.GROUP, "Sized", {}
+    )
+
+    @asynccontextmanager
+    async def session_factory():
+        yield db_session
+
+    settings = get_settings().model_copy(
+        update={"ingest_batch_size": 4, "ingest_max_delay": 1.0}
+    )
+    ingestor = MessageIngestor(settings, session_factory)
+    commits = []
+    ingestor.on_commit = lambda: commits.append(1)
+
+    await asyncio.wait_for(
+        asyncio.gather(*(ingestor.submit(chat.id, user_id, "x") for i in range(8))),
+        timeout=0.5,
+    )
+    await ingestor.stop()
+    assert len(commits) == 2
+
+
+@pytest.mark.asyncio
+async def test_stop_flushes_batch_being_collected(db_session: AsyncSession):
+    user_id = uuid.uuid4()
+    chat = await crud.create_group_or_channel(
+        db_session, user_id, ChatType.GROUP, "Stopping", {}
+    )
+
+    @asynccontextmanager
+    async def session_factory():
+        yield db_session
+
+    # The writer is still waiting for more messages when it gets cancelled
+    settings = get_settings().model_copy(update={"ingest_max_delay": 60.0})
+    ingestor = MessageIngestor(settings, session_factory)
+    sends = [asyncio.create_task(ingestor.submit(chat.id, user_id, "x"))]
+    await asyncio.sleep(0.05)
+    sends.append(asyncio.create_task(ingestor.submit(chat.id, user_id, "y")))
+    await asyncio.sleep(0.05)
+
+    await ingestor.stop()
+    rows = await asyncio.wait_for(asyncio.gather(*sends), timeout=1)
+    assert [row.seq for row in rows] == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_unknown_chat_and_failed_chat_do_not_fail_others(
+    db_session: AsyncSession, message_ingestor: MessageIngestor
+):
+    user_id = uuid.uuid4()
+    chat = await crud.create_group_or_channel(
+        db_session, user_id, ChatType.GROUP, "Survivor", {}
+    )
+
+    results = await asyncio.gather(
+        message_ingestor.submit(chat.id, user_id, "ok"),
+        message_ingestor.submit(uuid.uuid4(), user_id, "nowhere"),
+        return_exceptions=True,
+    )
+    assert results[0].seq == 1
+    assert results[1] is None
+
+    # NUL bytes are rejected by Postgres: only that chat's sender sees the error
+    other = await crud.create_group_or_channel(
+        db_session, user_id, ChatType.GROUP, "Poisoned", {}
+    )
+    results = await asyncio.gather(
+        message_ingestor.submit(chat.id, user_id, "fine"),
+        message_ingestor.submit(other.id, user_id, "bad\x00"),
+        return_exceptions=True,
+    )
+    assert results[0].seq == 2
+    assert isinstance(results[1], Exception)
+
+
+@pytest.mark.asyncio
+async def test_failed_cache_update_does_not_rewrite_committed_messages(
+    db_session: AsyncSession, message_ingestor: MessageIngestor
+):
+    user_id = uuid.uuid4()
+    chats = [
+        await crud.create_group_or_channel(
+            db_session, user_id, ChatType.GROUP, f"Cached {i}", {}
+        )
+        for i in range(2)
+    ]
+    message_ingestor.tail_cache = Mock(append=AsyncMock(side_effect=RuntimeError))
+    message_ingestor.read_cursors = Mock(advance_many=AsyncMock())
+
+    rows = await asyncio.gather(
+        *(message_ingestor.submit(chat.id, user_id, "once") for chat in chats)
+    )
+    assert [row.seq for row in rows] == [1, 1]
+    assert await db_session.scalar(select(func.count()).select_from(Message)) == 2
+    # Cursors are still advanced for both chats
+    assert message_ingestor.read_cursors.advance_many.await_count == 2
@@ -0,0 +1,141 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud
+from app.metrics import metrics
+from app.models import ChatMember, ChatType, MemberRole
+from app.services.message_scheduler import MessageScheduler, get_message_scheduler
+from app.settings import get_settings
+
+
+@pytest.fixture
+def scheduler(app) -> MessageScheduler:
+    scheduler = MessageScheduler(get_settings())
+    app.dependency_overrides[get_message_scheduler] = lambda: scheduler
+    return scheduler
+
+
+def send_at(**delta) -> str:
+    return (datetime.now(timezone.utc) + timedelta(**delta)).isoformat()
+
+
+@pytest.mark.asyncio
+async def test_claim_posts_due_messages_once(db_session: AsyncSession):
+    owner = uuid.uuid4()
+    chat = await crud.create_group_or_channel(
+        db_session, owner, ChatType.CHANNEL, "Scheduled", {}
+    )
+    chat_id = chat.id
+    await crud.create_scheduled_message(db_session, chat_id, owner, "now", 0)
+    await crud.create_scheduled_message(db_session, chat_id, owner, "later", 3600)
+    await db_session.commit()
+
+    scheduler = MessageScheduler(get_settings())
+    assert await scheduler.claim_due(db_session) == 1
+    message = await crud.get_message(db_session, chat_id, 1)
+    assert (message.sender_id, message.content) == (owner, "now")
+
+    # Claimed rows are gone: another claimer has nothing left to post
+    assert await scheduler.claim_due(db_session) == 0
+    pending = await crud.get_scheduled_messages(db_session, chat_id, owner)
+    assert [row.content for row in pending] == ["later"]
+
+
+@pytest.mark.asyncio
+async def test_claim_drops_messages_of_senders_who_may_no_longer_post(
+    db_session: AsyncSession,
+):
+    owner, leaver, demoted = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    chat = await crud.create_group_or_channel(
+        db_session, owner, ChatType.CHANNEL, "Rules", {}
+    )
+    chat_id = chat.id
+    await crud.add_member(db_session, chat_id, leaver, MemberRole.ADMIN)
+    await crud.add_member(db_session, chat_id, demoted, MemberRole.ADMIN)
+    for sender in (owner, leaver, demoted):
+        await crud.create_scheduled_message(db_session, chat_id, sender, "due", 0)
+    await crud.remove_member(db_session, chat_id, leaver)
+    await db_session.execute(
+        update(ChatMember)
+        .where(ChatMember.chat_id == chat_id, ChatMember.user_id == demoted)
+        .values(role=MemberRole.MEMBER)
+    )
+    await db_session.commit()
+
+    scheduler = MessageScheduler(get_settings())
+    dropped = metrics.counters["scheduler.dropped"]
+    assert await scheduler.claim_due(db_session) == 3
+    assert metrics.counters["scheduler.dropped"] == dropped + 2
+    rows = await crud.get_messages(db_session, chat_id)
+    assert [row.sender_id for row in rows] == [owner]
+    assert await crud.get_scheduled_messages(db_session, chat_id, leaver) == []
+
+
+@pytest.mark.asyncio
+async def test_window_loads_only_near_due_times(db_session: AsyncSession):
+    owner = uuid.uuid4()
+    chat = await crud.create_group_or_channel(
+        db_session, owner, ChatType.GROUP, "Window", {}
+    )
+    soon = await crud.create_scheduled_message(db_session, chat.id, owner, "a", 30)
+    await crud.create_scheduled_message(db_session, chat.id, owner, "b", 3600)
+    await db_session.commit()
+
+    scheduler = MessageScheduler(get_settings())
+    assert await scheduler.load_window(db_session) == 1
+    assert [schedule_id for _, schedule_id in scheduler._heap] == [soon.id]
+
+    # Reloading does not push the same schedule twice
+    await scheduler.load_window(db_session)
+    assert len(scheduler._heap) == 1
+
+
+@pytest.mark.asyncio
+async def test_schedule_list_and_cancel(client, current_user_id, scheduler):
+    resp = await client.post("/api/v1/chats/group", json={"name": "Later"})
+    chat_id = resp.json()["id"]
+    url = f"/api/v1/chats/{chat_id}/messages/scheduled"
+
+    resp = await client.post(url, json={"content": "hi", "send_at": send_at(seconds=5)})
+    assert resp.status_code == 201
+    schedule_id = resp.json()["id"]
+    assert resp.json()["sender_id"] == str(current_user_id)
+    assert [entry[1] for entry in scheduler._heap] == [uuid.UUID(schedule_id)]
+
+    # Outside the window: found by a later reload instead
+    resp = await client.post(url, json={"content": "yo", "send_at": send_at(days=1)})
+    assert resp.status_code == 201
+    assert len(scheduler._heap) == 1
+
+    items = (await client.get(url)).json()["items"]
+    assert [item["content"] for item in items] == ["hi", "yo"]
+
+    assert (await client.delete(f"{url}/{schedule_id}")).status_code == 204
+    assert (await client.delete(f"{url}/{schedule_id}")).status_code == 404
+    assert len((await client.get(url)).json()["items"]) == 1
+
+
+@pytest.mark.asyncio
+async def test_schedule_rejects_bad_times_and_non_members(client, scheduler):
+    resp = await client.post("/api/v1/chats/group", json={"name": "Times"})
+    url = f"/api/v1/chats/{resp.json()['id']}/messages/scheduled"
+
+    resp = await client.post(url, json={"content": "x", "send_at": send_at(minutes=-1)})
+    assert resp.status_code == 400
+    resp = await client.post(url, json={"content": "x", "send_at": send_at(days=400)})
+    assert resp.status_code == 400
+    # Naive times are ambiguous
+    resp = await client.post(
+        url, json={"content": "x", "send_at": "2030-01-01T00:00:00"}
+    )
+    assert resp.status_code == 422
+
+    resp = await client.post(
+        f"/api/v1/chats/{uuid.uuid4()}/messages/scheduled",
+        json={"content": "x", "send_at": send_at(seconds=5)},
+    )
+    assert resp.status_code == 403
@@ -0,0 +1,168 @@
+import uuid
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud
+from app.events import encode_event
+from app.models import ChatType
+from app.services.search_indexer import SearchIndexer
+from app.settings import get_settings
+
+
+@pytest.fixture
+def indexer(db_session: AsyncSession) -> SearchIndexer:
+    @asynccontextmanager
+    async def session_factory():
+        yield db_session
+
+    return SearchIndexer(get_settings(), session_factory)
+
+
+def created_record(row) -> SimpleNamespace:
+    event = {
+        "id": str(row.id),
+        "chat_id": str(row.chat_id),
+        "seq": row.seq,
+        "sender_id": str(row.sender_id),
+        "content": row.content,
+        "created_at": row.created_at.isoformat(),
+    }
+    return SimpleNamespace(value=encode_event("message_created", event))
+
+
+def record(event_type: str, **data) -> SimpleNamespace:
+    return SimpleNamespace(value=encode_event(event_type, data))
+
+
+async def chat_with_messages(
+    db: AsyncSession, owner, contents, chat_type=ChatType.GROUP
+):
+    chat = await crud.create_group_or_channel(db, owner, chat_type, "Search", {})
+    chat_id = chat.id
+    rows = await crud.create_messages(db, chat_id, [(owner, c) for c in contents])
+    await db.commit()
+    return chat_id, rows
+
+
+@pytest.mark.asyncio
+async def test_indexer_applies_created_edited_and_deleted(
+    db_session: AsyncSession, indexer
+):
+    owner = uuid.uuid4()
+    chat_id, rows = await chat_with_messages(
+        db_session, owner, ["deploy at noon", "lunch plans", "deploy failed"]
+    )
+    assert await indexer.handle([created_record(row) for row in rows]) == 3
+    hits = await crud.search_messages(db_session, owner, "deploy")
+    assert [hit.seq for hit in hits] == [3, 1]
+
+    await crud.update_message(db_session, chat_id, 2, "deploy lunch")
+    await crud.delete_message(db_session, chat_id, 3)
+    await db_session.commit()
+    chat = str(chat_id)
+    assert (
+        await indexer.handle(
+            [
+                record("message_updated", chat_id=chat, seq=2, content="deploy lunch"),
+                record("message_deleted", chat_id=chat, seq=3),
+                record("chat_updated", chat_id=chat),
+            ]
+        )
+        == 2
+    )
+    hits = await crud.search_messages(db_session, owner, "deploy")
+    assert {hit.seq for hit in hits} == {1, 2}
+    assert "<mark>deploy</mark>" in hits[0].highlight
+
+    # Replaying a batch after a failed offset commit changes nothing
+    await indexer.handle([created_record(rows[0])])
+    assert len(await crud.search_messages(db_session, owner, "deploy")) == 2
+
+
+@pytest.mark.asyncio
+async def test_edit_in_same_batch_indexes_latest_content(
+    db_session: AsyncSession, indexer
+):
+    owner = uuid.uuid4()
+    chat_id, rows = await chat_with_messages(db_session, owner, ["first draft"])
+    edit = record("message_updated", chat_id=str(chat_id), seq=1, content="final")
+    await crud.update_message(db_session, chat_id, 1, "final")
+    await db_session.commit()
+
+    await indexer.handle([created_record(rows[0]), edit])
+    assert await crud.search_messages(db_session, owner, "draft") == []
+    assert len(await crud.search_messages(db_session, owner, "final")) == 1
+
+
+@pytest.mark.asyncio
+async def test_search_is_limited_to_own_chats_and_pages(
+    client, current_user_id, db_session: AsyncSession, indexer
+):
+    mine, rows = await chat_with_messages(
+        db_session, current_user_id, [f"release {i}" for i in range(3)]
+    )
+    other, other_rows = await chat_with_messages(
+        db_session, uuid.uuid4(), ["release notes"], ChatType.CHANNEL
+    )
+    await indexer.handle([created_record(row) for row in rows + other_rows])
+
+    resp = await client.get(
+        "/api/v1/messages/search", params={"query": "rel", "limit": 2}
+    )
+    assert resp.status_code == 200
+    page = resp.json()
+    assert [hit["seq"] for hit in page["items"]] == [3, 2]
+    assert {hit["chat_id"] for hit in page["items"]} == {str(mine)}
+    assert page["items"][0]["highlight"] == "<mark>release</mark> 2"
+
+    resp = await client.get(
+        "/api/v1/messages/search",
+        params={"query": "rel", "limit": 2, "cursor": page["next_cursor"]},
+    )
+    page = resp.json()
+    assert [hit["seq"] for hit in page["items"]] == [1]
+    assert page["next_cursor"] is None
+
+    resp = await client.get(
+        "/api/v1/messages/search", params={"query": "release", "chat_id": str(other)}
+    )
+    assert resp.json()["items"] == []
+    resp = await client.get(
+        "/api/v1/messages/search", params={"query": "release", "cursor": "bad"}
+    )
+    assert resp.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_search_escapes_content_and_pages_past_deleted_hits(
+    client, current_user_id, db_session: AsyncSession, indexer
+):
+    _, rows = await chat_with_messages(
+        db_session,
+        current_user_id,
+        ['release <img src=x onerror="alert(1)"> & co', "release 2", "release 3"],
+    )
+    await indexer.handle([created_record(row) for row in rows])
+    # Deleted, but the indexer has not seen the event yet
+    await crud.delete_message(db_session, rows[2].chat_id, 3)
+    await db_session.commit()
+
+    resp = await client.get(
+        "/api/v1/messages/search", params={"query": "release", "limit": 2}
+    )
+    page = resp.json()
+    assert [hit["seq"] for hit in page["items"]] == [2]
+    assert page["next_cursor"] is not None
+
+    resp = await client.get(
+        "/api/v1/messages/search",
+        params={"query": "release", "limit": 2, "cursor": page["next_cursor"]},
+    )
+    page = resp.json()
+    assert [hit["seq"] for hit in page["items"]] == [1]
+    assert page["items"][0]["highlight"] == (
+        "<mark>release</mark> &lt;img src=x onerror=&quot;alert(1)&quot;&gt; &amp; co"
+    )
@@ -0,0 +1,235 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud
+from app.dependencies import get_current_user_data
+from app.models import ChatType, OutboxEvent
+from app.pagination import encode_cursor
+from app.schemas import TokenData
+from app.services.partitions import ensure_message_partitions, month_start
+
+
+@pytest.mark.asyncio
+async def test_create_messages_allocates_consecutive_seqs(db_session: AsyncSession):
+    user_id = uuid.uuid4()
+    chat = await crud.create_group_or_channel(
+        db_session, user_id, ChatType.GROUP, "History", {}
+    )
+
+    first = await crud.create_messages(
+        db_session, chat.id, [(user_id, "a"), (user_id, "b")]
+    )
+    second = await crud.create_messages(db_session, chat.id, [(user_id, "c")])
+    await db_session.commit()
+
+    assert [m.seq for m in first + second] == [1, 2, 3]
+    events = (
+        await db_session.scalars(
+            select(OutboxEvent).where(OutboxEvent.event_type == "message_created")
+        )
+    ).all()
+    assert [e.payload["seq"] for e in events] == [1, 2, 3]
+
+    assert await crud.create_messages(db_session, uuid.uuid4(), [(user_id, "x")]) == []
+
+
+@pytest.mark.asyncio
+async def test_get_messages_pages_both_directions(db_session: AsyncSession):
+    user_id = uuid.uuid4()
+    chat = await crud.create_group_or_channel(
+        db_session, user_id, ChatType.GROUP, "Pages", {}
+    )
+    await crud.create_messages(
+        db_session, chat.id, [(user_id, f"m{i}") for i in range(1, 11)]
+    )
+
+    latest = await crud.get_messages(db_session, chat.id, 3)
+    assert [m.seq for m in latest] == [8, 9, 10]
+    older = await crud.get_messages(db_session, chat.id, 3, before=8)
+    assert [m.seq for m in older] == [5, 6, 7]
+    newer = await crud.get_messages(db_session, chat.id, 3, after=5)
+    assert [m.seq for m in newer] == [6, 7, 8]
+
+
+@pytest.mark.asyncio
+async def test_ensure_message_partitions(db_session: AsyncSession):
+    connection = await db_session.connection()
+    names = await ensure_message_partitions(connection, 1, now=datetime(2031, 12, 15))
+    assert names == ["messages_2031_12", "messages_2032_01"]
+    # Idempotent
+    await ensure_message_partitions(connection, 1, now=datetime(2031, 12, 15))
+
+    user_id = uuid.uuid4()
+    chat = await crud.create_group_or_channel(
+        db_session, user_id, ChatType.GROUP, "Partitioned", {}
+    )
+    await db_session.execute(
+        text(
+            "INSERT INTO messages (chat_id, seq, created_at, id, sender_id, content) "
+            "VALUES (:chat_id, 1, '2032-01-02', :id, :sender_id, 'hi')"
+        ),
+        {"chat_id": chat.id, "id": uuid.uuid4(), "sender_id": user_id},
+    )
+    partition = await db_session.scalar(
+        text("SELECT tableoid::regclass::text FROM messages WHERE chat_id = :chat_id"),
+        {"chat_id": chat.id},
+    )
+    assert partition == "messages_2032_01"
+
+
+def test_month_start_wraps_year():
+    assert month_start(datetime(2030, 11, 30).date(), 2) == datetime(2031, 1, 1).date()
+
+
+@pytest.mark.asyncio
+async def test_send_and_read_history(client):
+    resp = await client.post("/api/v1/chats/group", json={"name": "Talk"})
+    chat_id = resp.json()["id"]
+
+    for i in range(5):
+        sent = await client.post(
+            f"/api/v1/chats/{chat_id}/messages", json={"content": f"hello {i}"}
+        )
+        assert sent.status_code == 201
+        assert sent.json()["seq"] == i + 1
+
+    page = (
+        await client.get(f"/api/v1/chats/{chat_id}/messages", params={"limit": 2})
+    ).json()
+    assert [m["seq"] for m in page["items"]] == [4, 5]
+    assert page["has_more"] is True
+
+    page = (
+        await client.get(
+            f"/api/v1/chats/{chat_id}/messages", params={"limit": 3, "before": 4}
+        )
+    ).json()
+    assert [m["seq"] for m in page["items"]] == [1, 2, 3]
+    assert page["has_more"] is False
+
+    page = (
+        await client.get(
+            f"/api/v1/chats/{chat_id}/messages", params={"limit": 2, "after": 2}
+        )
+    ).json()
+    assert [m["seq"] for m in page["items"]] == [3, 4]
+    assert page["has_more"] is True
+
+    both = await client.get(
+        f"/api/v1/chats/{chat_id}/messages", params={"before": 3, "after": 1}
+    )
+    assert both.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_history_cursor_follows_both_directions(client):
+    resp = await client.post("/api/v1/chats/group", json={"name": "Cursors"})
+    url = f"/api/v1/chats/{resp.json()['id']}/messages"
+    for i in range(5):
+        await client.post(url, json={"content": f"hello {i}"})
+
+    page = (await client.get(url, params={"limit": 2})).json()
+    seqs = [m["seq"] for m in page["items"]]
+    while page["next_cursor"]:
+        page = (
+            await client.get(url, params={"limit": 2, "cursor": page["next_cursor"]})
+        ).json()
+        seqs = [m["seq"] for m in page["items"]] + seqs
+    assert seqs == [1, 2, 3, 4, 5]
+    assert page["has_more"] is False
+
+    page = (await client.get(url, params={"limit": 3, "after": 0})).json()
+    page = (
+        await client.get(url, params={"limit": 3, "cursor": page["next_cursor"]})
+    ).json()
+    assert [m["seq"] for m in page["items"]] == [4, 5]
+
+    both = await client.get(url, params={"before": 3, "cursor": page["next_cursor"]})
+    assert both.status_code == 400
+    bad = await client.get(url, params={"cursor": encode_cursor("up", 1, "x")})
+    assert bad.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_history_bounds_by_created_at(db_session: AsyncSession):
+    owner = uuid.uuid4()
+    chat = await crud.create_group_or_channel(
+        db_session, owner, ChatType.GROUP, "Bounds", {}
+    )
+    rows = await crud.create_messages(db_session, chat.id, [(owner, "a"), (owner, "b")])
+    created_at = rows[0].created_at
+
+    assert len(await crud.get_messages(db_session, chat.id, until=created_at)) == 2
+    day = timedelta(days=1)
+    assert await crud.get_messages(db_session, chat.id, until=created_at - day) == []
+    assert await crud.get_messages(db_session, chat.id, since=created_at + day) == []
+
+
+@pytest.mark.asyncio
+async def test_message_access_checks(app, client, current_user_id):
+    channel = await client.post("/api/v1/chats/channel", json={"name": "Announcements"})
+    channel_id = channel.json()["id"]
+    member_id = uuid.uuid4()
+    await client.post(
+        f"/api/v1/chats/{channel_id}/participants", json={"user_id": str(member_id)}
+    )
+
+    app.dependency_overrides[get_current_user_data] = lambda: TokenData(
+        sub=member_id, scopes=["chat.message.send", "chat.message.view_history"]
+    )
+    resp = await client.post(
+        f"/api/v1/chats/{channel_id}/messages", json={"content": "hi"}
+    )
+    assert resp.status_code == 403
+    resp = await client.get(f"/api/v1/chats/{channel_id}/messages")
+    assert resp.status_code == 200
+
+    app.dependency_overrides[get_current_user_data] = lambda: TokenData(
+        sub=uuid.uuid4(), scopes=["chat.message.send", "chat.message.view_history"]
+    )
+    resp = await client.get(f"/api/v1/chats/{channel_id}/messages")
+    assert resp.status_code == 403
+
+    app.dependency_overrides[get_current_user_data] = lambda: TokenData(
+        sub=current_user_id, scopes=[]
+    )
+    resp = await client.post(
+        f"/api/v1/chats/{channel_id}/messages", json={"content": "hi"}
+    )
+    assert resp.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_inbox_preview_follows_last_message(client, current_user_id):
+    resp = await client.post("/api/v1/chats/group", json={"name": "Preview"})
+    chat_id = resp.json()["id"]
+    await client.post(f"/api/v1/chats/{chat_id}/messages", json={"content": "first"})
+    await client.post(
+        f"/api/v1/chats/{chat_id}/messages", json={"content": "second " * 40}
+    )
+
+    chat = (await client.get("/api/v1/chats")).json()["items"][0]
+    assert chat["last_message_preview"] == ("second " * 40)[:120]
+    assert chat["last_message_sender_id"] == str(current_user_id)
+    assert chat["last_message_at"] is not None
+
+    await client.patch(f"/api/v1/chats/{chat_id}/messages/1", json={"content": "old"})
+    chat = (await client.get("/api/v1/chats")).json()["items"][0]
+    assert chat["last_message_preview"].startswith("second")
+
+    await client.patch(f"/api/v1/chats/{chat_id}/messages/2", json={"content": "2nd"})
+    chat = (await client.get("/api/v1/chats")).json()["items"][0]
+    assert chat["last_message_preview"] == "2nd"
+
+    await client.delete(f"/api/v1/chats/{chat_id}/messages/2")
+    chat = (await client.get("/api/v1/chats")).json()["items"][0]
+    assert chat["last_message_preview"] == "old"
+
+    await client.delete(f"/api/v1/chats/{chat_id}/messages/1")
+    chat = (await client.get("/api/v1/chats")).json()["items"][0]
+    assert chat["last_message_preview"] is None
+    assert chat["last_message_at"] is None
@@ -0,0 +1,48 @@
+import uuid
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud
+from app.models import ChatType, OutboxEvent
+from app.services.outbox_relay import OutboxRelay
+from app.settings import get_settings
+
+
+@pytest.mark.asyncio
+async def test_outbox_event_committed_with_chat(db_session: AsyncSession):
+    chat = await crud.create_group_or_channel(
+        db_session, uuid.uuid4(), ChatType.GROUP, "Outboxed", {}
+    )
+
+    events = (await db_session.execute(select(OutboxEvent))).scalars().all()
+    assert len(events) == 1
+    assert events[0].event_type == "chat_created"
+    assert events[0].payload == {"chat_id": str(chat.id), "type": "GROUP"}
+
+
+@pytest.mark.asyncio
+async def test_relay_publishes_in_order_and_deletes(
+    db_session: AsyncSession, mock_kafka_producer
+):
+    for i in range(5):
+        crud.add_outbox_event(db_session, "chat_updated", {"n": i})
+    await db_session.commit()
+
+    settings = get_settings().model_copy(
+        update={"outbox_batch_size": 3, "outbox_delete_chunk": 2}
+    )
+    relay = OutboxRelay(mock_kafka_producer, settings)
+
+    assert await relay.relay_once(db_session) == 3
+    assert await relay.relay_once(db_session) == 2
+    assert await relay.relay_once(db_session) == 0
+
+    published = [
+        payload["n"]
+        for call in mock_kafka_producer.publish_batch.await_args_list
+        for _, payload in call.args[0]
+    ]
+    assert published == [0, 1, 2, 3, 4]
+    assert await db_session.scalar(select(func.count(OutboxEvent.id))) == 0
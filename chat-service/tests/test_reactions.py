@@ -0,0 +1,86 @@
+import uuid
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud
+from app.models import OutboxEvent
+from app.services.message_cache import REACTIONS_SCRIPT
+from app.settings import get_settings
+
+
+@pytest.mark.asyncio
+async def test_reaction_counters_and_my_reactions(
+    client, db_session: AsyncSession, mock_redis_client
+):
+    resp = await client.post("/api/v1/chats/group", json={"name": "Reacts"})
+    chat_id = resp.json()["id"]
+    for text in ("one", "two"):
+        await client.post(f"/api/v1/chats/{chat_id}/messages", json={"content": text})
+    url = f"/api/v1/chats/{chat_id}/messages/1/reactions"
+
+    resp = await client.put(f"{url}/👍")
+    assert resp.json()["reactions"] == {"👍": 1}
+    # The cached message is updated in place, not dropped with the whole tail
+    script, _, key, seq, version, counts, _ = mock_redis_client.eval.call_args.args
+    assert (script, key, seq) == (REACTIONS_SCRIPT, f"messages:tail:{chat_id}", 1)
+    assert counts == '{"\\ud83d\\udc4d":1}'
+
+    # Reacting twice with the same emoji changes nothing
+    mock_redis_client.eval.reset_mock()
+    resp = await client.put(f"{url}/👍")
+    assert resp.json()["reactions"] == {"👍": 1}
+    mock_redis_client.eval.assert_not_awaited()
+
+    other = uuid.uuid4()
+    await crud.add_reaction(db_session, uuid.UUID(chat_id), 1, other, "👍")
+    await crud.add_reaction(db_session, uuid.UUID(chat_id), 1, other, "🎉")
+
+    items = (await client.get(f"/api/v1/chats/{chat_id}/messages")).json()["items"]
+    assert items[0]["reactions"] == {"👍": 2, "🎉": 1}
+    assert items[0]["my_reactions"] == ["👍"]
+    assert items[1]["reactions"] == {} and items[1]["my_reactions"] == []
+
+    resp = await client.delete(f"{url}/👍")
+    assert resp.json()["reactions"] == {"👍": 1, "🎉": 1}
+    await crud.remove_reaction(db_session, uuid.UUID(chat_id), 1, other, "🎉")
+    assert await crud.get_reactions(db_session, uuid.UUID(chat_id), 1) == {"👍": 1}
+
+    events = (await db_session.execute(select(OutboxEvent))).scalars().all()
+    updates = [e.payload for e in events if e.event_type == "reactions_updated"]
+    assert updates[-1] == {"chat_id": chat_id, "seq": 1, "reactions": {"👍": 1}}
+
+
+@pytest.mark.asyncio
+async def test_reactions_need_message_and_membership(client):
+    resp = await client.post("/api/v1/chats/group", json={"name": "Empty"})
+    chat_id = resp.json()["id"]
+
+    resp = await client.put(f"/api/v1/chats/{chat_id}/messages/7/reactions/👍")
+    assert resp.status_code == 404
+    resp = await client.put(f"/api/v1/chats/{uuid.uuid4()}/messages/1/reactions/👍")
+    assert resp.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_reaction_emojis_are_capped(client, app):
+    settings = get_settings().model_copy(
+        update={"reactions_per_message_max": 3, "reactions_per_user_max": 2}
+    )
+    app.dependency_overrides[get_settings] = lambda: settings
+    resp = await client.post("/api/v1/chats/group", json={"name": "Capped"})
+    chat_id = resp.json()["id"]
+    await client.post(f"/api/v1/chats/{chat_id}/messages", json={"content": "hi"})
+    url = f"/api/v1/chats/{chat_id}/messages/1/reactions"
+
+    assert (await client.put(f"{url}/a")).status_code == 200
+    assert (await client.put(f"{url}/b")).status_code == 200
+    resp = await client.put(f"{url}/c")
+    assert resp.status_code == 409
+    assert resp.json()["error"]["code"] == "TOO_MANY_REACTIONS"
+    # Repeating one of the user's own reactions is still fine
+    assert (await client.put(f"{url}/a")).status_code == 200
+
+    await client.delete(f"{url}/b")
+    assert (await client.put(f"{url}/c")).status_code == 200
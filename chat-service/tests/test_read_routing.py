@@ -0,0 +1,95 @@
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from redis.exceptions import ConnectionError
+from sqlalchemy import text
+
+from app.database import create_engine
+from app.dependencies import get_public_read_db, get_read_db, get_write_db
+from app.metrics import metrics
+from app.services.read_routing import PrimaryPins
+from app.settings import get_settings
+
+PRIMARY, REPLICA = object(), object()
+
+
+def request_for(chat_id=None):
+    return SimpleNamespace(path_params={"chat_id": chat_id} if chat_id else {})
+
+
+@pytest.mark.asyncio
+async def test_writes_pin_user_and_chat(mock_redis_client):
+    user, chat_id = SimpleNamespace(sub=uuid.uuid4()), uuid.uuid4()
+    pins = PrimaryPins(mock_redis_client, 2.5)
+
+    db = await get_write_db(request_for(chat_id), user, pins, PRIMARY)
+    assert db is PRIMARY
+    pipeline = mock_redis_client.pipeline.return_value
+    assert [call.args[0] for call in pipeline.set.call_args_list] == [
+        f"rw:user:{user.sub}",
+        f"rw:chat:{chat_id}",
+    ]
+    assert pipeline.set.call_args.kwargs == {"px": 2500}
+
+
+@pytest.mark.asyncio
+async def test_send_message_pins_sender_and_chat(
+    client, current_user_id, mock_redis_client
+):
+    resp = await client.post("/api/v1/chats/group", json={"name": "Pinned"})
+    chat_id = resp.json()["id"]
+    pipeline = mock_redis_client.pipeline.return_value
+    pipeline.set.reset_mock()
+
+    resp = await client.post(
+        f"/api/v1/chats/{chat_id}/messages", json={"content": "hi"}
+    )
+    assert resp.status_code == 201
+    assert [call.args[0] for call in pipeline.set.call_args_list] == [
+        f"rw:user:{current_user_id}",
+        f"rw:chat:{chat_id}",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_reads_go_to_replica_unless_pinned(mock_redis_client):
+    user, chat_id = SimpleNamespace(sub=uuid.uuid4()), uuid.uuid4()
+    settings = get_settings().model_copy(
+        update={"database_read_url": "postgresql+asyncpg://replica/db"}
+    )
+    pins = PrimaryPins(mock_redis_client, 5)
+    args = (settings, pins, PRIMARY, REPLICA)
+
+    assert await get_read_db(request_for(chat_id), user, *args) is REPLICA
+    mock_redis_client.exists.assert_awaited_with(
+        f"rw:user:{user.sub}", f"rw:chat:{chat_id}"
+    )
+
+    mock_redis_client.exists.return_value = 1
+    assert await get_read_db(request_for(), user, *args) is PRIMARY
+    assert await get_public_read_db(request_for(chat_id), *args) is PRIMARY
+
+    # Cannot tell whether anyone wrote: stay on the primary
+    mock_redis_client.exists.side_effect = ConnectionError()
+    assert await get_public_read_db(request_for(chat_id), *args) is PRIMARY
+
+    # Without a replica nothing is routed and Redis is not asked
+    mock_redis_client.exists.reset_mock()
+    args = (get_settings(), pins, PRIMARY, REPLICA)
+    assert await get_read_db(request_for(chat_id), user, *args) is PRIMARY
+    mock_redis_client.exists.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_engine_reports_pool_and_query_metrics():
+    engine = create_engine(get_settings().database_url, "routing_test", 1, 0, 5.0)
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+            assert metrics.gauges["db.routing_test.checked_out"] == 1
+        assert metrics.gauges["db.routing_test.checked_out"] == 0
+        assert metrics.timings["db.routing_test.query"][0] >= 1
+        assert metrics.timings["db.routing_test.pool_wait"][0] >= 1
+    finally:
+        await engine.dispose()
@@ -0,0 +1,122 @@
+import uuid
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud
+from app.models import ChatType
+from app.services.read_state import DIRTY_KEY, ReadCursorStore, sender_cursors
+from app.settings import get_settings
+
+
+async def send(client, chat_id, count):
+    for i in range(count):
+        await client.post(f"/api/v1/chats/{chat_id}/messages", json={"content": str(i)})
+
+
+@pytest.mark.asyncio
+async def test_inbox_unread_counts_from_cursors(
+    client, current_user_id, db_session: AsyncSession, mock_redis_client
+):
+    resp = await client.post("/api/v1/chats/group", json={"name": "Unread"})
+    chat_id = uuid.UUID(resp.json()["id"])
+    await send(client, chat_id, 3)
+
+    # Nothing in Redis or Postgres: everything is unread, and Redis is refilled
+    items = (await client.get("/api/v1/chats")).json()["items"]
+    assert items[0]["last_message_seq"] == 3
+    assert items[0]["unread_count"] == 3
+    pipeline = mock_redis_client.pipeline.return_value
+    pipeline.hsetnx.assert_called_with(f"read:{current_user_id}", str(chat_id), 0)
+
+    await crud.upsert_read_states(db_session, [(current_user_id, chat_id, 2)])
+    items = (await client.get("/api/v1/chats")).json()["items"]
+    assert items[0]["unread_count"] == 1
+
+    mock_redis_client.hmget.return_value = ["3"]
+    items = (await client.get("/api/v1/chats")).json()["items"]
+    assert items[0]["unread_count"] == 0
+    mock_redis_client.hmget.assert_awaited_with(
+        f"read:{current_user_id}", [str(chat_id)]
+    )
+
+
+@pytest.mark.asyncio
+async def test_mark_read_is_clamped_to_last_message(
+    client, current_user_id, mock_redis_client
+):
+    resp = await client.post("/api/v1/chats/group", json={"name": "Read"})
+    chat_id = resp.json()["id"]
+    await send(client, chat_id, 4)
+
+    resp = await client.post(f"/api/v1/chats/{chat_id}/read", json={"seq": 99})
+    assert resp.status_code == 200
+    assert resp.json() == {"chat_id": chat_id, "last_read_seq": 4, "unread_count": 0}
+    args = mock_redis_client.eval.await_args.args
+    assert args[2:6] == (f"read:{current_user_id}", DIRTY_KEY, chat_id, 4)
+
+    resp = await client.post(f"/api/v1/chats/{uuid.uuid4()}/read", json={"seq": 1})
+    assert resp.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_deleted_messages_are_not_unread(
+    client, current_user_id, db_session: AsyncSession
+):
+    resp = await client.post("/api/v1/chats/group", json={"name": "Deleted"})
+    chat_id = uuid.UUID(resp.json()["id"])
+    await send(client, chat_id, 5)
+    await crud.upsert_read_states(db_session, [(current_user_id, chat_id, 2)])
+
+    # One deleted below the cursor, two above it
+    for seq in (1, 3, 5):
+        resp = await client.delete(f"/api/v1/chats/{chat_id}/messages/{seq}")
+        assert resp.status_code == 204
+    items = (await client.get("/api/v1/chats")).json()["items"]
+    assert items[0]["unread_count"] == 1
+
+    resp = await client.post(f"/api/v1/chats/{chat_id}/read", json={"seq": 3})
+    assert resp.json()["unread_count"] == 1
+    assert await crud.count_deleted_after(db_session, {chat_id: 0}) == {chat_id: 3}
+
+
+@pytest.mark.asyncio
+async def test_flush_writes_batch_and_never_moves_back(
+    db_session: AsyncSession, mock_redis_client
+):
+    user_id, chat_id = uuid.uuid4(), uuid.uuid4()
+    store = ReadCursorStore(mock_redis_client, get_settings())
+    pipeline = mock_redis_client.pipeline.return_value
+
+    mock_redis_client.spop = AsyncMock(return_value=[f"{user_id}:{chat_id}"])
+    pipeline.execute.return_value = ["5"]
+    assert await store.flush(db_session) == 1
+    pipeline.hget.assert_called_with(f"read:{user_id}", str(chat_id))
+
+    pipeline.execute.return_value = ["3"]
+    await store.flush(db_session)
+    assert await crud.get_read_states(db_session, user_id, [chat_id]) == {chat_id: 5}
+
+    mock_redis_client.spop = AsyncMock(return_value=[])
+    assert await store.flush(db_session) == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_requeues(db_session: AsyncSession, mock_redis_client):
+    member = f"{uuid.uuid4()}:{uuid.uuid4()}"
+    store = ReadCursorStore(mock_redis_client, get_settings())
+    mock_redis_client.spop = AsyncMock(return_value=[member])
+    mock_redis_client.sadd = AsyncMock()
+    mock_redis_client.pipeline.return_value.execute.side_effect = ConnectionError()
+
+    with pytest.raises(ConnectionError):
+        await store.flush(db_session)
+    mock_redis_client.sadd.assert_awaited_with(DIRTY_KEY, member)
+
+
+def test_sender_cursors_keep_highest_seq_per_chat():
+    user, chat = uuid.uuid4(), uuid.uuid4()
+    rows = [SimpleNamespace(sender_id=user, chat_id=chat, seq=seq) for seq in (3, 5, 4)]
+    assert sender_cursors(rows) == [(user, chat, 5)]
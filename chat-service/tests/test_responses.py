@@ -0,0 +1,32 @@
+import json
+import uuid
+
+import pytest
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud
+from app.models import ChatType
+from app.responses import RowJSONResponse
+from app.schemas import ChatPage
+
+
+@pytest.mark.asyncio
+async def test_row_response_matches_validated_response(db_session: AsyncSession):
+    user_id = uuid.uuid4()
+    for name in ("One", "Two"):
+        await crud.create_group_or_channel(
+            db_session, user_id, ChatType.GROUP, name, {}
+        )
+    rows = await crud.get_user_chats(db_session, user_id)
+    content = {
+        "items": [{**row._asdict(), "unread_count": 0} for row in rows],
+        "next_cursor": None,
+    }
+
+    adapter = TypeAdapter(ChatPage)
+    validated = adapter.dump_python(adapter.validate_python(content), mode="json")
+    assert json.loads(RowJSONResponse(content).body) == json.loads(
+        JSONResponse(validated).body
+    )
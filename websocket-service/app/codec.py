@@ -0,0 +1,31 @@
+import json
+import struct
+
+import msgpack
+
+# Must match chat-service app/events.py: magic byte, envelope version, schema id
+ENVELOPE_MAGIC = b"\xc1"
+ENVELOPE_VERSION = 1
+ENVELOPE_HEADER = struct.Struct(">BBH")
+DELIVERY_SCHEMA_ID = 100
+
+def decode_delivery(raw: bytes) -> dict:
+    """
+    Decode a message_events record into {"type", "recipients", "payload", ...}.
+
+    Binary envelopes take the fast path straight into msgpack; anything else is
+    treated as JSON: either chat-service's {"event_type", "data"} form (its
+    "json" event format) or a legacy bare record.
+    """
+    if raw[:1] != ENVELOPE_MAGIC:
+        record = json.loads(raw)
+        if isinstance(record, dict) and "event_type" in record:
+            if record["event_type"] != "delivery":
+                raise ValueError(f"Unexpected event {record['event_type']}")
+            return record.get("data") or {}
+        return record
+
+    _, version, schema_id = ENVELOPE_HEADER.unpack_from(raw)
+    if version != ENVELOPE_VERSION or schema_id != DELIVERY_SCHEMA_ID:
+        raise ValueError(f"Unsupported envelope v{version} schema {schema_id}")
+    return msgpack.unpackb(raw[ENVELOPE_HEADER.size:])
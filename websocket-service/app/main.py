@@ -3,15 +3,22 @@ import asyncio
 import jwt
 from typing import Optional
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query, Depends
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query, Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from app.settings import get_settings, Settings
 from app.manager import manager
+from app.metrics import metrics
 from app.worker import kafka_worker
 from app.logger import configure_logging
 import redis.asyncio as redis
 
 logger = logging.getLogger(__name__)
 
+# Same scope chat-service requires for its metrics
+METRICS_SCOPE = "system.metrics.monitor"
+
+bearer_scheme = HTTPBearer(auto_error=False)
+
 async def get_redis():
     settings = get_settings()
     client = redis.from_url(settings.redis_url, decode_responses=True)
@@ -39,16 +46,30 @@ def get_app():
     
     app = FastAPI(title="WebSocket Service", lifespan=lifespan)
     
-    def validate_token(token: str) -> Optional[str]:
+    def decode_token(token: str) -> Optional[dict]:
         settings = get_settings()
         try:
             # Note: We use public_key for RS256 validation as per auth-service
-            payload = jwt.decode(token, settings.public_key, algorithms=["RS256"])
-            return payload.get("sub")
+            return jwt.decode(token, settings.public_key, algorithms=["RS256"])
         except Exception as e:
             logger.debug(f"Token validation failed: {e}")
             return None
 
+    def validate_token(token: str) -> Optional[str]:
+        payload = decode_token(token)
+        return payload.get("sub") if payload else None
+
+    @app.get("/metrics")
+    async def get_metrics(
+        credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme)
+    ):
+        payload = decode_token(credentials.credentials) if credentials else None
+        if payload is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+        if METRICS_SCOPE not in (payload.get("scopes") or []):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions.")
+        return metrics.snapshot()
+
     @app.websocket("/ws")
     async def websocket_endpoint(
         websocket: WebSocket,
@@ -60,13 +81,13 @@ def get_app():
             await websocket.close(code=1008) # Policy Violation
             return
 
-        await manager.connect(user_id, websocket, redis_client)
+        connection = await manager.connect(user_id, websocket, redis_client)
         
         try:
             while True:
                 # Keep connection alive and handle incoming client signals
                 data = await websocket.receive_text()
-                # Process signals if needed
+                manager.handle_client_frame(user_id, connection, data)
         except WebSocketDisconnect:
             await manager.disconnect(user_id, websocket, redis_client)
         except Exception as e:
@@ -1,43 +1,128 @@
 import logging
 import json
-from typing import Dict, List, Set
+from typing import Dict, List, Optional
 from fastapi import WebSocket
 import redis.asyncio as redis
 
+from app.metrics import metrics
+from app.outbound import EPHEMERAL_TYPES, OutboundConnection, Priority, classify_message, focus_key
+from app.settings import get_settings
+
 logger = logging.getLogger(__name__)
 
 class ConnectionManager:
     def __init__(self):
-        # Maps user_id -> List of active WebSockets
-        self.active_connections: Dict[str, List[WebSocket]] = {}
+        # Maps user_id -> List of active connections (one per device)
+        self.active_connections: Dict[str, List[OutboundConnection]] = {}
 
-    async def connect(self, user_id: str, websocket: WebSocket, redis_client: redis.Redis):
+    async def connect(self, user_id: str, websocket: WebSocket, redis_client: redis.Redis) -> OutboundConnection:
+        settings = get_settings()
         await websocket.accept()
+
+        connection = OutboundConnection(
+            websocket,
+            weights=(
+                settings.ws_lane_weight_control,
+                settings.ws_lane_weight_interactive,
+                settings.ws_lane_weight_bulk,
+            ),
+            capacity=settings.ws_lane_capacity,
+            on_failure=lambda failed: self._remove(user_id, failed),
+        )
+        connection.start()
+
         if user_id not in self.active_connections:
             self.active_connections[user_id] = []
-        self.active_connections[user_id].append(websocket)
-        
+        self.active_connections[user_id].append(connection)
+
         # Set Presence in Redis
         await redis_client.set(f"presence:{user_id}", "online", ex=300) # 5 min TTL
         logger.info(f"User {user_id} connected. Active devices: {len(self.active_connections[user_id])}")
+        return connection
+
+    def _remove(self, user_id: str, connection: OutboundConnection):
+        """Stop routing frames to a connection whose writer died; disconnect clears presence."""
+        connections = self.active_connections.get(user_id, [])
+        if connection in connections:
+            connections.remove(connection)
+            metrics.inc("ws.writer_failures")
+            logger.warning(f"Dropped connection of user {user_id} after a failed write")
 
     async def disconnect(self, user_id: str, websocket: WebSocket, redis_client: redis.Redis):
         if user_id in self.active_connections:
-            if websocket in self.active_connections[user_id]:
-                self.active_connections[user_id].remove(websocket)
-            if not self.active_connections[user_id]:
+            connections = self.active_connections[user_id]
+            for connection in [c for c in connections if c.websocket is websocket]:
+                connections.remove(connection)
+                await connection.close()
+            if not connections:
                 del self.active_connections[user_id]
                 # Remove Presence
                 await redis_client.delete(f"presence:{user_id}")
         logger.info(f"User {user_id} disconnected.")
 
-    async def send_personal_message(self, user_id: str, message: dict):
-        """Send a message to all devices of a specific user."""
-        if user_id in self.active_connections:
-            for connection in self.active_connections[user_id]:
+    async def send_personal_message(self, user_id: str, message: dict, priority: Optional[Priority] = None):
+        """Queue a message on the matching lane of every device of a specific user."""
+        if priority is None:
+            priority = classify_message(message)
+
+        # Ephemeral frames only go to devices that have their chat or user in
+        # focus; one without a scope could not be filtered and is dropped
+        message_type = message.get("type")
+        ephemeral = message_type in EPHEMERAL_TYPES
+        key = focus_key(message) if ephemeral else None
+        if ephemeral and key is None:
+            metrics.inc(f"ws.frames_unscoped.{message_type}")
+            return
+
+        for connection in list(self.active_connections.get(user_id, [])):
+            if ephemeral and not connection.is_focused(message_type, key):
+                metrics.inc(f"ws.frames_suppressed.{message_type}")
+                continue
+            dropped = connection.dropped
+            if not connection.enqueue(message, priority):
+                logger.warning(f"Closing slow connection of user {user_id}: {priority.name} lane is full")
                 try:
-                    await connection.send_json(message)
+                    await connection.websocket.close(code=1013) # Try Again Later
                 except Exception as e:
-                    logger.error(f"Error sending to user {user_id}: {e}")
+                    logger.error(f"Error closing connection of user {user_id}: {e}")
+                continue
+            metrics.inc("ws.frames_queued")
+            if connection.dropped > dropped:
+                metrics.inc("ws.frames_dropped")
+
+    def handle_client_frame(self, user_id: str, connection: OutboundConnection, raw: str):
+        """
+        Process a signal sent by the client.
+
+        Supported: {"action": "focus", "chat_ids": [...], "user_ids": [...]}
+        replaces the chats the connection wants typing events for and the users
+        it wants presence events for.
+        """
+        try:
+            frame = json.loads(raw)
+        except ValueError:
+            frame = None
+        if not isinstance(frame, dict):
+            connection.enqueue({"type": "error", "data": {"detail": "Malformed frame"}}, Priority.CONTROL)
+            return
+
+        action = frame.get("action")
+        if action == "focus":
+            settings = get_settings()
+            chat_ids = frame.get("chat_ids") or []
+            if not isinstance(chat_ids, list):
+                chat_ids = []
+            user_ids = frame.get("user_ids") or []
+            if not isinstance(user_ids, list):
+                user_ids = []
+            count = connection.set_focus(chat_ids, settings.ws_focus_limit)
+            peers = connection.set_peers(user_ids, settings.ws_peer_focus_limit)
+            logger.debug(f"User {user_id} focused {count} chats and {peers} peers")
+            connection.enqueue(
+                {"type": "ack", "data": {"action": action, "focused": count, "peers": peers}},
+                Priority.CONTROL,
+            )
+        else:
+            connection.enqueue({"type": "error", "data": {"detail": f"Unknown action {action}"}}, Priority.CONTROL)
 
 manager = ConnectionManager()
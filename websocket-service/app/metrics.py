@@ -0,0 +1,18 @@
+from collections import defaultdict
+from typing import Dict
+
+
+class Metrics:
+    """In-process counters exposed on /metrics."""
+
+    def __init__(self):
+        self.counters: Dict[str, int] = defaultdict(int)
+
+    def inc(self, name: str, value: int = 1):
+        self.counters[name] += value
+
+    def snapshot(self) -> dict:
+        return {"counters": dict(self.counters)}
+
+
+metrics = Metrics()
@@ -0,0 +1,189 @@
+import asyncio
+import enum
+import logging
+import uuid
+from collections import deque
+from typing import Callable, Deque, Iterable, List, Optional, Sequence, Set
+
+from fastapi import WebSocket
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(enum.IntEnum):
+    CONTROL = 0
+    INTERACTIVE = 1
+    BULK = 2
+
+
+# Security and membership relevant frames must never queue behind chat traffic
+CONTROL_TYPES = {
+    "ack",
+    "error",
+    "session_revoked",
+    "participant_added",
+    "participants_added",
+    "participant_removed",
+    "participants_removed",
+    "participant_left",
+    "role_updated",
+    "chat_deleted",
+}
+
+BULK_TYPES = {"channel_post", "typing", "presence"}
+
+# Only delivered to connections that have the frame's scope in focus: typing
+# is scoped by the chat it happens in, presence by the user it is about
+EPHEMERAL_TYPES = {"typing": "chat_id", "presence": "user_id"}
+
+
+def classify_message(message: dict) -> Priority:
+    """Pick the outbound lane for a frame based on its type and chat kind."""
+    message_type = message.get("type")
+    if message_type in CONTROL_TYPES:
+        return Priority.CONTROL
+    if message_type in BULK_TYPES:
+        return Priority.BULK
+
+    data = message.get("data")
+    if isinstance(data, dict) and data.get("chat_type") == "CHANNEL":
+        return Priority.BULK
+    return Priority.INTERACTIVE
+
+
+def focus_key(message: dict) -> Optional[int]:
+    """Compact key of the chat or user an ephemeral frame is scoped to, None if unscoped."""
+    field = EPHEMERAL_TYPES.get(message.get("type"))
+    data = message.get("data")
+    if field is None or not isinstance(data, dict) or not data.get(field):
+        return None
+    try:
+        return uuid.UUID(str(data[field])).int
+    except ValueError:
+        return None
+
+
+def _uuid_keys(values: Iterable, limit: int) -> Set[int]:
+    keys: Set[int] = set()
+    for value in values:
+        if len(keys) >= limit:
+            break
+        try:
+            keys.add(uuid.UUID(str(value)).int)
+        except ValueError:
+            continue
+    return keys
+
+
+def parse_priority(value: Optional[str]) -> Optional[Priority]:
+    if not value:
+        return None
+    try:
+        return Priority[value.upper()]
+    except KeyError:
+        return None
+
+
+class OutboundConnection:
+    """
+    A single client socket with one queue per priority lane.
+
+    Frames are written by a dedicated task that drains the lanes with weighted
+    round-robin: every pick starts from the control lane, and each lane may send
+    up to its weight of frames before lower lanes get their turn. If a write
+    fails the task closes the socket and calls `on_failure`, so the owner can
+    stop routing frames to it.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        weights: Sequence[int],
+        capacity: int,
+        on_failure: Optional[Callable[["OutboundConnection"], None]] = None,
+    ):
+        self.websocket = websocket
+        self.on_failure = on_failure
+        self.dropped = 0
+        # Chats the client has open and users it shows presence for, stored
+        # as 128-bit ints instead of strings
+        self.focus: Set[int] = set()
+        self.peers: Set[int] = set()
+        self._weights = list(weights)
+        self._credits = list(weights)
+        self._capacity = capacity
+        self._lanes: List[Deque[dict]] = [deque() for _ in Priority]
+        self._wakeup = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._writer = asyncio.create_task(self._drain())
+
+    async def close(self):
+        if self._writer:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+            self._writer = None
+
+    def enqueue(self, message: dict, priority: Priority) -> bool:
+        """Queue a frame. Returns False if the client is too slow to keep up."""
+        lane = self._lanes[priority]
+        if len(lane) >= self._capacity:
+            if priority != Priority.BULK:
+                return False
+            # Bulk traffic is lossy: keep the newest frames
+            lane.popleft()
+            self.dropped += 1
+        lane.append(message)
+        self._wakeup.set()
+        return True
+
+    def set_focus(self, chat_ids: Iterable[str], limit: int) -> int:
+        self.focus = _uuid_keys(chat_ids, limit)
+        return len(self.focus)
+
+    def set_peers(self, user_ids: Iterable[str], limit: int) -> int:
+        self.peers = _uuid_keys(user_ids, limit)
+        return len(self.peers)
+
+    def is_focused(self, message_type: str, key: int) -> bool:
+        return key in (self.peers if message_type == "presence" else self.focus)
+
+    def pending(self) -> int:
+        return sum(len(lane) for lane in self._lanes)
+
+    def _next_message(self) -> Optional[dict]:
+        for _ in range(2):
+            for priority in Priority:
+                lane = self._lanes[priority]
+                if lane and self._credits[priority] > 0:
+                    self._credits[priority] -= 1
+                    return lane.popleft()
+            # Every non-empty lane spent its share, start a new round
+            self._credits = list(self._weights)
+        return None
+
+    async def _drain(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while (message := self._next_message()) is not None:
+                try:
+                    await self.websocket.send_json(message)
+                except Exception as e:
+                    logger.error(f"Error writing to websocket: {e}")
+                    await self._fail()
+                    return
+
+    async def _fail(self):
+        for lane in self._lanes:
+            lane.clear()
+        if self.on_failure:
+            self.on_failure(self)
+        try:
+            await self.websocket.close(code=1011) # Internal Error
+        except Exception as e:
+            logger.debug(f"Error closing failed websocket: {e}")
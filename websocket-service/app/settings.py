@@ -15,6 +15,17 @@ class Settings(BaseSettings):
     redis_url: str = "redis://localhost:6379"
     kafka_bootstrap_servers: str = "localhost:9092"
     kafka_message_topic: str = "message_events"
+
+    # Outbound lanes (control, interactive, bulk)
+    ws_lane_weight_control: int = 8
+    ws_lane_weight_interactive: int = 4
+    ws_lane_weight_bulk: int = 1
+    ws_lane_capacity: int = 1024
+
+    # Max chats a connection may declare as focused
+    ws_focus_limit: int = 32
+    # Max users a connection may follow presence of, e.g. a member list on screen
+    ws_peer_focus_limit: int = 256
     
     # Security
     public_key: str
@@ -1,9 +1,10 @@
-import json
 import logging
 import asyncio
 from aiokafka import AIOKafkaConsumer
+from app.codec import decode_delivery
 from app.settings import get_settings
 from app.manager import manager
+from app.outbound import parse_priority
 
 logger = logging.getLogger(__name__)
 
@@ -22,17 +23,19 @@ async def kafka_worker():
     try:
         async for msg in consumer:
             try:
-                data = json.loads(msg.value.decode("utf-8"))
+                data = decode_delivery(msg.value)
                 # Expected payload: {"type": "new_message", "recipients": ["uuid1", "uuid2"], "payload": {...}}
+                # Optional "priority" ("control" | "interactive" | "bulk") overrides lane selection
                 recipients = data.get("recipients", [])
                 message_payload = {
                     "type": data.get("type", "message"),
                     "data": data.get("payload")
                 }
+                priority = parse_priority(data.get("priority"))
                 
                 # Push to all local recipients
                 for user_id in recipients:
-                    await manager.send_personal_message(user_id, message_payload)
+                    await manager.send_personal_message(user_id, message_payload, priority)
                     
             except Exception as e:
                 logger.error(f"Worker error: {e}")
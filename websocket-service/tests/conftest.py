@@ -4,7 +4,8 @@ import jwt
 import os
 from datetime import datetime, timezone, timedelta
 from unittest.mock import AsyncMock, MagicMock, patch
-from cryptography.hazmat.primitives import rsa, serialization
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
 from fastapi.testclient import TestClient
 
 # Mock environment before imports
@@ -40,12 +41,14 @@ def mock_settings(test_rsa_keys):
 
 @pytest.fixture
 def jwt_token_factory(test_rsa_keys):
-    def _factory(user_id: str):
+    def _factory(user_id: str, scopes=None):
         payload = {
             "sub": user_id,
             "iat": datetime.now(timezone.utc),
             "exp": datetime.now(timezone.utc) + timedelta(minutes=5)
         }
+        if scopes is not None:
+            payload["scopes"] = scopes
         return jwt.encode(payload, test_rsa_keys["private"], algorithm="RS256")
     return _factory
 
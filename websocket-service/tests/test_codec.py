@@ -0,0 +1,19 @@
+import json
+import struct
+import msgpack
+from app.codec import decode_delivery
+
+def test_decode_binary_envelope():
+    record = {"type": "new_message", "recipients": ["u1", "u2"], "payload": {"text": "hi"}}
+    raw = struct.pack(">BBH", 0xC1, 1, 100) + msgpack.packb(record)
+    assert decode_delivery(raw) == record
+
+def test_decode_legacy_json():
+    record = {"type": "new_message", "recipients": ["u1"], "payload": None}
+    assert decode_delivery(json.dumps(record).encode("utf-8")) == record
+
+def test_decode_json_event_format():
+    # chat-service with kafka_event_format = "json"
+    record = {"type": "message_created", "recipients": ["u1"], "payload": {"seq": 1}}
+    raw = json.dumps({"event_type": "delivery", "data": record}).encode("utf-8")
+    assert decode_delivery(raw) == record
@@ -0,0 +1,102 @@
+import asyncio
+import pytest
+from app.manager import ConnectionManager
+from app.outbound import OutboundConnection, Priority, classify_message
+
+class RecordingWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_json(self, message: dict):
+        self.sent.append(message)
+        await asyncio.sleep(0)
+
+def test_classify_message():
+    assert classify_message({"type": "session_revoked"}) == Priority.CONTROL
+    assert classify_message({"type": "participant_removed"}) == Priority.CONTROL
+    assert classify_message({"type": "participants_removed"}) == Priority.CONTROL
+    assert classify_message({"type": "typing"}) == Priority.BULK
+    assert classify_message({"type": "new_message", "data": {"chat_type": "CHANNEL"}}) == Priority.BULK
+    assert classify_message({"type": "new_message", "data": {"chat_type": "DM"}}) == Priority.INTERACTIVE
+
+@pytest.mark.asyncio
+async def test_control_frame_overtakes_channel_burst():
+    websocket = RecordingWebSocket()
+    connection = OutboundConnection(websocket, weights=(8, 4, 1), capacity=1024)
+    connection.start()
+
+    for i in range(100):
+        connection.enqueue({"type": "channel_post", "n": i}, Priority.BULK)
+    connection.enqueue({"type": "session_revoked"}, Priority.CONTROL)
+    connection.enqueue({"type": "new_message", "n": "dm"}, Priority.INTERACTIVE)
+
+    while connection.pending():
+        await asyncio.sleep(0)
+    await connection.close()
+
+    assert len(websocket.sent) == 102
+    assert websocket.sent.index({"type": "session_revoked"}) < 3
+    assert websocket.sent.index({"type": "new_message", "n": "dm"}) < 3
+
+@pytest.mark.asyncio
+async def test_bulk_lane_drops_oldest_when_full():
+    websocket = RecordingWebSocket()
+    connection = OutboundConnection(websocket, weights=(8, 4, 1), capacity=2)
+
+    for i in range(5):
+        assert connection.enqueue({"type": "typing", "n": i}, Priority.BULK)
+    assert connection.dropped == 3
+
+    connection.enqueue({"type": "new_message"}, Priority.INTERACTIVE)
+    connection.enqueue({"type": "new_message"}, Priority.INTERACTIVE)
+    assert not connection.enqueue({"type": "new_message"}, Priority.INTERACTIVE)
+
+@pytest.mark.asyncio
+async def test_presence_only_queued_for_focused_peers():
+    manager = ConnectionManager()
+    connection = OutboundConnection(RecordingWebSocket(), weights=(8, 4, 1), capacity=16)
+    manager.active_connections["viewer"] = [connection]
+    peer = "5f1c8a3e-2b7d-4c1e-9a6f-0d3b2e1c4a5b"
+    assert connection.set_peers([peer, "not-a-uuid"], limit=8) == 1
+
+    await manager.send_personal_message("viewer", {"type": "presence", "data": {"user_id": peer}})
+    await manager.send_personal_message(
+        "viewer", {"type": "presence", "data": {"user_id": "0b9e7d6c-5a4f-4e3d-8c2b-1a0f9e8d7c6b"}}
+    )
+    # Unscoped ephemeral frames cannot be filtered and are dropped
+    await manager.send_personal_message("viewer", {"type": "presence", "data": {"status": "online"}})
+    # A peer in focus does not make its id match a chat for typing
+    await manager.send_personal_message("viewer", {"type": "typing", "data": {"chat_id": peer}})
+
+    assert connection.pending() == 1
+
+class BrokenWebSocket:
+    def __init__(self):
+        self.closed_with = None
+
+    async def send_json(self, message: dict):
+        raise RuntimeError("connection reset")
+
+    async def close(self, code: int = 1000):
+        self.closed_with = code
+
+@pytest.mark.asyncio
+async def test_failed_write_closes_and_unregisters_connection():
+    manager = ConnectionManager()
+    websocket = BrokenWebSocket()
+    connection = OutboundConnection(
+        websocket,
+        weights=(8, 4, 1),
+        capacity=16,
+        on_failure=lambda failed: manager._remove("viewer", failed),
+    )
+    manager.active_connections["viewer"] = [connection]
+    connection.start()
+
+    await manager.send_personal_message("viewer", {"type": "new_message"})
+    await connection._writer
+
+    assert websocket.closed_with == 1011
+    assert manager.active_connections["viewer"] == []
+    assert connection.pending() == 0
+    await connection.close()
@@ -1,6 +1,7 @@
 import pytest
 import json
 from app.manager import manager
+from app.metrics import metrics
 
 @pytest.mark.asyncio
 async def test_presence_updates_in_redis(client, jwt_token_factory, mock_redis):
@@ -27,3 +28,22 @@ async def test_message_delivery_to_active_connection(client, jwt_token_factory):
         # Receive and verify
         received_data = websocket.receive_json()
         assert received_data == test_payload
+
+@pytest.mark.asyncio
+async def test_typing_only_delivered_to_focused_connection(client, jwt_token_factory):
+    user_id = "user-focus-test"
+    token = jwt_token_factory(user_id)
+    focused_chat = "5f1c8a3e-2b7d-4c1e-9a6f-0d3b2e1c4a5b"
+    other_chat = "0b9e7d6c-5a4f-4e3d-8c2b-1a0f9e8d7c6b"
+
+    with client.websocket_connect(f"/ws?token={token}") as websocket:
+        websocket.send_text(json.dumps({"action": "focus", "chat_ids": [focused_chat]}))
+        ack = websocket.receive_json()
+        assert ack == {"type": "ack", "data": {"action": "focus", "focused": 1, "peers": 0}}
+
+        suppressed = metrics.counters["ws.frames_suppressed.typing"]
+        await manager.send_personal_message(user_id, {"type": "typing", "data": {"chat_id": other_chat}})
+        await manager.send_personal_message(user_id, {"type": "typing", "data": {"chat_id": focused_chat}})
+
+        assert websocket.receive_json() == {"type": "typing", "data": {"chat_id": focused_chat}}
+        assert metrics.counters["ws.frames_suppressed.typing"] == suppressed + 1
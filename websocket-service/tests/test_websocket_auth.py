@@ -14,4 +14,16 @@ def test_websocket_accepts_valid_token(client: TestClient, jwt_token_factory):
     token = jwt_token_factory(user_id)
     with client.websocket_connect(f"/ws?token={token}") as websocket:
         # If we reach here, connection was accepted
-        assert True 
+        assert True
+
+def test_metrics_need_the_monitoring_scope(client: TestClient, jwt_token_factory):
+    assert client.get("/metrics").status_code == 401
+
+    token = jwt_token_factory("user-123", scopes=["chat.message.send"])
+    resp = client.get("/metrics", headers={"Authorization": f"Bearer {token}"})
+    assert resp.status_code == 403
+
+    token = jwt_token_factory("monitor", scopes=["system.metrics.monitor"])
+    resp = client.get("/metrics", headers={"Authorization": f"Bearer {token}"})
+    assert resp.status_code == 200
+    assert "counters" in resp.json()